@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Integer, String, Boolean, DateTime, Float
+from sqlalchemy import create_engine, Integer, String, Boolean, DateTime, Float, Date, UniqueConstraint, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 import os
@@ -52,7 +52,7 @@ class RegionalDisparityAnalysis(Base):
     step_therapy_required = Column(String(10), nullable=True)
     missing_states = Column(String(1000), nullable=True)
     disparity_message = Column(String(500), nullable=True)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     user = relationship("User", back_populates="regional_disparity_logs")
 
@@ -71,7 +71,7 @@ class FormularyDetailAnalysis(Base):
     non_preferred_cost = Column(String(50))
     state = Column(String(100))
     county_code = Column(String(50))
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     user = relationship("User", back_populates="formulary_detail_logs")
 
@@ -83,7 +83,7 @@ class TherapeuticEquivalentLog(Base):
     input_rxcui = Column(Integer, index=True)
     input_cost = Column(Float)
     input_ingredient = Column(String(255))
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
 
     user = relationship("User", back_populates="therapeutic_equivalent_logs")
@@ -104,3 +104,37 @@ class TherapeuticEquivalentAlternative(Base):
 
     log_entry   = relationship("TherapeuticEquivalentLog", back_populates="alternatives")
 
+
+
+class AnalysisDailyRollup(Base):
+    __tablename__ = "analysis_daily_rollups"
+    __table_args__ = (
+        UniqueConstraint("analysis_type", "day", "rxcui", "user_id", name="uq_analysis_daily_rollup"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    analysis_type = Column(String(50), index=True)
+    day = Column(Date, index=True)
+    rxcui = Column(String(50), index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    request_count = Column(Integer, default=0)
+    covered_count = Column(Integer, default=0)
+
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+
+    id = Column(String(36), primary_key=True, index=True)
+    job_type = Column(String(50), index=True)
+    status = Column(String(20), default="queued", index=True)
+    progress = Column(Float, default=0.0)
+    message = Column(String(500), nullable=True)
+    params = Column(Text, nullable=True)
+    result_path = Column(String(500), nullable=True)
+    result_rows = Column(Integer, nullable=True)
+    cancel_requested = Column(Boolean, default=False)
+    owner = Column(String(100), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
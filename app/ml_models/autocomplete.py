@@ -0,0 +1,167 @@
+import re
+import threading
+from bisect import bisect_left
+
+import numpy as np
+
+from .registry import ml_models, model_version
+
+# Models whose data feeds the suggestions; the index is rebuilt when any of them is replaced.
+SOURCE_MODELS = ("drug_utilization", "therapeutic_equivalence", "formulary_analyzer", "regional_disparity")
+
+KINDS = ("drug_name", "ingredient", "rxcui")
+# Higher priority kinds are listed first among equally good matches.
+_KIND_PRIORITY = {"drug_name": 0, "ingredient": 1, "rxcui": 2}
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", str(text).strip().lower())
+
+
+def _trigrams(text: str):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class AutocompleteIndex:
+    """
+    Type-ahead over drug names, ingredients and RXCUIs.
+
+    Prefix matching uses one sorted list of keys searched with bisect. Every
+    word of a name is a key, so "glar" finds "insulin glargine". Fuzzy
+    matching scores entries by trigram overlap with the query. Counting runs
+    over per-trigram posting arrays with np.bincount, so a lookup never scans
+    the entries.
+    """
+
+    def __init__(self, entries):
+        # entries: iterable of (text, kind, value); duplicates are dropped.
+        seen = {}
+        for text, kind, value in entries:
+            seen.setdefault((normalize(text), kind), (str(text), kind, str(value)))
+        self.entries = list(seen.values())
+        names = [normalize(text) for text, _, _ in self.entries]
+        self._priority = np.array([_KIND_PRIORITY[kind] for _, kind, _ in self.entries], dtype=np.int8)
+        self._lengths = np.array([len(name) for name in names], dtype=np.int32)
+
+        keys = []
+        for i, name in enumerate(names):
+            keys.append((name, i))
+            words = name.split(" ")
+            for w in range(1, len(words)):
+                keys.append((" ".join(words[w:]), i))
+        keys.sort()
+        self._keys = [key for key, _ in keys]
+        self._key_entries = np.array([i for _, i in keys], dtype=np.int32)
+
+        postings = {}
+        trigram_counts = np.zeros(len(names), dtype=np.int32)
+        for i, (name, (_, kind, _)) in enumerate(zip(names, self.entries)):
+            if kind == "rxcui":
+                continue  # numeric IDs are only prefix-matched
+            grams = _trigrams(name)
+            trigram_counts[i] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        self._postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+        self._trigram_counts = trigram_counts
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _prefix(self, query: str, limit: int):
+        lo = bisect_left(self._keys, query)
+        hi = bisect_left(self._keys, query + "\uffff")
+        if lo == hi:
+            return np.empty(0, dtype=np.int32)
+        ids = np.unique(self._key_entries[lo:hi])
+        # Exact kind priority first, then shorter names: "metformin" before "metformin hydrochloride".
+        order = np.lexsort((self._lengths[ids], self._priority[ids]))
+        return ids[order][:limit]
+
+    def _fuzzy(self, query: str, limit: int, min_score: float, exclude):
+        grams = [g for g in _trigrams(query) if g in self._postings]
+        if not grams:
+            return [], []
+        hits = np.bincount(np.concatenate([self._postings[g] for g in grams]), minlength=len(self.entries))
+        candidates = np.flatnonzero(hits)
+        shared = hits[candidates]
+        scores = shared / (len(_trigrams(query)) + self._trigram_counts[candidates] - shared)
+        keep = scores >= min_score
+        candidates, scores = candidates[keep], scores[keep]
+        if exclude is not None and len(exclude):
+            keep = ~np.isin(candidates, exclude)
+            candidates, scores = candidates[keep], scores[keep]
+        order = np.lexsort((self._priority[candidates], -scores))[:limit]
+        return candidates[order], scores[order]
+
+    def suggest(self, query: str, limit: int = 10, kinds=None, min_score: float = 0.3):
+        query = normalize(query)
+        if not query:
+            return []
+        wanted = set(kinds or KINDS)
+        # Over-fetch so filtering by kind still fills the limit.
+        fetch = limit * 4 if kinds else limit
+
+        suggestions = []
+        prefix_ids = self._prefix(query, fetch)
+        for i in prefix_ids:
+            text, kind, value = self.entries[i]
+            if kind in wanted:
+                suggestions.append({"text": text, "kind": kind, "value": value, "match": "prefix", "score": 1.0})
+        if len(suggestions) < limit and not query.isdigit():
+            fuzzy_ids, scores = self._fuzzy(query, fetch, min_score, prefix_ids)
+            for i, score in zip(fuzzy_ids, scores):
+                text, kind, value = self.entries[i]
+                if kind in wanted:
+                    suggestions.append({"text": text, "kind": kind, "value": value,
+                                        "match": "fuzzy", "score": round(float(score), 3)})
+        return suggestions[:limit]
+
+
+def _collect_entries():
+    utilization = ml_models.get("drug_utilization")
+    if utilization is not None:
+        for name in utilization.df["Gnrc_Name"].dropna().unique():
+            yield name, "drug_name", name
+
+    therapeutic = ml_models.get("therapeutic_equivalence")
+    if therapeutic is not None:
+        pairs = therapeutic.df[["RXCUI", "ingredient"]].dropna().drop_duplicates("RXCUI")
+        for ingredient in pairs["ingredient"].unique():
+            yield ingredient, "ingredient", ingredient
+        for rxcui, ingredient in pairs.itertuples(index=False):
+            yield f"{int(rxcui)} ({ingredient})", "rxcui", int(rxcui)
+
+    for key in ("formulary_analyzer", "regional_disparity"):
+        model = ml_models.get(key)
+        if model is not None and getattr(model, "formulary_df", None) is not None:
+            for rxcui in model.formulary_df["RXCUI"].dropna().astype(str).unique():
+                yield rxcui, "rxcui", rxcui
+            break
+
+
+_lock = threading.Lock()
+_current = {"sources": None, "index": None}
+
+
+def _source_versions():
+    return tuple(model_version(key) if key in ml_models else None for key in SOURCE_MODELS)
+
+
+def is_current() -> bool:
+    return _current["index"] is not None and _current["sources"] == _source_versions()
+
+
+def get_autocomplete_index() -> AutocompleteIndex:
+    """The index for the models loaded right now, rebuilt once after any source model is swapped."""
+    if is_current():
+        return _current["index"]
+    with _lock:
+        sources = _source_versions()
+        if _current["index"] is None or _current["sources"] != sources:
+            _current["index"] = AutocompleteIndex(_collect_entries())
+            _current["sources"] = sources
+        return _current["index"]
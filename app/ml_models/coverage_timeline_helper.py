@@ -0,0 +1,184 @@
+"""
+Month-by-month coverage of every RXCUI across the monthly formulary snapshots
+written by `spuf_ingest --snapshot-dir`.
+
+    python -m app.ml_models.coverage_timeline_helper data/snapshots [--out app/ml_models/models/coverage_timeline.parquet]
+
+The build runs on dask, one partition per snapshot file, so a year of
+snapshots never has to fit in memory at once. The result is small, one row
+per (RXCUI, month). It is stored sorted by RXCUI, and CoverageTimeline keeps
+a row-range index over it for constant-time lookups.
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+TIMELINE_WORKERS = int(os.getenv("TIMELINE_WORKERS", os.cpu_count() or 1))
+
+_METRIC_COLUMNS = [
+    "covering_plans", "covering_formularies", "states_covered",
+    "tier_min", "tier_max", "pa_share", "st_share", "ql_share",
+]
+
+
+def _bit_or(series: pd.Series):
+    return np.bitwise_or.reduce(series.to_numpy(dtype=np.uint64))
+
+
+def build_coverage_timeline(snapshot_dir: str, workers: int = TIMELINE_WORKERS):
+    """
+    Aggregates all snapshots into one row per (RXCUI, month). States covered
+    are tracked as a bit mask per formulary and OR-ed per drug, so the
+    formulary x state product is never materialized.
+    Returns (timeline DataFrame, states, months).
+    """
+    import dask
+    import dask.dataframe as dd
+
+    bit_or = dd.Aggregation("bit_or", chunk=lambda g: g.agg(_bit_or), agg=lambda g: g.agg(_bit_or))
+
+    def read(table, columns):
+        df = dd.read_parquet(os.path.join(snapshot_dir, table), columns=columns + ["month"])
+        return df.assign(month=df["month"].astype("string[pyarrow]"))
+
+    with dask.config.set(scheduler="threads", num_workers=workers):
+        geo = read("geographic", ["COUNTY_CODE", "STATENAME"]).dropna(subset=["STATENAME"])
+        states = sorted(geo["STATENAME"].unique().compute().tolist())
+        if len(states) > 64:
+            raise ValueError(f"{len(states)} states do not fit the 64-bit coverage mask")
+        state_bits = {name: np.uint64(1) << np.uint64(i) for i, name in enumerate(states)}
+
+        # Plans per formulary and the states they are sold in, per month: small enough to broadcast.
+        plans = read("plan_info", ["FORMULARY_ID", "COUNTY_CODE"]).merge(
+            geo, on=["month", "COUNTY_CODE"], how="left"
+        )
+        plans = plans.assign(state_mask=plans["STATENAME"].map(state_bits, meta=("state_mask", "object"))
+                             .fillna(0).astype("uint64"))
+        per_formulary = plans.groupby(["month", "FORMULARY_ID"]).agg(
+            {"COUNTY_CODE": "size", "state_mask": bit_or}
+        ).compute()
+        per_formulary.columns = ["plan_count", "state_mask"]
+        per_formulary = per_formulary.reset_index().astype(
+            {"month": "string[pyarrow]", "FORMULARY_ID": "string[pyarrow]"}
+        )
+
+        formulary = read("formulary", ["FORMULARY_ID", "RXCUI", "TIER_LEVEL_VALUE", "PRIOR_AUTHORIZATION_YN",
+                                       "STEP_THERAPY_YN", "QUANTITY_LIMIT_YN"])
+        months = sorted(formulary["month"].unique().compute().tolist())
+        formulary = formulary.merge(per_formulary, on=["month", "FORMULARY_ID"], how="left")
+        formulary = formulary.assign(
+            plan_count=formulary["plan_count"].fillna(0).astype("int64"),
+            state_mask=formulary["state_mask"].fillna(0).astype("uint64"),
+            tier=dd.to_numeric(formulary["TIER_LEVEL_VALUE"], errors="coerce"),
+            pa=(formulary["PRIOR_AUTHORIZATION_YN"] == "Y").astype("int64"),
+            st=(formulary["STEP_THERAPY_YN"] == "Y").astype("int64"),
+            ql=(formulary["QUANTITY_LIMIT_YN"] == "Y").astype("int64"),
+        )
+        timeline = formulary.groupby(["RXCUI", "month"]).agg({
+            "FORMULARY_ID": "count",
+            "plan_count": "sum",
+            "state_mask": bit_or,
+            "tier": ["min", "max"],
+            "pa": "sum",
+            "st": "sum",
+            "ql": "sum",
+        }).compute()
+
+    timeline.columns = ["covering_formularies", "covering_plans", "state_mask", "tier_min", "tier_max",
+                        "pa", "st", "ql"]
+    timeline = timeline.reset_index()
+    formularies = timeline["covering_formularies"].clip(lower=1)
+    for flag in ("pa", "st", "ql"):
+        timeline[f"{flag}_share"] = (timeline.pop(flag) / formularies).round(4)
+    masks = timeline["state_mask"].astype("uint64").to_numpy()
+    timeline["states_covered"] = np.unpackbits(masks.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+    timeline = timeline.sort_values(["RXCUI", "month"], ignore_index=True)
+    return timeline[["RXCUI", "month", *_METRIC_COLUMNS, "state_mask"]], states, months
+
+
+def write_timeline(timeline: pd.DataFrame, states: list, months: list, path: str):
+    """Writes the timeline with its state and month lists in the Parquet metadata, atomically."""
+    table = pa.Table.from_pandas(timeline, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        b"coverage_timeline": json.dumps({"states": states, "months": months}).encode("utf-8"),
+    })
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+
+
+class CoverageTimeline:
+    """In-memory coverage timeline with an RXCUI -> row range index."""
+
+    def __init__(self, timeline: pd.DataFrame, states: list, months: list):
+        self.states = states
+        self.months = months
+        self.rxcuis = timeline["RXCUI"].astype(str).to_numpy()
+        self.columns = {name: timeline[name].to_numpy() for name in ["month", *_METRIC_COLUMNS, "state_mask"]}
+        # The frame is sorted by RXCUI, so each drug is one contiguous slice.
+        keys, starts = np.unique(self.rxcuis, return_index=True)
+        stops = np.append(starts[1:], len(self.rxcuis))
+        self.index = {key: (int(start), int(stop)) for key, start, stop in zip(keys, starts, stops)}
+
+    @classmethod
+    def load(cls, filepath: str):
+        table = pq.read_table(filepath)
+        meta = json.loads(table.schema.metadata[b"coverage_timeline"])
+        model = cls(table.to_pandas(), meta["states"], meta["months"])
+        print(f"Coverage timeline loaded from {filepath}")
+        return model
+
+    def _missing_states(self, mask: int):
+        return [name for i, name in enumerate(self.states) if not (mask >> i) & 1]
+
+    def timeline(self, rxcui_input):
+        rxcui_input = str(rxcui_input)
+        span = self.index.get(rxcui_input)
+        if span is None:
+            return {"rxcui": rxcui_input, "status": "not_covered",
+                    "message": "Drug not covered in any formulary snapshot", "months": []}
+
+        start, stop = span
+        by_month = {self.columns["month"][i]: i for i in range(start, stop)}
+        entries = []
+        for month in self.months:
+            i = by_month.get(month)
+            if i is None:
+                entries.append({"month": month, "covering_plans": 0, "covering_formularies": 0,
+                                "states_covered": 0, "missing_states": self.states})
+                continue
+            entry = {"month": month}
+            for name in _METRIC_COLUMNS:
+                value = self.columns[name][i]
+                entry[name] = None if pd.isna(value) else value.item()
+            entry["missing_states"] = self._missing_states(int(self.columns["state_mask"][i]))
+            entries.append(entry)
+        return {"rxcui": rxcui_input, "status": "success", "total_states": len(self.states), "months": entries}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the per-drug coverage timeline from monthly snapshots.")
+    parser.add_argument("snapshot_dir")
+    parser.add_argument("--out", default=os.path.join(os.getenv("MODEL_DIR", "app/ml_models/models"),
+                                                      "coverage_timeline.parquet"))
+    parser.add_argument("--workers", type=int, default=TIMELINE_WORKERS)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    timeline, states, months = build_coverage_timeline(args.snapshot_dir, args.workers)
+    built = time.perf_counter()
+    write_timeline(timeline, states, months, args.out)
+    print(f"✅ {timeline['RXCUI'].nunique()} drugs x {len(months)} months built in {built - started:.1f}s, "
+          f"written to {args.out} in {time.perf_counter() - built:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
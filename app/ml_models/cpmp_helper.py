@@ -1,4 +1,7 @@
+import numpy as np
+
 from .therapeutic_eq_helper import PBMRecommender
+from .drug_utilization_helper import DrugUtilizationForecaster
 
 class CPMPCalculator:
 
@@ -12,8 +15,13 @@ class CPMPCalculator:
 
 
         recommendation_result = self.recommender.recommend_by_rxcui(rxcui=rxcui, cost=current_cost)
+        return self.savings_from_recommendation(recommendation_result, rxcui, current_cost, utilization_rate)
 
-        if not recommendation_result.get("alternatives"):
+    def savings_from_recommendation(self, recommendation_result: dict, rxcui: int, current_cost: float,
+                                    utilization_rate: float):
+        """CPMP savings for a `recommend_by_rxcui` result that the caller already has."""
+        best_alternative = self.recommender.best_alternative(recommendation_result)
+        if best_alternative is None:
 
             return {
                 "message": f"No cheaper therapeutic alternatives found for RXCUI {rxcui}.",
@@ -34,7 +42,6 @@ class CPMPCalculator:
             }
 
 
-        best_alternative = min(recommendation_result["alternatives"], key=lambda x: x["Alternative_cost"])
         best_alternative_cost = best_alternative["Alternative_cost"]
         best_alternative_rxcui = best_alternative["Alternative_RXCUI"]
 
@@ -67,4 +74,71 @@ class CPMPCalculator:
         }
 
     def calculate_overall_cpmp(self, drug_list: list, utilization_rates: dict, cost_overrides: dict):
-        pass
\ No newline at end of file
+        pass
+
+    def project_portfolio(self, items: list, forecaster: DrugUtilizationForecaster, years: int = 5,
+                          basis: str = "Total_Claims"):
+        """
+        Multi-year CPMP and savings for a portfolio. Each item is a dict with
+        `rxcui`, `drug_name` (the forecaster's Gnrc_Name), `utilization_rate`
+        and optionally `current_cost` (defaults to the drug's lowest listed
+        cost). Each drug's utilization rate is scaled by its forecast `basis`
+        relative to the last historical year. A drug without a forecast keeps
+        its rate flat. Each drug's best alternative is the one
+        /savings-analysis uses (`PBMRecommender.best_alternative_for`), and
+        every year is computed at once as [drugs, years] arrays.
+        """
+        n = len(items)
+        rxcuis = [int(item["rxcui"]) for item in items]
+        costs = np.array([
+            item["current_cost"] if item.get("current_cost") is not None else self.recommender.reference_cost(rxcui)
+            for item, rxcui in zip(items, rxcuis)
+        ], dtype=float)
+        rates = np.array([item["utilization_rate"] for item in items], dtype=float)
+
+        best = [self.recommender.best_alternative_for(rxcui, cost) for rxcui, cost in zip(rxcuis, costs)]
+        has_alternative = np.array([b is not None for b in best], dtype=bool)
+        alternative_costs = np.array([b[1] if b is not None else c for b, c in zip(best, costs)], dtype=float)
+
+        future_years, forecasts, last_actuals = forecaster.forecast_matrix(
+            [item.get("drug_name") for item in items], years, basis
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            growth = np.clip(forecasts, 0, None) / last_actuals[:, None]
+        forecast_used = np.isfinite(growth).all(axis=1)
+        growth[~forecast_used] = 1.0
+
+        projected_rates = rates[:, None] * growth
+        original_cpmp = np.nan_to_num(costs[:, None] * projected_rates)
+        alternative_cpmp = np.nan_to_num(alternative_costs[:, None] * projected_rates)
+        annual_savings = (original_cpmp - alternative_cpmp) * self.member_count * 12
+
+        def rounded(values):
+            return np.round(values, 4).tolist()
+
+        drugs = [{
+            "rxcui": rxcuis[i],
+            "drug_name": items[i].get("drug_name"),
+            "current_cost": None if np.isnan(costs[i]) else float(costs[i]),
+            "best_alternative_rxcui": best[i][0] if has_alternative[i] else None,
+            "alternative_cost": float(alternative_costs[i]) if has_alternative[i] else None,
+            "forecast_used": bool(forecast_used[i]),
+            "utilization_rates": rounded(projected_rates[i]),
+            "original_cpmp": rounded(original_cpmp[i]),
+            "alternative_cpmp": rounded(alternative_cpmp[i]),
+            "annual_savings": rounded(annual_savings[i]),
+        } for i in range(n)]
+
+        portfolio_savings = annual_savings.sum(axis=0)
+        return {
+            "years": future_years,
+            "basis": basis,
+            "member_count": self.member_count,
+            "drugs": drugs,
+            "portfolio": {
+                "original_cpmp": rounded(original_cpmp.sum(axis=0)),
+                "alternative_cpmp": rounded(alternative_cpmp.sum(axis=0)),
+                "annual_savings": rounded(portfolio_savings),
+                "cumulative_savings": rounded(np.cumsum(portfolio_savings)),
+            },
+        }
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import pickle
 
@@ -11,6 +12,7 @@ class DrugUtilizationForecaster:
     def __init__(self, models_dict: dict, dataframe: pd.DataFrame):
         self.models = models_dict
         self.df = dataframe
+        self._latest = None
 
     @classmethod
     def load_model(cls, path: str):
@@ -56,3 +58,36 @@ class DrugUtilizationForecaster:
 
         return response
 
+
+    def _get_latest(self):
+        """Last historical year and actuals per drug."""
+        if getattr(self, '_latest', None) is None:
+            self._latest = self.df.sort_values("Year").groupby("Gnrc_Name").last()
+        return self._latest
+
+    def forecast_matrix(self, drug_names: list, steps: int = 5, target: str = "Total_Claims"):
+        """
+        Forecasts `target` for many drugs on one calendar-year axis: the
+        `steps` years after the latest historical year among them. A drug
+        whose history ends earlier is forecast further ahead to line up.
+        Returns (future_years, forecasts[n, steps], last_actuals[n]); rows
+        for drugs without a model are NaN.
+        """
+        latest = self._get_latest()
+        known = [name for name in dict.fromkeys(drug_names)
+                 if target in self.models.get(name, {}) and name in latest.index]
+        last_year = int(latest.loc[known, "Year"].max()) if known else int(self.df["Year"].max())
+        future_years = list(range(last_year + 1, last_year + 1 + steps))
+
+        by_drug = {}
+        for name in known:
+            lead = last_year - int(latest.at[name, "Year"])
+            forecast = np.asarray(self.models[name][target].forecast(steps=lead + steps), dtype=float)
+            by_drug[name] = (forecast[lead:], float(latest.at[name, target]))
+
+        forecasts = np.full((len(drug_names), steps), np.nan)
+        last_actuals = np.full(len(drug_names), np.nan)
+        for i, name in enumerate(drug_names):
+            if name in by_drug:
+                forecasts[i], last_actuals[i] = by_drug[name]
+        return future_years, forecasts, last_actuals
@@ -0,0 +1,258 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.metrics import MODEL_CALL_SECONDS, MODEL_QUEUE_SECONDS
+from app.services.tracing import span
+
+from .loaders import MODEL_ARTIFACTS, artifact_path
+from .registry import artifact_version, artifact_versions, lease, ml_models, register_model
+
+
+def _default_model_workers() -> int:
+    """
+    Model processes per API process when MODEL_WORKERS is unset. serve.py
+    always sets it from its sizing plan. Under `uvicorn --workers N` every
+    API process starts its own pool, each holding every artifact, so the
+    cores are split by WEB_CONCURRENCY. Without it, the number of API
+    processes is unknown and one model process is the safe default.
+    """
+    web_processes = int(os.getenv("WEB_CONCURRENCY", 0))
+    if web_processes <= 0:
+        return 1
+    return max(1, (os.cpu_count() or 1) // web_processes)
+
+
+# Model processes per API process; 0 runs model calls on threads in the API process.
+MODEL_WORKERS = int(os.getenv("MODEL_WORKERS") or _default_model_workers())
+# Start method for pools created after startup, once the server runs threads of its own.
+MODEL_POOL_START_METHOD = os.getenv("MODEL_POOL_START_METHOD", "forkserver")
+
+
+# Matches whichever pool is in use, for `_replace_pool`.
+_ANY_POOL = object()
+
+
+def _timed_call(fn, args, kwargs):
+    """Runs inside a worker; returns the result with its wall-clock start and run time."""
+    started = time.time()
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, started, time.perf_counter() - t0
+
+
+def call_model(model_key: str, method: str, *args, **kwargs):
+    """Looks up a model in this process's registry and calls one of its methods."""
+    with lease(model_key) as model:
+        if model is None:
+            raise LookupError(f"Model '{model_key}' is not loaded.")
+        return getattr(model, method)(*args, **kwargs)
+
+
+def _load_registry(specs: dict):
+    """
+    Initializer of a pool process started after startup: loads each model
+    from its artifact file, refusing any file that is no longer the version
+    the parent serves.
+    """
+    for model_key, (path, version) in specs.items():
+        if artifact_version(path) != version:
+            raise RuntimeError(f"Artifact for '{model_key}' changed while the model pool was starting.")
+        register_model(model_key, MODEL_ARTIFACTS[model_key][1](path), version=version)
+
+
+class ModelExecutor:
+    """
+    Runs CPU-bound model calls on a pool of worker processes.
+
+    The first pool is forked at startup, right after `ml_models` is filled and
+    before any background thread runs, so every worker shares the loaded
+    artifacts copy-on-write instead of unpickling them again. Pools created
+    later, after a model swap or a crash, are started with
+    MODEL_POOL_START_METHOD instead, because forking a process that already
+    runs threads can deadlock the child. Those workers load the artifacts
+    the parent serves from disk, each into its own memory.
+
+    A worker's registry never changes, so calls on the pool need no lease.
+    They always run on the version that was current when their pool started.
+    With `MODEL_WORKERS=0`, or before `start()`, calls fall back to the
+    AnyIO threadpool in this process.
+    """
+
+    def __init__(self, workers: int = MODEL_WORKERS):
+        self.workers = workers
+        self._pool = None
+        self._started = False
+        self._lock = threading.Lock()
+        # Serializes replacing the pool; held while a new pool starts, so never taken on the event loop.
+        self._swap_lock = threading.Lock()
+        self._in_flight = 0
+        self._timings = {}
+
+    @property
+    def running(self) -> bool:
+        return self._pool is not None
+
+    def _warm_up(self, pool):
+        # Start every worker now, so each one holds the registry as it is at this moment.
+        for future in [pool.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+        return pool
+
+    def _load_pool(self, pending: dict = None):
+        specs = {
+            model_key: (artifact_path(model_key), artifact_versions[model_key])
+            for model_key in list(ml_models) if model_key in MODEL_ARTIFACTS and model_key in artifact_versions
+        }
+        specs.update({model_key: (artifact_path(model_key), version) for model_key, version in (pending or {}).items()})
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(MODEL_POOL_START_METHOD),
+            initializer=_load_registry,
+            initargs=(specs,),
+        )
+        try:
+            return self._warm_up(pool)
+        except Exception:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    def start(self):
+        if self.workers <= 0 or self._pool is not None:
+            return
+        self._pool = self._warm_up(
+            ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("fork"))
+        )
+        self._started = True
+        print(f"Model executor started with {self.workers} worker process(es).")
+
+    def _replace_pool(self, current, pending: dict = None, publish=None):
+        """
+        Swaps in a new pool loaded from the current registry, if `current` is
+        still the pool in use (`_ANY_POOL` matches whichever is). If the new
+        pool cannot start, calls fall back to the threadpool in this process
+        rather than to outdated workers, until the next refresh.
+
+        `pending` maps model keys to artifact versions that are not in the
+        registry yet; the new pool loads those instead. `publish`, which puts
+        them in the registry, runs only once the new pool is in place, so no
+        call that sees a new version runs on the old pool. Otherwise the old
+        pool's answers would be cached under the new version's key.
+
+        Returns (whether the swap happened, the pool it replaced).
+        """
+        with self._swap_lock:
+            old_pool = self._pool
+            swapped = self._started and (current is _ANY_POOL or old_pool is current)
+            if swapped:
+                try:
+                    new_pool = self._load_pool(pending)
+                except Exception as e:
+                    print(f"CRITICAL: Could not start a new model worker pool, running model calls on threads. {e}")
+                    new_pool = None
+                with self._lock:
+                    self._pool = new_pool
+            if publish is not None:
+                publish()
+        return swapped, old_pool
+
+    def refresh(self, pending: dict = None, publish=None):
+        """
+        Starts a new pool for a model swap, loading `pending` versions, then
+        runs `publish` to install them in this process's registry (see
+        `_replace_pool`). Tasks already queued on the old pool finish there
+        on the old version, then its workers exit.
+        """
+        swapped, old_pool = self._replace_pool(_ANY_POOL, pending, publish)
+        if not swapped:
+            return
+        if old_pool is not None:
+            old_pool.shutdown(wait=False)
+        if self._pool is not None:
+            print(f"Model executor refreshed with {self.workers} worker process(es).")
+
+    def shutdown(self):
+        self._started = False
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _restart(self, broken_pool):
+        """
+        Replaces `broken_pool`, unless another caller that saw it break already
+        did. Every call in flight on a broken pool fails at once, and only the
+        first of them may restart it.
+        """
+        if self._replace_pool(broken_pool)[0]:
+            print("CRITICAL: Model worker pool broke and was restarted.")
+            broken_pool.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, model_key: str, fn, *args, **kwargs):
+        """
+        Awaits `fn(*args, **kwargs)` on a worker process, timed under
+        `model_key`, the model it mainly uses. `fn` must be a module-level function.
+        """
+        return await self._submit(model_key, getattr(fn, "__qualname__", repr(fn)), fn, args, kwargs)
+
+    async def run_model(self, model_key: str, method: str, *args, **kwargs):
+        """Awaits `ml_models[model_key].<method>(*args, **kwargs)` on a worker process."""
+        return await self._submit(model_key, f"{model_key}.{method}", call_model, (model_key, method) + args, kwargs)
+
+    async def _submit(self, model_key: str, name: str, fn, args, kwargs):
+        submitted = time.time()
+        with self._lock:
+            self._in_flight += 1
+        try:
+            with span("model", call=name):
+                if self._pool is None:
+                    result, started, elapsed = await run_in_threadpool(_timed_call, fn, args, kwargs)
+                else:
+                    pool = self._pool
+                    try:
+                        future = pool.submit(_timed_call, fn, args, kwargs)
+                        result, started, elapsed = await asyncio.wrap_future(future)
+                    except BrokenProcessPool:
+                        await run_in_threadpool(self._restart, pool)
+                        raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        self._record(model_key, name, max(0.0, started - submitted), elapsed)
+        return result
+
+    def _record(self, model_key: str, name: str, wait: float, elapsed: float):
+        MODEL_CALL_SECONDS.observe((model_key,), elapsed)
+        MODEL_QUEUE_SECONDS.observe((model_key,), wait)
+        with self._lock:
+            t = self._timings.setdefault(name, {"count": 0, "total_s": 0.0, "max_s": 0.0, "wait_total_s": 0.0})
+            t["count"] += 1
+            t["total_s"] += elapsed
+            t["max_s"] = max(t["max_s"], elapsed)
+            t["wait_total_s"] += wait
+
+    def stats(self):
+        with self._lock:
+            workers = self.workers if self._pool is not None else 0
+            return {
+                "workers": workers,
+                "in_flight": self._in_flight,
+                "queue_depth": max(0, self._in_flight - workers) if workers else 0,
+                "tasks": {
+                    name: {
+                        "count": t["count"],
+                        "avg_ms": round(t["total_s"] / t["count"] * 1000, 2),
+                        "max_ms": round(t["max_s"] * 1000, 2),
+                        "avg_wait_ms": round(t["wait_total_s"] / t["count"] * 1000, 2),
+                    }
+                    for name, t in self._timings.items()
+                },
+            }
+
+
+model_executor = ModelExecutor()
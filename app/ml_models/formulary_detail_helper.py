@@ -1,6 +1,15 @@
+import numpy as np
 import pandas as pd
 import pickle, gzip
 
+from .regional_disparity_helper import slice_fingerprint
+
+# SPUF COST_TYPE codes.
+_COST_TYPES = {1.0: 'copay', 2.0: 'coinsurance'}
+# A copay is in dollars and a coinsurance is a rate, so amounts only compare within one type:
+# copay plans rank first by amount, then coinsurance plans by rate, then plans with neither.
+_COST_TYPE_RANK = {1.0: 0, 2.0: 1}
+
 
 class FormularyAnalyzer:
 
@@ -12,6 +21,8 @@ class FormularyAnalyzer:
         self.indication_df = None
         self.excluded_drugs_df = None
         self.is_trained = False
+        self._plan_index = None
+        self._slice_fingerprint = None
 
 
 
@@ -29,14 +40,25 @@ class FormularyAnalyzer:
         print(f"Model loaded and rebuilt from {filepath}")
         return model
 
-    def predict(self, rxcui_input):
+    def slice_fingerprint(self) -> str:
+        """Matches `RegionalDisparityModel.slice_fingerprint` when both were built from the same tables."""
+        if getattr(self, '_slice_fingerprint', None) is None:
+            self._slice_fingerprint = slice_fingerprint(self.formulary_df, self.plan_info_df)
+        return self._slice_fingerprint
+
+    def predict(self, rxcui_input, drug_info=None, covering_plans=None):
+        """
+        `drug_info` (the drug's formulary rows) and `covering_plans` (the plans
+        on any of those formularies) may be passed in from a slice already taken.
+        """
 
         if not self.is_trained:
             return {'status': 'error', 'message': 'Model is not trained or the .pkl file is invalid.'}
 
         try:
             rxcui_input = str(rxcui_input)
-            drug_info = self.formulary_df[self.formulary_df['RXCUI'] == rxcui_input]
+            if drug_info is None:
+                drug_info = self.formulary_df[self.formulary_df['RXCUI'] == rxcui_input]
             if drug_info.empty:
                 return {'drug_rxcui': rxcui_input, 'status': 'not_covered',
                         'message': 'Drug not covered in any formulary'}
@@ -48,7 +70,8 @@ class FormularyAnalyzer:
             formulary_id = drug_info['FORMULARY_ID'].iloc[0]
             tier = drug_info['TIER_LEVEL_VALUE'].iloc[0]
 
-            plan_info = self.plan_info_df[self.plan_info_df['FORMULARY_ID'] == formulary_id]
+            plans = self.plan_info_df if covering_plans is None else covering_plans
+            plan_info = plans[plans['FORMULARY_ID'] == formulary_id]
             if plan_info.empty:
                 return {'drug_rxcui': rxcui_input, 'status': 'covered_no_info',
                         'message': 'Covered but no plan information available'}
@@ -102,5 +125,258 @@ class FormularyAnalyzer:
         except Exception as e:
             return {"drug_rxcui": rxcui_input, "status": "error", "message": f"Analysis error: {str(e)}"}
 
+    def build_indexes(self):
+        """Builds the lookup indexes eagerly, so forked workers share them instead of each building their own."""
+        self._get_plan_index()
+        self.slice_fingerprint()
+
+    def _get_plan_index(self):
+        if self._plan_index is None:
+            self._plan_index = self._build_plan_index()
+        return self._plan_index
+
+    def _build_plan_index(self):
+        """
+        Precomputes the formulary x plan x beneficiary cost join behind `cheapest_plans`:
+        - (FORMULARY_ID, RXCUI) -> tier and PA/ST/QL flags, as one sorted int64 key array;
+        - the plans of each county as a contiguous row range;
+        - per plan row, the 30-day cost of every tier (first row per contract, plan
+          and tier, as `predict` picks it), and its state;
+        - the inverted index behind `plans_covering_basket`: per RXCUI, the sorted
+          formulary codes that cover it, stored as one CSR-style posting array.
+        Materializing every (county, RXCUI) pair would be far larger than these
+        pieces, which a query combines with a few array lookups.
+        """
+        formulary = self.formulary_df.drop_duplicates(['FORMULARY_ID', 'RXCUI'])
+        formulary_ids = pd.Index(formulary['FORMULARY_ID'].unique())
+        rxcuis = pd.Index(formulary['RXCUI'].unique())
+        keys = (formulary_ids.get_indexer(formulary['FORMULARY_ID']).astype(np.int64) * len(rxcuis)
+                + rxcuis.get_indexer(formulary['RXCUI']))
+        order = np.argsort(keys, kind='stable')
+
+        def flag(column):
+            return (formulary[column] == 'Y').to_numpy()[order] if column in formulary else np.zeros(len(order), bool)
+
+        plan_columns = [c for c in ['COUNTY_CODE', 'CONTRACT_ID', 'PLAN_ID', 'SEGMENT_ID', 'PLAN_NAME', 'FORMULARY_ID']
+                        if c in self.plan_info_df]
+        plans = (
+            self.plan_info_df[plan_columns]
+            .dropna(subset=['COUNTY_CODE', 'FORMULARY_ID'])
+            .drop_duplicates([c for c in ['COUNTY_CODE', 'CONTRACT_ID', 'PLAN_ID', 'SEGMENT_ID'] if c in plan_columns])
+            .astype({'COUNTY_CODE': str})
+            .sort_values('COUNTY_CODE', kind='stable', ignore_index=True)
+        )
+        counties, starts = np.unique(plans['COUNTY_CODE'].to_numpy(), return_index=True)
+        stops = np.append(starts[1:], len(plans))
+        county_states = (self.geographic_df.dropna(subset=['COUNTY_CODE']).drop_duplicates('COUNTY_CODE')
+                         .astype({'COUNTY_CODE': str}).set_index('COUNTY_CODE')['STATENAME'])
+        plan_states = plans['COUNTY_CODE'].map(county_states).to_numpy()
+
+        # Re-sorting the (formulary, RXCUI) keys by RXCUI gives each drug's formularies in ascending order.
+        sorted_keys = keys[order]
+        by_rxcui = np.argsort(sorted_keys % len(rxcuis), kind='stable')
+        posting_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(sorted_keys % len(rxcuis), minlength=len(rxcuis)))]
+        )
+
+        costs = self.beneficiary_cost_df
+        costs = costs[costs['DAYS_SUPPLY'].astype(str) == '1'].drop_duplicates(['CONTRACT_ID', 'PLAN_ID', 'TIER'])
+        costs = costs.assign(TIER=pd.to_numeric(costs['TIER'], errors='coerce')).dropna(subset=['TIER'])
+        max_tier = int(costs['TIER'].max()) if not costs.empty else 0
+        plan_keys = pd.MultiIndex.from_frame(plans[['CONTRACT_ID', 'PLAN_ID']])
+        cost_matrices = {}
+        for column in ['COST_AMT_PREF', 'COST_AMT_NONPREF', 'COST_TYPE_PREF']:
+            by_tier = costs.assign(value=pd.to_numeric(costs[column], errors='coerce')).pivot(
+                index=['CONTRACT_ID', 'PLAN_ID'], columns='TIER', values='value'
+            )
+            by_tier = by_tier.reindex(columns=range(max_tier + 1)).reindex(plan_keys)
+            cost_matrices[column] = by_tier.to_numpy(dtype=float)
+
+        return {
+            'formulary_ids': formulary_ids,
+            'rxcuis': rxcuis,
+            'keys': sorted_keys,
+            'tiers': pd.to_numeric(formulary['TIER_LEVEL_VALUE'], errors='coerce').to_numpy(dtype=float)[order],
+            'prior_auth': flag('PRIOR_AUTHORIZATION_YN'),
+            'step_therapy': flag('STEP_THERAPY_YN'),
+            'quantity_limit': flag('QUANTITY_LIMIT_YN'),
+            'plans': plans,
+            'plan_formulary_codes': formulary_ids.get_indexer(plans['FORMULARY_ID']).astype(np.int64),
+            'counties': {county: (int(a), int(b)) for county, a, b in zip(counties, starts, stops)},
+            'costs': cost_matrices,
+            'plan_states': plan_states,
+            'postings': (sorted_keys[by_rxcui] // len(rxcuis)).astype(np.int32),
+            'posting_positions': by_rxcui,
+            'posting_offsets': posting_offsets,
+        }
+
+    def cheapest_plans(self, rxcui_input, county_code, top_k: int = 10):
+        """
+        Plans sold in `county_code` whose formulary covers the drug, ranked by
+        preferred 30-day cost within its cost type (copays by amount, then
+        coinsurance by rate), then tier, then number of restrictions.
+        """
+        if not self.is_trained:
+            return {'status': 'error', 'message': 'Model is not trained or the .pkl file is invalid.'}
+
+        rxcui_input, county_code = str(rxcui_input), str(county_code)
+        index = self._get_plan_index()
+        rx_code = index['rxcuis'].get_indexer([rxcui_input])[0]
+        if rx_code < 0:
+            return {'drug_rxcui': rxcui_input, 'county_code': county_code, 'status': 'not_covered',
+                    'message': 'Drug not covered in any formulary'}
+        span = index['counties'].get(county_code)
+        if span is None:
+            return {'drug_rxcui': rxcui_input, 'county_code': county_code, 'status': 'unknown_county',
+                    'message': 'No plans are offered in this county'}
+
+        total_plans = span[1] - span[0]
+        rows = np.arange(*span)
+        formulary_codes = index['plan_formulary_codes'][rows]
+        keys = np.where(formulary_codes >= 0, formulary_codes * len(index['rxcuis']) + rx_code, -1)
+        positions = np.searchsorted(index['keys'], keys).clip(max=len(index['keys']) - 1)
+        covered = (keys >= 0) & (index['keys'][positions] == keys)
+        rows, positions = rows[covered], positions[covered]
+        if not len(rows):
+            return {'drug_rxcui': rxcui_input, 'county_code': county_code, 'status': 'not_covered_in_county',
+                    'message': 'No plan in this county covers the drug', 'plans_in_county': total_plans}
+
+        tiers = index['tiers'][positions]
+        tier_columns = np.where(np.isnan(tiers), 0, tiers).astype(np.int64)
+        tier_columns = np.where(tier_columns < index['costs']['COST_AMT_PREF'].shape[1], tier_columns, 0)
+
+        def cost(column):
+            values = index['costs'][column][rows, tier_columns]
+            return np.where(np.isnan(tiers), np.nan, values)
+
+        preferred, non_preferred, cost_type = cost('COST_AMT_PREF'), cost('COST_AMT_NONPREF'), cost('COST_TYPE_PREF')
+        pa, st, ql = (index[name][positions] for name in ('prior_auth', 'step_therapy', 'quantity_limit'))
+        restrictions = pa.astype(int) + st.astype(int) + ql.astype(int)
+        type_rank = np.full(len(cost_type), len(_COST_TYPE_RANK))
+        for code, rank in _COST_TYPE_RANK.items():
+            type_rank[cost_type == code] = rank
+        ranking = np.lexsort((
+            restrictions,
+            np.where(np.isnan(tiers), np.inf, tiers),
+            np.where(np.isnan(preferred), np.inf, preferred),
+            type_rank,
+        ))[:max(top_k, 0)]
+
+        plans = index['plans']
+        results = []
+        for i in ranking:
+            plan = plans.iloc[rows[i]]
+            results.append({
+                'plan_name': plan.get('PLAN_NAME'),
+                'contract_id': plan.get('CONTRACT_ID'),
+                'plan_id': plan.get('PLAN_ID'),
+                'segment_id': plan.get('SEGMENT_ID'),
+                'formulary_id': plan.get('FORMULARY_ID'),
+                'tier': None if np.isnan(tiers[i]) else int(tiers[i]),
+                'preferred_cost': None if np.isnan(preferred[i]) else float(preferred[i]),
+                'non_preferred_cost': None if np.isnan(non_preferred[i]) else float(non_preferred[i]),
+                'cost_type': _COST_TYPES.get(cost_type[i], 'not_applicable'),
+                'prior_auth': "Yes" if pa[i] else "No",
+                'step_therapy': "Yes" if st[i] else "No",
+                'quantity_limit': "Yes" if ql[i] else "No",
+            })
+
+        return {
+            'drug_rxcui': rxcui_input,
+            'county_code': county_code,
+            'status': 'covered',
+            'plans_in_county': total_plans,
+            'covering_plans': int(len(rows)),
+            'plans': results,
+        }
+
+    def plans_covering_basket(self, rxcuis, state: str = None, county_code: str = None, limit: int = 50):
+        """
+        Plans whose formulary covers every drug in the basket, optionally within
+        a state or county, with the basket's restrictions summed per plan.
+        Posting lists are intersected shortest first, so a basket costs about as
+        much as its rarest drug.
+        """
+        if not self.is_trained:
+            return {'status': 'error', 'message': 'Model is not trained or the .pkl file is invalid.'}
+
+        rxcuis = list(dict.fromkeys(str(r).strip() for r in rxcuis))
+        index = self._get_plan_index()
+        codes = index['rxcuis'].get_indexer(rxcuis)
+        not_covered = [r for r, code in zip(rxcuis, codes) if code < 0]
+        base = {'basket': rxcuis, 'state': state, 'county_code': county_code}
+        if not_covered:
+            return {**base, 'status': 'not_covered', 'not_covered_rxcuis': not_covered,
+                    'message': 'Some drugs are not covered in any formulary', 'matching_plans': 0, 'plans': []}
+
+        offsets = index['posting_offsets']
+        spans = sorted(((offsets[c], offsets[c + 1]) for c in codes), key=lambda span: span[1] - span[0])
+        formularies = index['postings'][spans[0][0]:spans[0][1]]
+        for start, stop in spans[1:]:
+            if not len(formularies):
+                break
+            formularies = np.intersect1d(formularies, index['postings'][start:stop], assume_unique=True)
+
+        # Per matching formulary, sum the basket's flags and take its highest tier.
+        n = len(formularies)
+        prior_auth, step_therapy, quantity_limit = np.zeros(n, int), np.zeros(n, int), np.zeros(n, int)
+        max_tier = np.full(n, -np.inf)
+        for start, stop in spans:
+            hits = np.searchsorted(index['postings'][start:stop], formularies)
+            positions = index['posting_positions'][start:stop][hits]
+            prior_auth += index['prior_auth'][positions]
+            step_therapy += index['step_therapy'][positions]
+            quantity_limit += index['quantity_limit'][positions]
+            max_tier = np.fmax(max_tier, index['tiers'][positions])
+
+        if county_code is not None:
+            start, stop = index['counties'].get(str(county_code), (0, 0))
+            rows = np.arange(start, stop)
+        else:
+            rows = np.arange(len(index['plans']))
+        if state is not None:
+            rows = rows[index['plan_states'][rows] == state]
+        formulary_codes = index['plan_formulary_codes'][rows]
+        matched = np.isin(formulary_codes, formularies)
+        rows, slot = rows[matched], np.searchsorted(formularies, formulary_codes[matched])
+
+        plans = index['plans'].iloc[rows].assign(
+            prior_auth_count=prior_auth[slot],
+            step_therapy_count=step_therapy[slot],
+            quantity_limit_count=quantity_limit[slot],
+            max_tier=np.where(np.isinf(max_tier[slot]), np.nan, max_tier[slot]),
+        )
+        plan_key = [c for c in ['CONTRACT_ID', 'PLAN_ID', 'SEGMENT_ID'] if c in plans]
+        plans = (
+            plans.groupby(plan_key, sort=False)
+            .agg(plan_name=('PLAN_NAME', 'first'), formulary_id=('FORMULARY_ID', 'first'),
+                 counties=('COUNTY_CODE', 'nunique'), prior_auth_count=('prior_auth_count', 'first'),
+                 step_therapy_count=('step_therapy_count', 'first'),
+                 quantity_limit_count=('quantity_limit_count', 'first'), max_tier=('max_tier', 'first'))
+            .reset_index()
+        )
+        plans['restriction_count'] = plans['prior_auth_count'] + plans['step_therapy_count'] + plans['quantity_limit_count']
+        plans = plans.sort_values(['restriction_count', 'max_tier', 'plan_name'], kind='stable')
 
+        results = []
+        for plan in plans.head(max(limit, 0)).itertuples(index=False):
+            results.append({
+                'plan_name': plan.plan_name,
+                'contract_id': plan.CONTRACT_ID,
+                'plan_id': plan.PLAN_ID,
+                'segment_id': getattr(plan, 'SEGMENT_ID', None),
+                'formulary_id': plan.formulary_id,
+                'counties': int(plan.counties),
+                'max_tier': None if pd.isna(plan.max_tier) else int(plan.max_tier),
+                'prior_auth_count': int(plan.prior_auth_count),
+                'step_therapy_count': int(plan.step_therapy_count),
+                'quantity_limit_count': int(plan.quantity_limit_count),
+            })
 
+        return {
+            **base,
+            'status': 'covered' if results else 'no_matching_plans',
+            'matching_formularies': int(n),
+            'matching_plans': int(len(plans)),
+            'plans': results,
+        }
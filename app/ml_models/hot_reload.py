@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+
+from .executor import model_executor
+from .loaders import MODEL_ARTIFACTS, artifact_path, load_artifact
+from .registry import artifact_version, artifact_versions, register_model
+from .result_cache import result_cache
+
+# Seconds between artifact polls in each API worker; 0 disables the watcher.
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", 0))
+
+_reload_locks = {key: threading.Lock() for key in MODEL_ARTIFACTS}
+
+
+def reload_model(model_key: str, force: bool = False):
+    """
+    Loads the artifact for `model_key` on the calling thread, validates it and
+    swaps it into the registry. Requests already running keep the version
+    they started with. Serving is never paused, since the swap is a single
+    assignment.
+    """
+    if model_key not in MODEL_ARTIFACTS:
+        raise KeyError(model_key)
+
+    with _reload_locks[model_key]:
+        path = artifact_path(model_key)
+        started = time.perf_counter()
+        new_version = artifact_version(path)
+        old_version = artifact_versions.get(model_key)
+        if new_version == old_version and not force:
+            return {"model": model_key, "status": "unchanged", "version": new_version}
+
+        try:
+            model = load_artifact(model_key)
+        except Exception as e:
+            print(f"CRITICAL: Reload of '{model_key}' rejected, keeping version {old_version}. {e}")
+            return {"model": model_key, "status": "rejected", "version": old_version, "error": str(e)}
+
+        # The pool's workers hold their own copy of the registry, so they need a new pool. The new
+        # version is only published once that pool serves, so cached results always match their key.
+        model_executor.refresh(
+            pending={model_key: new_version},
+            publish=lambda: register_model(model_key, model, version=new_version),
+        )
+        result_cache.prune_stale_versions()
+        elapsed = round(time.perf_counter() - started, 2)
+        print(f"✅ Reloaded '{model_key}' {str(old_version)[:12]} -> {new_version[:12]} in {elapsed}s")
+        return {
+            "model": model_key,
+            "status": "reloaded",
+            "previous_version": old_version,
+            "version": new_version,
+            "load_seconds": elapsed,
+        }
+
+
+class ArtifactWatcher:
+    """
+    Polls the artifact files and reloads a model once its file has changed
+    and stayed unchanged for a full poll interval, so a copy in progress is
+    never loaded. Writing the new file and renaming it into place is still
+    the safest way to publish an artifact.
+    """
+
+    def __init__(self, interval: float = MODEL_WATCH_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._seen = {}
+
+    @staticmethod
+    def _stat(model_key: str):
+        try:
+            st = os.stat(artifact_path(model_key))
+            return st.st_mtime_ns, st.st_size
+        except FileNotFoundError:
+            return None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        # Nothing counts as seen yet: a worker forked from serve.py's master holds the
+        # models the master loaded, which may predate reloads in other workers. Every
+        # artifact is checked once, by content hash, after its first settled poll.
+        self._seen = {}
+        self._thread = threading.Thread(target=self._run, name="artifact-watcher", daemon=True)
+        self._thread.start()
+        print(f"Watching model artifacts every {self.interval}s for changes.")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        pending = {}
+        while not self._stop.wait(self.interval):
+            for key in MODEL_ARTIFACTS:
+                current = self._stat(key)
+                if current is None or current == self._seen.get(key):
+                    pending.pop(key, None)
+                    continue
+                if pending.get(key) != current:
+                    pending[key] = current  # changed; wait one more interval for it to settle
+                    continue
+                pending.pop(key)
+                self._seen[key] = current
+                try:
+                    reload_model(key)
+                except Exception as e:
+                    print(f"CRITICAL: Automatic reload of '{key}' failed. {e}")
+
+
+artifact_watcher = ArtifactWatcher()
@@ -0,0 +1,111 @@
+import os
+import pickle
+
+from .regional_disparity_helper import RegionalDisparityModel
+from .formulary_detail_helper import FormularyAnalyzer
+from .therapeutic_eq_helper import PBMRecommender
+from .drug_utilization_helper import DrugUtilizationForecaster
+from .coverage_timeline_helper import CoverageTimeline
+from .regional_catalog_helper import RegionalCatalog
+
+MODEL_DIR = os.getenv("MODEL_DIR", "app/ml_models/models")
+
+
+def _load_pickle(path: str):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def _load_therapeutic(path: str):
+    model = PBMRecommender(df=_load_pickle(path))
+    model.build_indexes()
+    return model
+
+
+def _load_utilization(path: str):
+    bundle = _load_pickle(path)
+    return DrugUtilizationForecaster(models_dict=bundle['models'], dataframe=bundle['dataframe'])
+
+
+def _load_regional_model(path: str):
+    model = RegionalDisparityModel.load_model(path)
+    model.build_indexes()
+    return model
+
+
+def _load_formulary_analyzer(path: str):
+    model = FormularyAnalyzer.load_model_state(path)
+    model.build_indexes()
+    return model
+
+
+def _validate_formulary_model(model):
+    if not model.is_trained or model.formulary_df is None or model.formulary_df.empty:
+        raise ValueError("model is not trained or has no formulary data")
+    sample = model.formulary_df['RXCUI'].iloc[0]
+    result = model.predict(sample)
+    if result.get("status") == "error":
+        raise ValueError(f"smoke prediction for RXCUI {sample} failed: {result.get('message')}")
+
+
+def _validate_therapeutic(model):
+    missing = {'RXCUI', 'ingredient', 'TIER_LEVEL_VALUE', 'BENEFICIARY_COST'} - set(model.df.columns)
+    if missing:
+        raise ValueError(f"dataframe is missing columns {sorted(missing)}")
+    if model.df.empty:
+        raise ValueError("dataframe is empty")
+
+
+def _validate_utilization(model):
+    if not model.models:
+        raise ValueError("bundle contains no trained models")
+
+
+def _validate_um_analyzer(model):
+    if not getattr(model, "monthly_analyses", None):
+        raise ValueError("analyzer contains no analysis data")
+
+
+def _validate_coverage_timeline(model):
+    if not model.index or not model.months:
+        raise ValueError("timeline contains no drugs or months")
+
+
+def _validate_regional_catalog(model):
+    if model.report.empty or not model.source_version:
+        raise ValueError("catalog is empty or does not record its source artifact version")
+
+
+# model_key -> (artifact file, loader, validator, human-readable name)
+MODEL_ARTIFACTS = {
+    "regional_disparity": ("regional_disparity_model_.pkl", _load_regional_model,
+                           _validate_formulary_model, "Regional Disparity model"),
+    "formulary_analyzer": ("formulary_analyzer_model.pkl", _load_formulary_analyzer,
+                           _validate_formulary_model, "Formulary Analyzer model"),
+    "therapeutic_equivalence": ("th_eq.pkl", _load_therapeutic,
+                                _validate_therapeutic, "Therapeutic Equivalence model"),
+    "drug_utilization": ("drug_utilization_models.pkl", _load_utilization,
+                         _validate_utilization, "Drug Utilization Forecast model"),
+    "um_change_jun_to_jul": ("um_analyzer_junetojuly.pkl", _load_pickle,
+                             _validate_um_analyzer, "UM Analyzer (June to July)"),
+    "um_change_jul_to_aug": ("um_analyzer_julytoaugust.pkl", _load_pickle,
+                             _validate_um_analyzer, "UM Analyzer (July to August)"),
+    "um_change_jun_to_aug": ("um_analyzer_junetoaugust.pkl", _load_pickle,
+                             _validate_um_analyzer, "UM Analyzer (June to August)"),
+    "coverage_timeline": ("coverage_timeline.parquet", CoverageTimeline.load,
+                          _validate_coverage_timeline, "Coverage Timeline"),
+    "regional_catalog": ("regional_catalog.parquet", RegionalCatalog.load,
+                         _validate_regional_catalog, "Regional Disparity catalog"),
+}
+
+
+def artifact_path(model_key: str) -> str:
+    return os.path.join(MODEL_DIR, MODEL_ARTIFACTS[model_key][0])
+
+
+def load_artifact(model_key: str):
+    """Loads and validates one artifact without touching the registry. Raises on any failure."""
+    filename, loader, validator, _ = MODEL_ARTIFACTS[model_key]
+    model = loader(artifact_path(model_key))
+    validator(model)
+    return model
@@ -0,0 +1,138 @@
+"""
+Regional disparity report for every RXCUI, precomputed in one pass.
+
+    python -m app.ml_models.regional_catalog_helper [--out app/ml_models/models/regional_catalog.parquet]
+
+The report is built from the regional disparity artifact with
+`RegionalDisparityModel.catalog_report` and stored with that artifact's
+version. `/api/analyze` serves from it only while the same artifact is
+loaded, and falls back to `predict` otherwise.
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def write_catalog(report: pd.DataFrame, path: str, source_version: str, all_states: list, build_seconds: float):
+    meta = {
+        "source_version": source_version,
+        "all_states": all_states,
+        "build_seconds": round(build_seconds, 3),
+        "built_at": datetime.utcnow().isoformat(timespec="seconds"),
+    }
+    table = pa.Table.from_pandas(report, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           b"regional_catalog": json.dumps(meta).encode("utf-8")})
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+
+
+class RegionalCatalog:
+    """The precomputed report, indexed by RXCUI, answering in the shape of `RegionalDisparityModel.predict`."""
+
+    def __init__(self, report: pd.DataFrame, meta: dict):
+        self.report = report.reset_index(drop=True)
+        self.meta = meta
+        self.source_version = meta.get("source_version")
+        self.all_states = meta.get("all_states", [])
+        self.index = {rxcui: i for i, rxcui in enumerate(self.report["rxcui"])}
+
+    @classmethod
+    def load(cls, filepath: str):
+        table = pq.read_table(filepath)
+        meta = json.loads(table.schema.metadata[b"regional_catalog"])
+        catalog = cls(table.to_pandas(), meta)
+        print(f"Regional catalog loaded from {filepath}")
+        return catalog
+
+    def _result(self, i: int):
+        row = self.report.iloc[i]
+        missing = list(row["missing_states"])
+        if row["status"] != "success":
+            return {"rxcui": row["rxcui"], "status": row["status"],
+                    "message": "Drug in formularies but no active plans", "missing_states": missing}
+        return {
+            "rxcui": row["rxcui"],
+            "total_plans_covering_drug": int(row["total_plans_covering_drug"]),
+            "states_with_coverage": f"{int(row['states_covered'])}/{int(row['total_states'])}",
+            "coverage_gap_percentage": f"{row['coverage_gap_percentage']}%",
+            "drug_tier": row["drug_tier"],
+            "prior_auth_required": row["prior_auth_required"],
+            "step_therapy_required": row["step_therapy_required"],
+            "missing_states": missing,
+            "disparity_message": (
+                f"Regional disparities detected - not covered in {len(missing)} states/territories"
+                if missing else "No regional disparities - covered in all states/territories"
+            ),
+            "status": "success",
+        }
+
+    def predict(self, rxcui_input):
+        rxcui_input = str(rxcui_input)
+        i = self.index.get(rxcui_input)
+        if i is None:
+            return {"rxcui": rxcui_input, "status": "not_covered",
+                    "message": "Drug not covered in any formulary", "missing_states": self.all_states}
+        return self._result(i)
+
+    def query(self, tier: str = None, prior_auth: bool = None, step_therapy: bool = None,
+              min_gap: float = None, max_gap: float = None, status: str = None,
+              limit: int = 100, offset: int = 0):
+        """Filters the whole catalog with vectorized masks; results are ordered by widest gap first."""
+        report = self.report
+        mask = np.ones(len(report), dtype=bool)
+        if tier is not None:
+            mask &= (report["drug_tier"] == tier).to_numpy()
+        if prior_auth is not None:
+            mask &= (report["prior_auth_required"] == ("Yes" if prior_auth else "No")).to_numpy()
+        if step_therapy is not None:
+            mask &= (report["step_therapy_required"] == ("Yes" if step_therapy else "No")).to_numpy()
+        if min_gap is not None:
+            mask &= (report["coverage_gap_percentage"] >= min_gap).to_numpy()
+        if max_gap is not None:
+            mask &= (report["coverage_gap_percentage"] <= max_gap).to_numpy()
+        if status is not None:
+            mask &= (report["status"] == status).to_numpy()
+
+        matches = np.flatnonzero(mask)
+        gaps = report["coverage_gap_percentage"].to_numpy()[matches]
+        ordered = matches[np.argsort(-gaps, kind="stable")]
+        return {
+            "total": int(len(matches)),
+            "built_at": self.meta.get("built_at"),
+            "build_seconds": self.meta.get("build_seconds"),
+            "drugs": [self._result(i) for i in ordered[offset:offset + limit]],
+        }
+
+
+def main():
+    from .loaders import MODEL_DIR, artifact_path
+    from .registry import artifact_version
+    from .regional_disparity_helper import RegionalDisparityModel
+
+    parser = argparse.ArgumentParser(description="Precompute the regional disparity report for every RXCUI.")
+    parser.add_argument("--out", default=os.path.join(MODEL_DIR, "regional_catalog.parquet"))
+    args = parser.parse_args()
+
+    source = artifact_path("regional_disparity")
+    model = RegionalDisparityModel.load_model(source)
+    # Timed from the loaded frames, so the state bitmap build is part of the reported time.
+    started = time.perf_counter()
+    report = model.catalog_report()
+    build_seconds = time.perf_counter() - started
+    write_catalog(report, args.out, artifact_version(source),
+                  list(model.all_states or []), build_seconds)
+    print(f"✅ Regional report for {len(report)} drugs built in {build_seconds:.2f}s and written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,22 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
 import pickle, gzip
 
 
+def slice_fingerprint(formulary_df: pd.DataFrame, plan_info_df: pd.DataFrame) -> str:
+    """
+    Content hash of the two tables a `drug_slice` is taken from. Models with
+    equal fingerprints can share one drug's slice.
+    """
+    digest = hashlib.sha1()
+    for frame in (formulary_df, plan_info_df):
+        digest.update(repr(list(frame.columns)).encode("utf-8"))
+        digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
 class RegionalDisparityModel:
 
 
@@ -13,6 +29,8 @@ class RegionalDisparityModel:
         self.excluded_drugs_df = None
         self.all_states = None
         self.is_trained = False
+        self._state_index = None
+        self._slice_fingerprint = None
 
     def load_data(self):
 
@@ -35,7 +53,25 @@ class RegionalDisparityModel:
         print(f"Model loaded from {filepath}")
         return model
 
-    def predict(self, rxcui_input):
+    def slice_fingerprint(self) -> str:
+        if getattr(self, '_slice_fingerprint', None) is None:
+            self._slice_fingerprint = slice_fingerprint(self.formulary_df, self.plan_info_df)
+        return self._slice_fingerprint
+
+    def drug_slice(self, rxcui_input):
+        """
+        The drug's formulary rows and the plans using any of those formularies,
+        the two lookups `predict` and `FormularyAnalyzer.predict` both start from.
+        """
+        rxcui_input = str(rxcui_input)
+        drug_coverage = self.formulary_df[self.formulary_df['RXCUI'] == rxcui_input]
+        covering_plans = self.plan_info_df[
+            self.plan_info_df['FORMULARY_ID'].isin(drug_coverage['FORMULARY_ID'].unique())
+        ]
+        return drug_coverage, covering_plans
+
+    def predict(self, rxcui_input, drug_coverage=None, covering_plans=None):
+        """`drug_coverage` and `covering_plans` may be passed in from a `drug_slice` already taken."""
 
         if not self.is_trained:
             return {
@@ -47,7 +83,8 @@ class RegionalDisparityModel:
         try:
             rxcui_input = str(rxcui_input)
 
-            drug_coverage = self.formulary_df[self.formulary_df['RXCUI'] == rxcui_input]
+            if drug_coverage is None or covering_plans is None:
+                drug_coverage, covering_plans = self.drug_slice(rxcui_input)
 
             if drug_coverage.empty:
                 return {
@@ -57,9 +94,6 @@ class RegionalDisparityModel:
                     'missing_states': self.all_states if self.all_states is not None else []
                 }
 
-            covering_formulary_ids = drug_coverage['FORMULARY_ID'].unique()
-            covering_plans = self.plan_info_df[self.plan_info_df['FORMULARY_ID'].isin(covering_formulary_ids)]
-
             if covering_plans.empty:
                 return {
                     'rxcui': rxcui_input,
@@ -116,6 +150,143 @@ class RegionalDisparityModel:
                 'message': f"Analysis error: {str(e)}"
             }
 
+    def build_indexes(self):
+        """Builds the lookup indexes eagerly, so forked workers share them instead of each building their own."""
+        self._get_state_index()
+        self.slice_fingerprint()
+
+    def _get_state_index(self):
+        if self._state_index is None:
+            self._state_index = self._build_state_index()
+        return self._state_index
+
+    def _build_state_index(self):
+        """
+        Packs state x RXCUI coverage into one bitmap row per state (`all_states`
+        order, one bit per RXCUI). A state covers a drug when any formulary
+        listing the drug has a plan in one of the state's counties, the same
+        rule `predict` applies.
+        """
+        formulary = self.formulary_df[['FORMULARY_ID', 'RXCUI']].dropna().drop_duplicates()
+        rxcuis = pd.Index(formulary['RXCUI'].astype(str).unique()).sort_values()
+        formulary_ids = pd.Index(formulary['FORMULARY_ID'].unique())
+        f_codes = formulary_ids.get_indexer(formulary['FORMULARY_ID'])
+        r_codes = rxcuis.get_indexer(formulary['RXCUI'].astype(str))
+
+        states = list(self.all_states) if self.all_states is not None else []
+        state_codes = pd.Index(states)
+        plans = self.plan_info_df[['FORMULARY_ID', 'COUNTY_CODE']].merge(
+            self.geographic_df[['COUNTY_CODE', 'STATENAME']], on='COUNTY_CODE', how='left'
+        ).dropna(subset=['STATENAME'])
+        sold_in = np.zeros((len(formulary_ids), len(states)), dtype=bool)
+        f_rows = formulary_ids.get_indexer(plans['FORMULARY_ID'])
+        s_cols = state_codes.get_indexer(plans['STATENAME'])
+        known = (f_rows >= 0) & (s_cols >= 0)
+        sold_in[f_rows[known], s_cols[known]] = True
+
+        covered = np.zeros((len(states), len(rxcuis)), dtype=bool)
+        for s in range(len(states)):
+            covered[s, r_codes[sold_in[f_codes, s]]] = True
+
+        return {
+            'states': state_codes,
+            'rxcuis': rxcuis,
+            'bitmaps': np.packbits(covered, axis=1),
+            'states_covered': covered.sum(axis=0).astype(np.int32),
+        }
+
+    def _state_bitmap(self, index, state: str):
+        row = index['states'].get_indexer([state])[0]
+        return None if row < 0 else index['bitmaps'][row]
+
+    def coverage_difference(self, state_a: str, state_b: str, limit: int = 500):
+        """RXCUIs covered in `state_a` but not in `state_b`, as one AND-NOT over the two state bitmaps."""
+        if not self.is_trained:
+            return {'status': 'error', 'message': 'Model not trained. The loaded .pkl file might be invalid.'}
+        index = self._get_state_index()
+        a, b = self._state_bitmap(index, state_a), self._state_bitmap(index, state_b)
+        unknown = [name for name, bitmap in ((state_a, a), (state_b, b)) if bitmap is None]
+        if unknown:
+            return {'status': 'unknown_state', 'message': f"Unknown state(s): {', '.join(unknown)}"}
+
+        difference = np.unpackbits(a & ~b, count=len(index['rxcuis'])).astype(bool)
+        rxcuis = index['rxcuis'][difference]
+        return {
+            'status': 'success',
+            'state_a': state_a,
+            'state_b': state_b,
+            'total': int(difference.sum()),
+            'rxcuis': rxcuis[:max(limit, 0)].tolist(),
+        }
+
+    def widest_gaps(self, top_n: int = 20, min_states_covered: int = 1):
+        """
+        Drugs covered in the fewest states (but at least `min_states_covered`),
+        with the states that miss them. Counts come from the precomputed bit sums.
+        """
+        if not self.is_trained:
+            return {'status': 'error', 'message': 'Model not trained. The loaded .pkl file might be invalid.'}
+        index = self._get_state_index()
+        counts = index['states_covered']
+        total_states = len(index['states'])
+        candidates = np.flatnonzero(counts >= min_states_covered)
+        ranked = candidates[np.lexsort((index['rxcuis'][candidates], counts[candidates]))][:max(top_n, 0)]
+
+        results = []
+        for column in ranked:
+            byte, bit = divmod(int(column), 8)
+            covered_rows = (index['bitmaps'][:, byte] >> (7 - bit)) & 1
+            results.append({
+                'rxcui': index['rxcuis'][column],
+                'states_covered': int(counts[column]),
+                'coverage_gap_percentage': round(float(1.0 - counts[column] / total_states) * 100, 1) if total_states else 0.0,
+                'missing_states': index['states'][covered_rows == 0].tolist(),
+            })
+        return {'status': 'success', 'total_states': total_states, 'drugs': results}
+
+    def catalog_report(self) -> pd.DataFrame:
+        """
+        `predict` for every RXCUI in the formulary at once: plan counts come from
+        one merge and groupby, and state coverage from the state bitmaps. Rows
+        carry the same values `predict` would return for each drug.
+        """
+        index = self._get_state_index()
+        rxcuis = index['rxcuis']
+        formulary = self.formulary_df.assign(RXCUI=self.formulary_df['RXCUI'].astype(str))
+
+        details = formulary.drop_duplicates('RXCUI').set_index('RXCUI').reindex(rxcuis)
+        plans_per_formulary = self.plan_info_df.groupby('FORMULARY_ID').size().rename('plans')
+        total_plans = (
+            formulary[['RXCUI', 'FORMULARY_ID']].drop_duplicates()
+            .join(plans_per_formulary, on='FORMULARY_ID')
+            .groupby('RXCUI')['plans'].sum()
+            .reindex(rxcuis, fill_value=0)
+            .astype(np.int64)
+        )
+
+        all_states = list(self.all_states) if self.all_states is not None else []
+        total_states = len(all_states)
+        covered = np.unpackbits(index['bitmaps'], axis=1, count=len(rxcuis)).astype(bool)
+        state_names = np.array(all_states, dtype=object)
+        missing = [state_names[~covered[:, i]].tolist() for i in range(len(rxcuis))]
+        states_covered = index['states_covered'].astype(np.int64)
+        ratio = states_covered / total_states if total_states else np.zeros(len(rxcuis))
+        active = total_plans.to_numpy() > 0
+
+        return pd.DataFrame({
+            'rxcui': rxcuis.to_numpy(),
+            'status': np.where(active, 'success', 'no_active_plans'),
+            'total_plans_covering_drug': total_plans.to_numpy(),
+            'states_covered': states_covered,
+            'total_states': total_states,
+            'coverage_gap_percentage': np.where(active, [round((1.0 - r) * 100, 1) for r in ratio], 100.0),
+            'drug_tier': details['TIER_LEVEL_VALUE'].astype(object)
+            .where(details['TIER_LEVEL_VALUE'].notna(), None).to_numpy(),
+            'prior_auth_required': np.where(details['PRIOR_AUTHORIZATION_YN'].to_numpy() == 'Y', 'Yes', 'No'),
+            'step_therapy_required': np.where(details['STEP_THERAPY_YN'].to_numpy() == 'Y', 'Yes', 'No'),
+            'missing_states': [m if a else all_states for m, a in zip(missing, active)],
+        })
+
     def save_model(self, filepath='regional_disparity_model.pkl'):
 
 
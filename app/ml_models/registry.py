@@ -1 +1,96 @@
-ml_models = {}
\ No newline at end of file
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from app.services.metrics import timed_model_call
+
+# Central registry of loaded models, filled by main.py's startup event.
+# Each entry is replaced by a single assignment, so readers always see either
+# the old or the new version, never a mix.
+ml_models = {}
+
+# Content hash of the artifact each model was loaded from, keyed like ml_models.
+artifact_versions = {}
+
+_lock = threading.Lock()
+# (model_key, version) -> number of calls currently using that version.
+_leases = {}
+# (model_key, version) -> replaced model kept alive until its leases drain.
+_retired = {}
+
+
+def artifact_version(path: str) -> str:
+    """SHA-1 of an artifact file's bytes; any change to the .pkl yields a new version."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def register_model(model_key: str, model, path: str = None, version: str = None):
+    """
+    Installs `model` as the current version of `model_key`. A replaced
+    version that is still leased is retired and released once its last
+    lease ends.
+    """
+    version = version or (artifact_version(path) if path else str(id(model)))
+    with _lock:
+        old_model = ml_models.get(model_key)
+        old_version = artifact_versions.get(model_key)
+        ml_models[model_key] = model
+        artifact_versions[model_key] = version
+        if old_model is not None and old_version != version and _leases.get((model_key, old_version)):
+            _retired[(model_key, old_version)] = old_model
+    return version
+
+
+def model_version(model_key: str):
+    """Identifies the currently loaded artifact for `model_key`; changes whenever it is replaced."""
+    return artifact_versions.get(model_key) or str(id(ml_models.get(model_key)))
+
+
+@contextmanager
+def lease(model_key: str, timed: bool = False):
+    """
+    Pins the current version of a model for the duration of a call in this
+    process, so a concurrent swap cannot release it mid-request. Every
+    in-process use of a model goes through here; calls on the model
+    executor's pool run on that pool's own, never-swapped registry.
+    With `timed`, the call is recorded in the model call metrics, which
+    the executor only does for the calls it runs.
+    """
+    with _lock:
+        model = ml_models.get(model_key)
+        version = artifact_versions.get(model_key)
+        lease_key = (model_key, version)
+        _leases[lease_key] = _leases.get(lease_key, 0) + 1
+    try:
+        if timed and model is not None:
+            with timed_model_call(model_key):
+                yield model
+        else:
+            yield model
+    finally:
+        with _lock:
+            remaining = _leases[lease_key] - 1
+            if remaining:
+                _leases[lease_key] = remaining
+            else:
+                del _leases[lease_key]
+                if _retired.pop(lease_key, None) is not None:
+                    print(f"Released retired version {version[:12]} of '{model_key}'")
+
+
+def registry_status():
+    with _lock:
+        return {
+            model_key: {
+                "version": artifact_versions.get(model_key),
+                "active_leases": _leases.get((model_key, artifact_versions.get(model_key)), 0),
+                "retired_versions": {
+                    v: _leases.get((k, v), 0) for (k, v) in _retired if k == model_key
+                },
+            }
+            for model_key in ml_models
+        }
@@ -0,0 +1,195 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi.concurrency import run_in_threadpool
+
+from .registry import model_version, artifact_versions
+from .executor import model_executor
+from .single_flight import single_flight
+from app.services.tracing import span
+
+RESULT_CACHE_MEMORY_MB = float(os.getenv("RESULT_CACHE_MEMORY_MB", 64))
+# SQLite file shared by every worker on the host; set to an empty string to disable the disk tier.
+RESULT_CACHE_DB = os.getenv("RESULT_CACHE_DB", "cache/model_results.sqlite3")
+
+
+class ResultCache:
+    """
+    Two-tier cache for model results keyed by (model, artifact version, input).
+
+    Tier one is a per-process LRU bounded by the pickled size of its
+    entries. Tier two is an optional SQLite file that survives restarts and
+    is shared by all workers. Because the artifact hash is part of every
+    key, loading a changed .pkl invalidates its old results implicitly;
+    `prune_stale_versions` reclaims their disk space.
+    """
+
+    def __init__(self, memory_max_bytes: int, disk_path: str = None):
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_path = disk_path or None
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._metrics = {}
+
+    # --- disk tier ---
+
+    def _conn(self):
+        # One connection per thread and per process; forked workers must not reuse the master's.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.disk_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.disk_path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, model TEXT, version TEXT, value BLOB, created REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_results_model_version ON results (model, version)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _disk_get(self, key: str):
+        row = self._conn().execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _disk_set(self, key: str, model_key: str, version: str, blob: bytes):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO results (key, model, version, value, created) VALUES (?, ?, ?, ?, ?)",
+            (key, model_key, version, blob, time.time()),
+        )
+        conn.commit()
+
+    def prune_stale_versions(self):
+        """Deletes disk entries for artifact versions that are no longer loaded."""
+        if not self.disk_path:
+            return 0
+        try:
+            conn = self._conn()
+            deleted = 0
+            for model_key, version in artifact_versions.items():
+                deleted += conn.execute(
+                    "DELETE FROM results WHERE model = ? AND version != ?", (model_key, version)
+                ).rowcount
+            conn.commit()
+            return deleted
+        except sqlite3.Error as e:
+            print(f"CRITICAL: Could not prune the result cache. {e}")
+            return 0
+
+    # --- memory tier ---
+
+    def _memory_get(self, key: str):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+            return entry
+
+    def _memory_set(self, key: str, blob: bytes):
+        size = len(blob)
+        if size > self.memory_max_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= len(old)
+            self._memory[key] = blob
+            self._memory_bytes += size
+            while self._memory_bytes > self.memory_max_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    # --- public API ---
+
+    @staticmethod
+    def make_key(model_key: str, version: str, normalized_input) -> str:
+        return hashlib.sha1(repr((model_key, version, normalized_input)).encode("utf-8")).hexdigest()
+
+    def _count(self, endpoint: str, outcome: str):
+        with self._lock:
+            m = self._metrics.setdefault(endpoint, {"memory_hits": 0, "disk_hits": 0, "misses": 0})
+            m[outcome] += 1
+
+    async def get_or_compute(self, endpoint: str, model_key: str, normalized_input, factory, cacheable=None):
+        """
+        Returns a cached result, or awaits `factory()` and caches it.
+        `cacheable(result)` can veto storing results such as transient errors.
+        """
+        version = model_version(model_key)
+        key = self.make_key(model_key, version, normalized_input)
+
+        blob = self._memory_get(key)
+        if blob is not None:
+            self._count(endpoint, "memory_hits")
+            return pickle.loads(blob)
+
+        if self.disk_path:
+            try:
+                blob = await run_in_threadpool(self._disk_get, key)
+            except sqlite3.Error as e:
+                print(f"Result cache read failed, computing instead: {e}")
+                blob = None
+            if blob is not None:
+                self._count(endpoint, "disk_hits")
+                self._memory_set(key, blob)
+                return pickle.loads(blob)
+
+        self._count(endpoint, "misses")
+        result = await factory()
+        if cacheable is None or cacheable(result):
+            blob = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+            self._memory_set(key, blob)
+            if self.disk_path:
+                try:
+                    await run_in_threadpool(self._disk_set, key, model_key, version, blob)
+                except sqlite3.Error as e:
+                    print(f"Result cache write failed: {e}")
+        return result
+
+    def stats(self):
+        with self._lock:
+            endpoints = {}
+            for endpoint, m in self._metrics.items():
+                total = m["memory_hits"] + m["disk_hits"] + m["misses"]
+                hits = m["memory_hits"] + m["disk_hits"]
+                endpoints[endpoint] = {**m, "hit_ratio": round(hits / total, 4) if total else 0.0}
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "memory_max_bytes": self.memory_max_bytes,
+                "disk_path": self.disk_path,
+                "endpoints": endpoints,
+            }
+
+
+result_cache = ResultCache(int(RESULT_CACHE_MEMORY_MB * 1024 * 1024), RESULT_CACHE_DB)
+
+
+def _not_an_error(result) -> bool:
+    return not (isinstance(result, dict) and result.get("status") == "error")
+
+
+async def cached_model_call(endpoint: str, model_key: str, method: str, normalized_input, *args, **kwargs):
+    """
+    The full read path for a pure model call: result cache, then single-flight
+    coalescing, then the worker pool. Error results are never cached.
+    """
+    with span("model_call", model=model_key, method=method):
+        return await result_cache.get_or_compute(
+            endpoint, model_key, normalized_input,
+            lambda: single_flight.run(
+                endpoint, model_key, normalized_input,
+                lambda: model_executor.run_model(model_key, method, *args, **kwargs),
+            ),
+            cacheable=_not_an_error,
+        )
@@ -0,0 +1,59 @@
+import asyncio
+import copy
+import threading
+
+from .registry import model_version
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical model calls within one process.
+
+    Calls are keyed by (endpoint, normalized input, model version). The
+    first caller starts the computation as its own task; callers that
+    arrive while it is running await the same task instead of computing
+    again. The task is shielded, so a disconnecting first caller does not
+    cancel it for the others.
+    """
+
+    def __init__(self):
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    async def run(self, endpoint: str, model_key: str, normalized_input, factory):
+        """Returns the result of `await factory()`, shared with identical in-flight calls."""
+        key = (endpoint, normalized_input, model_version(model_key))
+        task = self._in_flight.get(key)
+        leader = task is None
+        if leader:
+            task = asyncio.ensure_future(factory())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _t, k=key: self._in_flight.pop(k, None))
+        self._count(endpoint, leader)
+
+        result = await asyncio.shield(task)
+        # Followers get their own copy so a caller mutating its result cannot affect the others.
+        return result if leader else copy.deepcopy(result)
+
+    def _count(self, endpoint: str, leader: bool):
+        with self._lock:
+            c = self._counters.setdefault(endpoint, {"requests": 0, "computed": 0, "coalesced": 0})
+            c["requests"] += 1
+            c["computed" if leader else "coalesced"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._in_flight),
+                "endpoints": {
+                    endpoint: {
+                        **c,
+                        "dedup_rate": round(c["coalesced"] / c["requests"], 4) if c["requests"] else 0.0,
+                    }
+                    for endpoint, c in self._counters.items()
+                },
+            }
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,211 @@
+"""
+Builds the formulary artifacts from a raw CMS Part D SPUF release.
+
+    python -m app.ml_models.spuf_ingest /data/spuf/2025_Q3 [--out-dir app/ml_models/models]
+        [--snapshot-dir data/snapshots --month 2025-09]
+
+Each pipe-delimited file is read in blocks with pyarrow's multi-threaded CSV
+reader. Only the columns the models use are kept, and repeated rows are
+dropped block by block. Peak memory therefore follows the size of the
+normalized tables, not the raw files. The state both FormularyAnalyzer and
+RegionalDisparityModel load is written atomically, so a running server's
+artifact watcher picks it up like any other artifact change.
+"""
+import argparse
+import fnmatch
+import os
+import pickle
+import resource
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+
+from .loaders import MODEL_DIR, MODEL_ARTIFACTS
+
+SPUF_BLOCK_MB = int(os.getenv("SPUF_BLOCK_MB", 64))
+SPUF_ENCODING = os.getenv("SPUF_ENCODING", "latin-1")
+# Deduplicated parts are merged once this many rows have piled up.
+_COMPACT_ROWS = 2_000_000
+
+# state attribute -> (file name pattern, columns kept, dedupe key or None for exact duplicates)
+SPUF_FILES = {
+    "formulary_df": (
+        "basic drugs formulary file*",
+        ["FORMULARY_ID", "RXCUI", "TIER_LEVEL_VALUE", "QUANTITY_LIMIT_YN", "QUANTITY_LIMIT_AMOUNT",
+         "QUANTITY_LIMIT_DAYS", "PRIOR_AUTHORIZATION_YN", "STEP_THERAPY_YN"],
+        # The file lists every NDC; the models work per (formulary, RXCUI).
+        ["FORMULARY_ID", "RXCUI"],
+    ),
+    "plan_info_df": (
+        "plan information*",
+        ["CONTRACT_ID", "PLAN_ID", "SEGMENT_ID", "CONTRACT_NAME", "PLAN_NAME", "FORMULARY_ID",
+         "PREMIUM", "DEDUCTIBLE", "MA_REGION_CODE", "PDP_REGION_CODE", "STATE", "COUNTY_CODE",
+         "SNP", "PLAN_SUPPRESSED_YN"],
+        None,
+    ),
+    "beneficiary_cost_df": (
+        "beneficiary cost file*",
+        ["CONTRACT_ID", "PLAN_ID", "SEGMENT_ID", "COVERAGE_LEVEL", "TIER", "DAYS_SUPPLY",
+         "COST_TYPE_PREF", "COST_AMT_PREF", "COST_TYPE_NONPREF", "COST_AMT_NONPREF"],
+        None,
+    ),
+    "geographic_df": (
+        "geographic locator file*",
+        ["COUNTY_CODE", "STATENAME", "COUNTY", "MA_REGION_CODE", "MA_REGION", "PDP_REGION_CODE", "PDP_REGION"],
+        ["COUNTY_CODE"],
+    ),
+    "indication_df": (
+        "indication based coverage*",
+        ["CONTRACT_ID", "PLAN_ID", "RXCUI", "DISEASE"],
+        None,
+    ),
+    "excluded_drugs_df": (
+        "excluded drugs formulary file*",
+        ["CONTRACT_ID", "PLAN_ID", "RXCUI", "TIER", "QUANTITY_LIMIT_YN", "QUANTITY_LIMIT_AMOUNT",
+         "QUANTITY_LIMIT_DAYS", "PRIOR_AUTH_YN", "STEP_THERAPY_YN", "CAPPED_BENEFIT_YN"],
+        None,
+    ),
+}
+
+
+def find_spuf_file(source_dir: str, pattern: str) -> str:
+    matches = sorted(
+        name for name in os.listdir(source_dir)
+        if fnmatch.fnmatch(name.lower(), pattern) and name.lower().endswith((".txt", ".csv"))
+    )
+    if not matches:
+        raise FileNotFoundError(f"No file matching '{pattern}' in {source_dir}")
+    return os.path.join(source_dir, matches[-1])
+
+
+def _normalize_batch(batch: pa.RecordBatch, columns: list) -> pd.DataFrame:
+    """
+    Keeps only `columns`, trims whitespace and turns empty strings into nulls.
+    Every column stays a string: codes such as FORMULARY_ID and COUNTY_CODE
+    have leading zeros, and the models compare RXCUI, TIER and DAYS_SUPPLY as text.
+    """
+    present = [c for c in columns if c in batch.schema.names]
+    arrays = []
+    for name in present:
+        trimmed = pc.utf8_trim_whitespace(batch.column(name))
+        arrays.append(pc.if_else(pc.equal(trimmed, ""), pa.scalar(None, pa.string()), trimmed))
+    return pa.Table.from_arrays(arrays, names=present).to_pandas()
+
+
+def _dedupe(df: pd.DataFrame, key) -> pd.DataFrame:
+    return df.drop_duplicates(subset=key, keep="first", ignore_index=True)
+
+
+def read_spuf_file(path: str, columns: list, key=None, block_mb: int = SPUF_BLOCK_MB,
+                   encoding: str = SPUF_ENCODING) -> pd.DataFrame:
+    """Streams one pipe-delimited SPUF file into a deduplicated DataFrame of `columns`."""
+    reader = pv.open_csv(
+        path,
+        read_options=pv.ReadOptions(use_threads=True, block_size=block_mb * 1024 * 1024, encoding=encoding),
+        parse_options=pv.ParseOptions(delimiter="|"),
+        convert_options=pv.ConvertOptions(
+            include_columns=columns,
+            include_missing_columns=True,
+            column_types={c: pa.string() for c in columns},
+            strings_can_be_null=False,
+        ),
+    )
+    parts, pending_rows = [], 0
+    for batch in reader:
+        part = _dedupe(_normalize_batch(batch, columns), key)
+        parts.append(part)
+        pending_rows += len(part)
+        if pending_rows >= _COMPACT_ROWS and len(parts) > 1:
+            parts = [_dedupe(pd.concat(parts, ignore_index=True), key)]
+            pending_rows = len(parts[0])
+    if not parts:
+        return pd.DataFrame(columns=columns)
+    return _dedupe(pd.concat(parts, ignore_index=True), key)
+
+
+def build_formulary_state(source_dir: str, block_mb: int = SPUF_BLOCK_MB, encoding: str = SPUF_ENCODING):
+    """Reads every SPUF file and returns (model state dict, per-stage timings)."""
+    state, timings = {}, {}
+    for attribute, (pattern, columns, key) in SPUF_FILES.items():
+        started = time.perf_counter()
+        path = find_spuf_file(source_dir, pattern)
+        state[attribute] = read_spuf_file(path, columns, key, block_mb, encoding)
+        timings[attribute] = {
+            "file": os.path.basename(path),
+            "raw_mb": round(os.path.getsize(path) / 1e6, 1),
+            "rows": len(state[attribute]),
+            "seconds": round(time.perf_counter() - started, 2),
+        }
+
+    geo = state["geographic_df"]
+    state["all_states"] = sorted(geo["STATENAME"].dropna().unique().tolist())
+    state["is_trained"] = not state["formulary_df"].empty
+    return state, timings
+
+
+def write_artifact(state: dict, path: str):
+    """Pickles `state` next to `path` and renames it into place, so readers never see a partial file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+# Tables kept in the monthly snapshots that coverage_timeline_helper aggregates across months.
+SNAPSHOT_TABLES = {"formulary_df": "formulary", "plan_info_df": "plan_info", "geographic_df": "geographic"}
+
+
+def write_snapshot(state: dict, snapshot_dir: str, month: str):
+    """Writes this release's tables as hive-partitioned Parquet (`<table>/month=YYYY-MM/`)."""
+    for attribute, table in SNAPSHOT_TABLES.items():
+        out_dir = os.path.join(snapshot_dir, table, f"month={month}")
+        os.makedirs(out_dir, exist_ok=True)
+        state[attribute].to_parquet(os.path.join(out_dir, "part.0.parquet"), compression="zstd", index=False)
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build formulary model artifacts from a raw CMS SPUF release.")
+    parser.add_argument("source_dir", help="Directory holding the extracted pipe-delimited SPUF files.")
+    parser.add_argument("--out-dir", default=MODEL_DIR)
+    parser.add_argument("--block-mb", type=int, default=SPUF_BLOCK_MB, help="CSV read block size.")
+    parser.add_argument("--encoding", default=SPUF_ENCODING)
+    parser.add_argument("--snapshot-dir", help="Also keep this release as a monthly Parquet snapshot here.")
+    parser.add_argument("--month", help="Snapshot month as YYYY-MM (required with --snapshot-dir).")
+    args = parser.parse_args()
+    if args.snapshot_dir and not args.month:
+        parser.error("--month is required with --snapshot-dir")
+
+    total_started = time.perf_counter()
+    state, timings = build_formulary_state(args.source_dir, args.block_mb, args.encoding)
+    for attribute, t in timings.items():
+        print(f"  {attribute:<20} {t['rows']:>10} rows from {t['raw_mb']:>8} MB in {t['seconds']:>6}s  ({t['file']})")
+
+    if not state["is_trained"]:
+        print("❌ ERROR: The formulary file has no rows; no artifacts were written.")
+        return
+
+    for model_key in ("formulary_analyzer", "regional_disparity"):
+        started = time.perf_counter()
+        path = os.path.join(args.out_dir, MODEL_ARTIFACTS[model_key][0])
+        write_artifact(state, path)
+        print(f"  wrote {path} in {time.perf_counter() - started:.2f}s")
+
+    if args.snapshot_dir:
+        started = time.perf_counter()
+        write_snapshot(state, args.snapshot_dir, args.month)
+        print(f"  wrote snapshot {args.month} to {args.snapshot_dir} in {time.perf_counter() - started:.2f}s")
+
+    print(f"✅ Ingest finished in {time.perf_counter() - total_started:.1f}s, peak RSS {_peak_rss_mb():.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
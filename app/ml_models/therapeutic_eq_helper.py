@@ -1,5 +1,19 @@
+import numpy as np
 import pandas as pd
 import pickle
+import pyarrow.parquet as pq
+
+
+def iter_claim_chunks(source, filename: str, rxcui_column: str = 'RXCUI', cost_column: str = 'cost',
+                      chunk_rows: int = 100_000):
+    """Yields DataFrames of at most `chunk_rows` claims from a CSV or .parquet file, reading only the two needed columns."""
+    columns = [rxcui_column, cost_column]
+    if (filename or "").lower().endswith(".parquet"):
+        parquet_file = pq.ParquetFile(source)
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(source, usecols=columns, chunksize=chunk_rows, dtype={rxcui_column: str})
 
 
 class PBMRecommender:
@@ -11,6 +25,9 @@ class PBMRecommender:
         self.df = df
         # Ensure the RXCUI column is numeric to prevent type mismatch errors during lookup.
         self.df['RXCUI'] = pd.to_numeric(self.df['RXCUI'], errors='coerce')
+        self._bulk_index = None
+        self._savings_index = None
+        self._alternative_index = None
 
     @classmethod
     def load_model(cls, path: str):
@@ -18,6 +35,17 @@ class PBMRecommender:
         with open(path, 'rb') as f:
             return pickle.load(f)
 
+    def build_indexes(self):
+        """Builds the claim scoring lookups and the savings leaderboard up front, e.g. before workers fork."""
+        self._build_bulk_index()
+        self._build_savings_index()
+        self._build_alternative_index()
+
+    def reference_cost(self, rxcui: int):
+        """Lowest listed beneficiary cost for an RXCUI, or None if it is not in the dataset."""
+        costs = self.df.loc[self.df['RXCUI'] == rxcui, 'BENEFICIARY_COST'].dropna()
+        return float(costs.min()) if not costs.empty else None
+
     def recommend_by_rxcui(self, rxcui: int, cost: float, top_n: int = 2):
         """
         Finds cheaper alternatives for a given RXCUI and cost.
@@ -38,7 +66,8 @@ class PBMRecommender:
         candidates = self.df[self.df['ingredient'] == input_ing].copy()
         candidates = candidates.sort_values(
             by=['TIER_LEVEL_VALUE', 'BENEFICIARY_COST'],
-            ascending=[True, True]
+            ascending=[True, True],
+            kind='mergesort'
         )
 
         recommendations = []
@@ -79,3 +108,196 @@ class PBMRecommender:
             "alternatives": recommendations if recommendations else []
         }
 
+    @staticmethod
+    def best_alternative(recommendation: dict):
+        """
+        The best alternative of a `recommend_by_rxcui` result, or None: the
+        cheapest of the alternatives it lists. CPMP savings are measured
+        against this one.
+        """
+        alternatives = recommendation.get("alternatives")
+        return min(alternatives, key=lambda x: x["Alternative_cost"]) if alternatives else None
+
+    def _build_alternative_index(self):
+        """
+        Per ingredient, its candidates in the order `recommend_by_rxcui` walks
+        them (lowest tier, then lowest cost), keeping the first of each cost
+        as it does, as (RXCUI array, cost array).
+        """
+        df = self.df.dropna(subset=['RXCUI', 'ingredient', 'BENEFICIARY_COST'])
+        df = df.sort_values(['TIER_LEVEL_VALUE', 'BENEFICIARY_COST'], kind='mergesort')
+        df = df.drop_duplicates(['ingredient', 'BENEFICIARY_COST'])
+        self._alternative_index = {
+            ingredient: (group['RXCUI'].astype('int64').to_numpy(), group['BENEFICIARY_COST'].astype(float).to_numpy())
+            for ingredient, group in df.groupby('ingredient', sort=False)
+        }
+        return self._alternative_index
+
+    def best_alternative_for(self, rxcui: int, cost: float, top_n: int = 2):
+        """
+        `best_alternative(recommend_by_rxcui(rxcui, cost, top_n))` as
+        (RXCUI, cost), or None, from precomputed arrays instead of a scan of
+        the whole dataset. For portfolios of many drugs.
+        """
+        ingredients, _ = getattr(self, '_bulk_index', None) or self._build_bulk_index()
+        index = getattr(self, '_alternative_index', None) or self._build_alternative_index()
+        ingredient = ingredients.get(rxcui)
+        if ingredient is None or cost is None or np.isnan(cost) or ingredient not in index:
+            return None
+        rxcuis, costs = index[ingredient]
+        cheaper = np.flatnonzero(costs < cost)[:top_n]
+        if not len(cheaper):
+            return None
+        best = cheaper[np.argmin(costs[cheaper])]
+        return int(rxcuis[best]), float(costs[best])
+
+    def _build_bulk_index(self):
+        """
+        Precomputes the lookups used by `score_claims`:
+        - the ingredient of every RXCUI (its first non-null one, as in `recommend_by_rxcui`);
+        - per ingredient, a cost-ascending "ladder" where each step carries the
+          best candidate (lowest tier, then lowest cost) among all candidates
+          at or below that cost. The first alternative `recommend_by_rxcui`
+          would return for a cost c is the ladder step just below c.
+        """
+        df = self.df.dropna(subset=['RXCUI', 'ingredient', 'BENEFICIARY_COST'])
+        ingredients = (
+            self.df.dropna(subset=['RXCUI', 'ingredient'])
+            .drop_duplicates('RXCUI')
+            .set_index('RXCUI')['ingredient']
+        )
+
+        ranked = df.sort_values(['ingredient', 'TIER_LEVEL_VALUE', 'BENEFICIARY_COST'], kind='mergesort')
+        ranked = ranked.assign(_rank=np.arange(len(ranked)))
+        ladder = ranked.sort_values(['ingredient', 'BENEFICIARY_COST', '_rank'], kind='mergesort')
+        best_rank = ladder.groupby('ingredient', sort=False)['_rank'].cummin().to_numpy()
+        best = ranked.iloc[best_rank]
+        ladder = pd.DataFrame({
+            'ingredient': ladder['ingredient'].to_numpy(),
+            'ladder_cost': ladder['BENEFICIARY_COST'].astype(float).to_numpy(),
+            'alternative_rxcui': best['RXCUI'].astype('int64').to_numpy(),
+            'alternative_cost': best['BENEFICIARY_COST'].astype(float).to_numpy(),
+            'alternative_tier': best['TIER_LEVEL_VALUE'].to_numpy(),
+        }).sort_values('ladder_cost', kind='mergesort')
+        self._bulk_index = (ingredients, ladder)
+        return self._bulk_index
+
+    def score_claims(self, claims: pd.DataFrame, rxcui_col: str = 'RXCUI', cost_col: str = 'cost') -> pd.DataFrame:
+        """
+        Vectorized `recommend_by_rxcui` for many (RXCUI, cost) rows at once,
+        returning the first (best) alternative per row and its per-unit savings.
+        Rows without a cheaper alternative get empty alternative columns.
+        """
+        ingredients, ladder = getattr(self, '_bulk_index', None) or self._build_bulk_index()
+
+        out = pd.DataFrame({
+            'RXCUI': pd.to_numeric(claims[rxcui_col], errors='coerce'),
+            'cost': pd.to_numeric(claims[cost_col], errors='coerce').astype(float),
+        })
+        out['ingredient'] = out['RXCUI'].map(ingredients)
+        out['_row'] = np.arange(len(out))
+
+        matchable = out.dropna(subset=['ingredient', 'cost']).sort_values('cost', kind='mergesort')
+        matched = pd.merge_asof(
+            matchable, ladder,
+            left_on='cost', right_on='ladder_cost', by='ingredient',
+            direction='backward', allow_exact_matches=False,
+        )
+        out = out.merge(
+            matched[['_row', 'alternative_rxcui', 'alternative_cost', 'alternative_tier']],
+            on='_row', how='left',
+        ).sort_values('_row').drop(columns='_row')
+
+        out['savings_per_unit'] = (out['cost'] - out['alternative_cost']).round(2)
+        out['percentage_reduction'] = np.where(
+            out['cost'] > 0, (out['savings_per_unit'] / out['cost'] * 100).round(2), 0.0
+        )
+        out.loc[out['alternative_rxcui'].isna(), 'percentage_reduction'] = np.nan
+        out['alternative_rxcui'] = out['alternative_rxcui'].astype('Int64')
+        return out.reset_index(drop=True)
+
+    def _build_savings_index(self):
+        """
+        The best savings opportunity of every RXCUI, largest first. A drug is
+        priced at its cheapest listed cost, at the tier of that listing. Its
+        alternative is the cheapest listing of another RXCUI with the same
+        ingredient at the same or a lower tier. Per ingredient, the cheapest
+        listing at or below each tier is a running minimum over the tiers,
+        so the whole catalog is matched with one merge_asof instead of a
+        `recommend_by_rxcui` call per drug.
+        """
+        df = self.df.dropna(subset=['RXCUI', 'ingredient', 'BENEFICIARY_COST', 'TIER_LEVEL_VALUE'])
+        df = df.assign(
+            RXCUI=df['RXCUI'].astype('int64'),
+            BENEFICIARY_COST=df['BENEFICIARY_COST'].astype(float),
+            TIER_LEVEL_VALUE=pd.to_numeric(df['TIER_LEVEL_VALUE'], errors='coerce'),
+        ).dropna(subset=['TIER_LEVEL_VALUE'])
+
+        drugs = (
+            df.sort_values(['RXCUI', 'BENEFICIARY_COST', 'TIER_LEVEL_VALUE'], kind='mergesort')
+            .drop_duplicates('RXCUI')
+            [['RXCUI', 'ingredient', 'BENEFICIARY_COST', 'TIER_LEVEL_VALUE']]
+        )
+
+        # Cheapest listing per (ingredient, tier), then the running minimum over increasing tiers.
+        by_tier = (
+            df.sort_values(['ingredient', 'TIER_LEVEL_VALUE', 'BENEFICIARY_COST'], kind='mergesort')
+            .drop_duplicates(['ingredient', 'TIER_LEVEL_VALUE'])
+            .reset_index(drop=True)
+        )
+        # Rank every listing by (cost, tier) within its ingredient; the running minimum rank over
+        # increasing tiers is the cheapest listing so far, the lowest tier winning ties.
+        by_cost = by_tier.sort_values(['ingredient', 'BENEFICIARY_COST', 'TIER_LEVEL_VALUE'], kind='mergesort')
+        order = by_cost.index.to_numpy()
+        cost_rank = np.empty(len(by_tier), dtype=np.int64)
+        cost_rank[order] = np.arange(len(by_tier))
+        best_rank = pd.Series(cost_rank).groupby(by_tier['ingredient'].to_numpy(), sort=False).cummin().to_numpy()
+        best = by_cost.iloc[best_rank]
+        ladder = pd.DataFrame({
+            'ingredient': by_tier['ingredient'].to_numpy(),
+            'ladder_tier': by_tier['TIER_LEVEL_VALUE'].to_numpy(dtype=float),
+            'alternative_rxcui': best['RXCUI'].to_numpy(),
+            'alternative_cost': best['BENEFICIARY_COST'].to_numpy(),
+            'alternative_tier': best['TIER_LEVEL_VALUE'].to_numpy(dtype=float),
+        }).sort_values('ladder_tier', kind='mergesort')
+
+        drugs = drugs.assign(tier=drugs['TIER_LEVEL_VALUE'].astype(float)).sort_values('tier', kind='mergesort')
+        matched = pd.merge_asof(drugs, ladder, left_on='tier', right_on='ladder_tier', by='ingredient',
+                                direction='backward')
+        matched['savings_per_unit'] = (matched['BENEFICIARY_COST'] - matched['alternative_cost']).round(2)
+        matched = matched[(matched['savings_per_unit'] > 0) & (matched['alternative_rxcui'] != matched['RXCUI'])]
+
+        leaderboard = pd.DataFrame({
+            'rxcui': matched['RXCUI'].to_numpy(),
+            'ingredient': matched['ingredient'].to_numpy(),
+            'tier': matched['tier'].to_numpy(),
+            'cost': matched['BENEFICIARY_COST'].to_numpy(),
+            'alternative_rxcui': matched['alternative_rxcui'].astype('int64').to_numpy(),
+            'alternative_tier': matched['alternative_tier'].to_numpy(),
+            'alternative_cost': matched['alternative_cost'].to_numpy(),
+            'savings_per_unit': matched['savings_per_unit'].to_numpy(),
+        })
+        leaderboard['percentage_reduction'] = np.where(
+            leaderboard['cost'] > 0, (leaderboard['savings_per_unit'] / leaderboard['cost'] * 100).round(2), 0.0
+        )
+        self._savings_index = leaderboard.sort_values(
+            ['savings_per_unit', 'rxcui'], ascending=[False, True], kind='mergesort', ignore_index=True
+        )
+        return self._savings_index
+
+    def savings_leaderboard(self, top_n: int = 50, ingredient: str = None, tier: float = None):
+        """The `top_n` largest per-unit savings across the catalog, optionally for one ingredient or tier."""
+        leaderboard = getattr(self, '_savings_index', None)
+        if leaderboard is None:
+            leaderboard = self._build_savings_index()
+
+        mask = np.ones(len(leaderboard), dtype=bool)
+        if ingredient is not None:
+            mask &= (leaderboard['ingredient'].str.lower() == ingredient.strip().lower()).to_numpy()
+        if tier is not None:
+            mask &= (leaderboard['tier'] == float(tier)).to_numpy()
+        matches = leaderboard[mask]
+        return {
+            "total_opportunities": int(len(matches)),
+            "opportunities": matches.head(top_n).to_dict(orient='records'),
+        }
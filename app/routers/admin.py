@@ -0,0 +1,90 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+
+from app.database import User
+from app.security import verify_token
+from app.ml_models.loaders import MODEL_ARTIFACTS
+from app.ml_models.registry import registry_status
+from app.ml_models.hot_reload import reload_model
+from app.services.tracing import TracedRoute, recent_traces, summarize
+from app.services.profiling import list_profiles, profile_path
+
+router = APIRouter(route_class=TracedRoute)
+
+
+def require_superuser(current_user: User = Depends(verify_token)):
+    if not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only superuser can perform this action.",
+        )
+    return current_user
+
+
+@router.get("/models", summary="Loaded model versions and their active leases")
+def list_models(current_user: User = Depends(require_superuser)):
+    return registry_status()
+
+
+@router.post("/models/{model_key}/reload", summary="Load, validate and atomically swap in a model artifact")
+async def reload_model_artifact(
+        model_key: str,
+        force: bool = False,
+        current_user: User = Depends(require_superuser),
+):
+    """
+    Reloads one model in this worker. Loading happens on the threadpool, so
+    requests keep being served on the current version until the swap.
+    Under serve.py the other workers pick up a changed artifact file through
+    their artifact watchers, which serve.py turns on (MODEL_WATCH_INTERVAL,
+    10s by default). A forced reload of an unchanged file only applies here.
+    """
+    if model_key not in MODEL_ARTIFACTS:
+        raise HTTPException(status_code=404, detail=f"Unknown model '{model_key}'.")
+
+    try:
+        result = await run_in_threadpool(reload_model, model_key, force)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Artifact for '{model_key}' not found.")
+
+    if result["status"] == "rejected":
+        raise HTTPException(status_code=422, detail=result)
+    return result
+
+
+def _matching_traces(route: Optional[str]):
+    return [t for t in list(recent_traces) if route is None or t["name"].split(" ", 1)[-1] == route]
+
+
+@router.get("/traces", summary="Recent sampled request traces of this worker")
+def list_traces(
+        route: Optional[str] = None,
+        limit: int = Query(50, ge=1, le=1000),
+        current_user: User = Depends(require_superuser),
+):
+    """Newest first. `route` is a route template such as /api/formulary-analyser."""
+    return _matching_traces(route)[::-1][:limit]
+
+
+@router.get("/traces/summary", summary="Per-phase latency percentiles over recent traces")
+def trace_summary(route: Optional[str] = None, current_user: User = Depends(require_superuser)):
+    traces = _matching_traces(route)
+    return {"traces": len(traces), "phases": summarize(traces)}
+
+
+@router.get("/profiles", summary="Stored request profiles, newest first")
+def list_request_profiles(current_user: User = Depends(require_superuser)):
+    """Profiles recorded for /api/* requests sent by a superuser with the `X-Profile: 1` header."""
+    return list_profiles()
+
+
+@router.get("/profiles/{profile_id}", summary="Download a request profile as folded stacks")
+def get_request_profile(profile_id: str, current_user: User = Depends(require_superuser)):
+    """Folded-stack text, ready for flamegraph.pl, inferno or speedscope."""
+    path = profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Profile '{profile_id}' not found.")
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.folded")
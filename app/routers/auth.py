@@ -8,11 +8,12 @@ from app.deps import get_db
 from app.schemas import Register, UserLogin, VerifyOTP, ResetPasswordRequest
 from app.security import create_access_token, hash_password, verify_token
 from app.services.Email_service import (
-    send_login_otp_email,
-    send_password_reset_email,
+    queue_login_otp_email,
+    queue_password_reset_email,
 )
+from app.services.tracing import TracedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 
 login_otps = {}
@@ -66,9 +67,8 @@ def login(user: UserLogin, db: Session = Depends(get_db)):
     expiry_time = time.time() + OTP_TTL_SECONDS
     login_otps[db_user.email] = {"otp": otp, "expiry": expiry_time}
     print(otp)
-    # send OTP email
-    email_response = send_login_otp_email(db_user.email, otp)
-    if not email_response.get("success"):
+    # queue OTP email; delivery and retries happen on the dispatcher's workers
+    if not queue_login_otp_email(db_user.email, otp):
         raise HTTPException(status_code=500, detail="Failed to send login OTP email")
 
     return {"message": "OTP sent to registered email. Use /verify-login-otp to complete login."}
@@ -107,8 +107,7 @@ def request_password_reset(email: str, db: Session = Depends(get_db)):
     expiry_time = time.time() + OTP_TTL_SECONDS
     password_reset_requests[email] = {"otp": otp, "expiry": expiry_time}
 
-    email_response = send_password_reset_email(email, otp)
-    if not email_response.get("success"):
+    if not queue_password_reset_email(email, otp):
         raise HTTPException(status_code=500, detail="Failed to send password reset OTP email")
 
     return {"message": "Password reset OTP sent to email."}
@@ -0,0 +1,42 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Depends, Query, status
+from fastapi.concurrency import run_in_threadpool
+
+from app import database as models, schemas
+from app.security import verify_token
+from app.ml_models.autocomplete import KINDS, get_autocomplete_index, is_current
+from app.services.metrics import timed_model_call
+from app.services.tracing import TracedRoute
+
+router = APIRouter(route_class=TracedRoute)
+
+
+@router.get("/autocomplete", response_model=schemas.AutocompleteOut, tags=["Autocomplete"])
+async def autocomplete(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    kind: Optional[List[str]] = Query(None),
+    current_user: models.User = Depends(verify_token)
+):
+    """
+    Type-ahead suggestions for drug names, ingredients and RXCUIs: prefix
+    matches first, then fuzzy matches by trigram similarity. Lookups are pure
+    in-memory work, so they run on the event loop instead of a threadpool.
+    """
+    if kind and set(kind) - set(KINDS):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"kind must be one of {', '.join(KINDS)}"
+        )
+
+    # Only the first request after a model swap rebuilds, off the event loop.
+    index = get_autocomplete_index() if is_current() else await run_in_threadpool(get_autocomplete_index)
+    if not len(index):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="No models are loaded to suggest drugs from."
+        )
+    with timed_model_call("autocomplete"):
+        suggestions = index.suggest(q, limit, kind)
+    return {"query": q, "suggestions": suggestions}
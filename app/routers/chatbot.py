@@ -1,41 +1,222 @@
+import asyncio
+import json
 import os
-from fastapi import APIRouter, HTTPException
+import threading
+import time
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 import google.generativeai as genai
+import requests
+from google.api_core import exceptions as google_exceptions
 from app.schemas import ChatRequest, ChatResponse
+from app.services.chat_sessions import ChatSessionStore, ChatStreamMetrics
+from app.services.tracing import TracedRoute
 
 load_dotenv()
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
 if not GOOGLE_API_KEY:
     raise RuntimeError("GOOGLE_API_KEY environment variable not set.")
 
-genai.configure(api_key=GOOGLE_API_KEY)
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash-latest")
+# Point at a local fake LLM server for tests, e.g. GEMINI_API_ENDPOINT=127.0.0.1:8081 GEMINI_TRANSPORT=rest
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+GEMINI_TRANSPORT = os.getenv("GEMINI_TRANSPORT")
+CHAT_MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", 8))
+CHAT_TIMEOUT_SECONDS = float(os.getenv("CHAT_TIMEOUT_SECONDS", 60))
+# How often a stream checks for a gone client while no token is arriving.
+CHAT_DISCONNECT_POLL_SECONDS = float(os.getenv("CHAT_DISCONNECT_POLL_SECONDS", 1))
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", 1000))
+CHAT_SESSION_TTL_SECONDS = float(os.getenv("CHAT_SESSION_TTL_SECONDS", 1800))
 
-chat_histories = {}
+genai.configure(
+    api_key=GOOGLE_API_KEY,
+    transport=GEMINI_TRANSPORT,
+    client_options={"api_endpoint": GEMINI_API_ENDPOINT} if GEMINI_API_ENDPOINT else None,
+)
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat_with_bot(request: ChatRequest):
 
+class _DeadlineModel(genai.GenerativeModel):
+    """
+    Puts CHAT_TIMEOUT_SECONDS on every upstream request. ChatSession.send_message
+    takes no request_options in this SDK version, so it is added here.
+    """
+
+    def generate_content(self, *args, request_options=None, **kwargs):
+        request_options = {"timeout": CHAT_TIMEOUT_SECONDS, **(request_options or {})}
+        return super().generate_content(*args, request_options=request_options, **kwargs)
+
+
+# One model client for the whole process; chat sessions are cheap views over it.
+model = _DeadlineModel(GEMINI_MODEL_NAME)
+
+chat_histories = ChatSessionStore(max_sessions=CHAT_MAX_SESSIONS, ttl_seconds=CHAT_SESSION_TTL_SECONDS)
+# Taken and released on the worker thread that calls Gemini, so a slot stays
+# held until the upstream call has really finished.
+_upstream_slots = threading.BoundedSemaphore(CHAT_MAX_CONCURRENCY)
+stream_metrics = ChatStreamMetrics()
+
+_UPSTREAM_TIMEOUTS = (google_exceptions.DeadlineExceeded, requests.exceptions.Timeout, TimeoutError)
+
+
+class ChatBusyError(Exception):
+    """No upstream slot became free within CHAT_TIMEOUT_SECONDS."""
+
+
+def _with_upstream_slot(fn, *args):
+    if not _upstream_slots.acquire(timeout=CHAT_TIMEOUT_SECONDS):
+        raise ChatBusyError()
     try:
+        return fn(*args)
+    finally:
+        _upstream_slots.release()
+
+
+def gemini_token_source(chat, message: str):
+    """Yields reply text chunks from Gemini as they arrive."""
+    for chunk in chat.send_message(message, stream=True):
+        if chunk.text:
+            yield chunk.text
 
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')
 
-        if request.session_id not in chat_histories:
-            chat_histories[request.session_id] = model.start_chat(history=[])
+def stub_token_source(chat, message: str, delay: float = 0.05):
+    """Provider stand-in for tests: echoes the message back word by word."""
+    for word in f"You said: {message}".split(" "):
+        time.sleep(delay)
+        yield word + " "
 
-        chat_session = chat_histories[request.session_id]
 
-        response = chat_session.send_message(request.message)
+def get_token_source():
+    """Dependency that picks the streaming provider; override it in tests or set CHAT_STREAM_STUB=1."""
+    if os.getenv("CHAT_STREAM_STUB") == "1":
+        return stub_token_source
+    return gemini_token_source
 
+
+def _sse(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@router.post("/chat", response_model=ChatResponse)
+async def chat_with_bot(request: ChatRequest):
+
+    entry = chat_histories.get_or_create(request.session_id, lambda: model.start_chat(history=[]))
+
+    try:
+        async with entry.lock:
+            # The SDK call blocks, so it runs on the threadpool instead of the event loop.
+            # It carries its own deadline, so the thread is never left running on its own.
+            response = await run_in_threadpool(_with_upstream_slot, entry.chat.send_message, request.message)
         return ChatResponse(reply=response.text)
 
+    except ChatBusyError:
+        raise HTTPException(status_code=503, detail="The assistant is busy. Please try again shortly.")
+
+    except _UPSTREAM_TIMEOUTS:
+        print(f"Chat request timed out for session {request.session_id}")
+        raise HTTPException(status_code=504, detail="The assistant took too long to respond. Please try again.")
+
     except Exception as e:
 
         print(f"An error occurred: {e}")
-     
+
         raise HTTPException(status_code=500, detail="An error occurred while processing your request.")
 
+
+@router.post("/chat/stream")
+async def chat_with_bot_stream(
+        request: ChatRequest,
+        http_request: Request,
+        token_source=Depends(get_token_source),
+):
+    """
+    Streams the reply as Server-Sent Events: one `data: {"token": ...}` event
+    per upstream chunk, then a `done` event carrying the timing. The client
+    connection is checked every CHAT_DISCONNECT_POLL_SECONDS, tokens or not;
+    once it is gone, the upstream iteration is stopped at the next chunk.
+    """
+    entry = chat_histories.get_or_create(request.session_id, lambda: model.start_chat(history=[]))
+
+    async def event_stream():
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        stop = threading.Event()
+        finished = object()
+        started = time.perf_counter()
+        ttft = None
+        outcome = "cancelled"
+
+        def produce():
+            for text in token_source(entry.chat, request.message):
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, text)
+
+        def produce_with_slot():
+            try:
+                _with_upstream_slot(produce)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, finished)
+
+        try:
+            async with entry.lock:
+                producer = asyncio.ensure_future(run_in_threadpool(produce_with_slot))
+                stalled_at = loop.time() + CHAT_TIMEOUT_SECONDS
+                while True:
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout=CHAT_DISCONNECT_POLL_SECONDS)
+                    except asyncio.TimeoutError:
+                        if await http_request.is_disconnected():
+                            return
+                        if loop.time() < stalled_at:
+                            continue
+                        item = TimeoutError("upstream stalled")
+                    if item is finished:
+                        break
+                    if isinstance(item, Exception):
+                        outcome = "error"
+                        print(f"An error occurred while streaming: {item}")
+                        yield _sse({"detail": "An error occurred while processing your request."}, event="error")
+                        return
+                    if await http_request.is_disconnected():
+                        return
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+                    stalled_at = loop.time() + CHAT_TIMEOUT_SECONDS
+                    yield _sse({"token": item})
+                await producer
+                outcome = "completed"
+                duration = time.perf_counter() - started
+                yield _sse({
+                    "ttft_ms": round(ttft * 1000, 2) if ttft is not None else None,
+                    "duration_ms": round(duration * 1000, 2),
+                }, event="done")
+        finally:
+            stop.set()
+            if outcome != "completed":
+                # A partially consumed reply leaves the history unresolved; start the session afresh.
+                chat_histories.discard(request.session_id)
+            stream_metrics.record(outcome, ttft, time.perf_counter() - started)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/chat/stats")
+async def chat_stats():
+    return {
+        **chat_histories.stats(),
+        "max_concurrency": CHAT_MAX_CONCURRENCY,
+        "streaming": stream_metrics.snapshot(),
+    }
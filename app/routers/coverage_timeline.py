@@ -0,0 +1,32 @@
+from fastapi import APIRouter, HTTPException, Depends, status
+
+from app import database as models, schemas
+from app.security import verify_token
+from app.ml_models.registry import lease
+from app.ml_models.coverage_timeline_helper import CoverageTimeline
+from app.services.tracing import TracedRoute
+
+router = APIRouter(route_class=TracedRoute)
+
+
+@router.get("/coverage-timeline/{rxcui}", response_model=schemas.CoverageTimelineResponse, tags=["Formulary_Impact"])
+def get_coverage_timeline(
+    rxcui: str,
+    current_user: models.User = Depends(verify_token)
+):
+    """
+    Month-by-month plan count, state coverage, tier range and PA/ST/QL shares
+    for one drug, served from the precomputed timeline artifact.
+    """
+    with lease("coverage_timeline", timed=True) as model:
+        model: CoverageTimeline
+        if not model:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The Coverage Timeline is not available. Build it with app.ml_models.coverage_timeline_helper."
+            )
+
+        result = model.timeline(rxcui)
+    if result["status"] != "success":
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=result["message"])
+    return result
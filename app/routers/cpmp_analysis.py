@@ -2,12 +2,30 @@ from fastapi import APIRouter, HTTPException, Depends, status
 from app import schemas
 from app.database import User
 from app.security import verify_token
-from app.ml_models.registry import ml_models
+from app.ml_models.registry import lease, ml_models
 from app.ml_models.therapeutic_eq_helper import PBMRecommender
 from app.ml_models.cpmp_helper import CPMPCalculator
-router = APIRouter()
+from app.ml_models.executor import model_executor
+from app.services.tracing import TracedRoute
+router = APIRouter(route_class=TracedRoute)
+
+# Each drug in a projection is one ARIMA forecast; cap the portfolio so a request stays interactive.
+PROJECTION_MAX_DRUGS = 500
+
+
+def _analyze_savings(rxcui: int, current_cost: float, utilization_rate: float):
+    """Runs on a model worker process, against that process's copy of the registry."""
+    with lease("therapeutic_equivalence") as recommender:
+        cpmp_calculator = CPMPCalculator(recommender=recommender)
+        return cpmp_calculator.analyze_savings_from_single_rxcui(
+            rxcui=rxcui,
+            current_cost=current_cost,
+            utilization_rate=utilization_rate
+        )
+
+
 @router.post("/savings-analysis", response_model=schemas.CPMPSavingsResponse, tags=["CPMP Analysis"])
-def get_cpmp_savings_analysis(
+async def get_cpmp_savings_analysis(
     request: schemas.CPMPSavingsRequest,
     current_user: User = Depends(verify_token)
 ):
@@ -18,13 +36,51 @@ def get_cpmp_savings_analysis(
             detail="The Therapeutic Equivalence model is not available, which is required for this analysis."
         )
 
-    cpmp_calculator = CPMPCalculator(recommender=recommender_model)
-
     # Call the new dedicated analysis function in the helper
-    result = cpmp_calculator.analyze_savings_from_single_rxcui(
+    result = await model_executor.run(
+        "therapeutic_equivalence", _analyze_savings,
         rxcui=request.rxcui,
         current_cost=request.current_cost,
         utilization_rate=request.utilization_rate
     )
 
-    return result
\ No newline at end of file
+    return result
+
+
+def _project_portfolio(items: list, years: int, basis: str, member_count: int):
+    """Runs on a model worker process, against that process's copy of the registry."""
+    with lease("therapeutic_equivalence") as recommender, lease("drug_utilization") as forecaster:
+        cpmp_calculator = CPMPCalculator(recommender=recommender, member_count=member_count)
+        return cpmp_calculator.project_portfolio(items, forecaster, years, basis)
+
+
+@router.post("/cpmp-projection", response_model=schemas.CPMPProjectionResponse, tags=["CPMP Analysis"])
+async def get_cpmp_projection(
+    request: schemas.CPMPProjectionRequest,
+    current_user: User = Depends(verify_token)
+):
+    """
+    Projects CPMP and savings per future year for a portfolio: utilization
+    follows each drug's forecast claims (or beneficiaries), and costs switch
+    to each drug's best therapeutic alternative.
+    """
+    for key, name in (("therapeutic_equivalence", "Therapeutic Equivalence"),
+                      ("drug_utilization", "Drug Utilization Forecast")):
+        if not ml_models.get(key):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"The {name} model is not available, which is required for this analysis."
+            )
+    if len(request.items) > PROJECTION_MAX_DRUGS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A projection covers at most {PROJECTION_MAX_DRUGS} drugs; split larger portfolios across several requests."
+        )
+
+    return await model_executor.run(
+        "drug_utilization", _project_portfolio,
+        items=[item.model_dump() for item in request.items],
+        years=request.years,
+        basis=request.basis,
+        member_count=request.member_count
+    )
@@ -0,0 +1,144 @@
+import asyncio
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from app import database as models, schemas
+from app.deps import get_db
+from app.security import verify_token
+from app.ml_models.executor import model_executor
+from app.ml_models.registry import lease, ml_models, model_version
+from app.ml_models.result_cache import cached_model_call, result_cache
+from app.ml_models.single_flight import single_flight
+from app.ml_models.cpmp_helper import CPMPCalculator
+from app.routers import regional_disparity_analysis, formulary_detail_analysis, therapeutic_equivalence
+from app.services.tracing import TracedRoute
+
+router = APIRouter(route_class=TracedRoute)
+
+REQUIRED_MODELS = ("regional_disparity", "formulary_analyzer", "therapeutic_equivalence")
+
+
+async def _timed(timings: dict, name: str, awaitable):
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[name] = round((time.perf_counter() - started) * 1000, 2)
+
+
+def _regional_and_formulary(rxcui: str):
+    """
+    Runs on a model worker process: slices the drug's formulary rows and
+    covering plans once and hands them to both analyses. The artifacts are
+    reloaded independently, so the slice is only shared while both were
+    built from the same tables; otherwise each model reads its own.
+    """
+    with lease("regional_disparity") as regional_model, lease("formulary_analyzer") as formulary_model:
+        drug_coverage, covering_plans = regional_model.drug_slice(rxcui)
+        regional = regional_model.predict(rxcui, drug_coverage, covering_plans)
+        if formulary_model.slice_fingerprint() == regional_model.slice_fingerprint():
+            formulary = formulary_model.predict(rxcui, drug_coverage, covering_plans)
+        else:
+            formulary = formulary_model.predict(rxcui)
+        return regional, formulary
+
+
+async def _coverage(rxcui: str):
+    """Returns (regional, formulary), cached per version of both models."""
+    normalized_input = ("regional+formulary", rxcui, model_version("formulary_analyzer"))
+    return await result_cache.get_or_compute(
+        "drug-profile", "regional_disparity", normalized_input,
+        lambda: single_flight.run(
+            "drug-profile", "regional_disparity", normalized_input,
+            lambda: model_executor.run("regional_disparity", _regional_and_formulary, rxcui),
+        ),
+        cacheable=lambda results: all(r.get("status") != "error" for r in results),
+    )
+
+
+async def _therapeutic(rxcui: str, cost):
+    """Returns (cost analyzed, recommendation), looking up the RXCUI's own listed cost when none is given."""
+    if not rxcui.isdigit():
+        return cost, {"rxcui": rxcui, "message": "Invalid RXCUI"}
+    rxcui_int = int(rxcui)
+    if cost is None:
+        cost = await cached_model_call(
+            "drug-profile", "therapeutic_equivalence", "reference_cost", ("reference_cost", rxcui_int), rxcui_int
+        )
+        if cost is None:
+            return None, {"rxcui": rxcui_int, "message": "RXCUI not found in dataset."}
+    # Same endpoint name and input as /api/therapeutic-equivalence, so both share cache entries and flights.
+    result = await cached_model_call(
+        "therapeutic-equivalence", "therapeutic_equivalence", "recommend_by_rxcui",
+        (rxcui_int, float(cost)), rxcui=rxcui_int, cost=cost
+    )
+    return cost, result
+
+
+def _log_profile(db: Session, rxcui: str, regional: dict, formulary: dict, therapeutic: dict, user_id: int):
+    entries = []
+    if regional.get("status") != "error":
+        entries.append(regional_disparity_analysis.build_log_entry(rxcui, regional, user_id))
+    entries.append(formulary_detail_analysis.build_log_entry(formulary, user_id))
+    if therapeutic.get("alternatives"):
+        entries.append(therapeutic_equivalence.build_log_entry(therapeutic, user_id))
+    db.add_all(entries)
+    db.commit()
+
+
+@router.get("/drug-profile/{rxcui}", response_model=schemas.DrugProfileResponse, tags=["Drug Profile"])
+async def get_drug_profile(
+        rxcui: str,
+        cost: float = Query(None, gt=0, description="Cost to compare alternatives against; defaults to the drug's listed cost."),
+        utilization_rate: float = Query(1.0, ge=0),
+        db: Session = Depends(get_db),
+        current_user: models.User = Depends(verify_token)
+):
+    """
+    Regional disparity, formulary detail, therapeutic alternatives and CPMP
+    savings for one RXCUI in a single call. The token and user are resolved
+    once, regional and formulary detail share one slice of the drug's
+    formulary rows and plans while the therapeutic lookup runs concurrently,
+    CPMP is derived from the therapeutic result instead of recomputing it,
+    and all log rows are committed in one transaction.
+    """
+    missing = [key for key in REQUIRED_MODELS if not ml_models.get(key)]
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Required models are not available: {', '.join(missing)}."
+        )
+
+    rxcui = rxcui.strip()
+    timings = {}
+    started = time.perf_counter()
+
+    (regional, formulary), (cost_analyzed, therapeutic) = await asyncio.gather(
+        _timed(timings, "regional_formulary", _coverage(rxcui)),
+        _timed(timings, "therapeutic", _therapeutic(rxcui, cost)),
+    )
+
+    cpmp = None
+    if cost_analyzed is not None and not therapeutic.get("message"):
+        with lease("therapeutic_equivalence", timed=True) as recommender:
+            calculator = CPMPCalculator(recommender=recommender)
+            cpmp = calculator.savings_from_recommendation(therapeutic, int(rxcui), cost_analyzed, utilization_rate)
+
+    await _timed(timings, "log_commit", run_in_threadpool(
+        _log_profile, db, rxcui, regional, formulary, therapeutic, current_user.id
+    ))
+    timings["total"] = round((time.perf_counter() - started) * 1000, 2)
+
+    return {
+        "rxcui": rxcui,
+        "cost_analyzed": cost_analyzed,
+        "utilization_rate_analyzed": utilization_rate,
+        "regional": regional,
+        "formulary": formulary,
+        "therapeutic": therapeutic,
+        "cpmp": cpmp,
+        "timings_ms": timings,
+    }
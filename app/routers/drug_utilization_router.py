@@ -5,10 +5,11 @@ from sqlalchemy.orm import Session
 from app import database as models, schemas
 from app.deps import get_db
 from app.security import verify_token
-from app.ml_models.registry import ml_models
+from app.ml_models.registry import lease
 from app.ml_models.drug_utilization_helper import DrugUtilizationForecaster
+from app.services.tracing import TracedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 @router.post("/drug-utilization-forecast", response_model=schemas.DrugUtilizationResponse, tags=["Drug Utilization Forecast"])
 def get_drug_utilization_forecast(
@@ -21,15 +22,16 @@ def get_drug_utilization_forecast(
     for a specified number of future years. This endpoint requires authentication.
     """
     # Retrieve the loaded model from the central registry
-    model: DrugUtilizationForecaster = ml_models.get("drug_utilization")
-    if not model:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="The Drug Utilization Forecast model is not available."
-        )
+    with lease("drug_utilization", timed=True) as model:
+        model: DrugUtilizationForecaster
+        if not model:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The Drug Utilization Forecast model is not available."
+            )
 
-    # Call the model's prediction method with user input
-    result = model.forecast_drug(drug_name=request.drug_name, steps=request.steps)
+        # Call the model's prediction method with user input
+        result = model.forecast_drug(drug_name=request.drug_name, steps=request.steps)
 
     # Handle cases where the model returns an error (e.g., drug not found)
     if result.get("error"):
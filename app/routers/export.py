@@ -0,0 +1,86 @@
+from datetime import datetime
+from typing import Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi.responses import StreamingResponse
+
+from app import database as models
+from app.security import verify_token
+from app.ml_models.registry import lease, ml_models
+from app.routers.um_change_router import COMPARISON_MAP
+from app.services.columnar_export import (
+    EXPORT_BATCH_ROWS,
+    EXPORT_DATASETS,
+    FORMATS,
+    UM_CHANGE_SCHEMA,
+    build_export_query,
+    iter_query_batches,
+    schema_for,
+    stream_batches,
+    um_change_batches,
+)
+from app.services.tracing import TracedRoute
+
+router = APIRouter(route_class=TracedRoute)
+
+
+def _columnar_response(batches, schema, fmt: str, name: str):
+    extension = "parquet" if fmt == "parquet" else "arrows"
+    return StreamingResponse(
+        stream_batches(batches, schema, fmt),
+        media_type=FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{extension}"'},
+    )
+
+
+@router.get("/export/um-change/{comparison_period}", tags=["Export"])
+def export_um_changes(
+    comparison_period: str,
+    format: Literal["arrow", "parquet"] = "arrow",
+    batch_rows: int = EXPORT_BATCH_ROWS,
+    current_user: models.User = Depends(verify_token)
+):
+    """Every change of a UM comparison as an Arrow IPC stream or a Parquet file."""
+    if comparison_period not in COMPARISON_MAP:
+        raise HTTPException(status_code=404, detail=f"Comparison period '{comparison_period}' not found.")
+    analyzer = ml_models.get(COMPARISON_MAP[comparison_period])
+    if not analyzer or not analyzer.monthly_analyses:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Analyzer for '{comparison_period}' is not available."
+        )
+    def batches():
+        # Pinned for the whole stream, which outlives the handler.
+        with lease(COMPARISON_MAP[comparison_period]) as leased:
+            yield from um_change_batches(leased, max(1, batch_rows))
+
+    return _columnar_response(batches(), UM_CHANGE_SCHEMA, format, f"um_change_{comparison_period}")
+
+
+@router.get("/export/{dataset}", tags=["Export"])
+def export_analysis_history(
+    dataset: str,
+    format: Literal["arrow", "parquet"] = "arrow",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    user_id: Optional[int] = None,
+    batch_rows: int = EXPORT_BATCH_ROWS,
+    current_user: models.User = Depends(verify_token)
+):
+    """
+    Streams logged analyses as an Arrow IPC stream or a Parquet file. Rows
+    come off a server-side cursor in batches of `batch_rows`, so neither the
+    API nor the client ever holds the full history in memory. Users export
+    their own history; superusers may export everyone's or pick a `user_id`.
+    """
+    if dataset not in EXPORT_DATASETS:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown dataset '{dataset}'. Choose from {sorted(EXPORT_DATASETS)}."
+        )
+    if not current_user.is_superuser:
+        user_id = current_user.id
+
+    stmt = build_export_query(dataset, since, until, user_id)
+    batches = iter_query_batches(stmt, max(1, batch_rows))
+    return _columnar_response(batches, schema_for(stmt), format, dataset.replace("-", "_"))
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Query
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
@@ -7,7 +8,9 @@ from app import database as models
 from app import schemas
 from app.deps import get_db
 from app.security import verify_token
-from app.ml_models.registry import ml_models
+from app.ml_models.registry import lease, ml_models
+from app.ml_models.result_cache import cached_model_call
+from app.services.tracing import TracedRoute
 
 
 # Pydantic model for the incoming request body
@@ -15,30 +18,14 @@ class FormularyAnalyserIn(BaseModel):
     rxcui: str
 
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 
-@router.post("/formulary-analyser", response_model=schemas.FormularyDetailOut, tags=["Analysis"])
-def analyze_formulary(
-        request: FormularyAnalyserIn,
-        db: Session = Depends(get_db),
-        current_user: models.User = Depends(verify_token)
-):
-
-    model = ml_models.get("formulary_analyzer")
-    if not model:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="The Formulary Analyser model is not available."
-        )
-
-    result = model.predict(request.rxcui)
-
+def build_log_entry(result: dict, user_id: int):
     cost_data = result.get("patient_cost", {})  # Use .get() for safety
     geo_data = result.get("geography", {})
 
-
-    db_analysis = models.FormularyDetailAnalysis(
+    return models.FormularyDetailAnalysis(
         drug_rxcui=result.get("drug_rxcui"),
         status=result.get("status"),
         plan_name=result.get("plan_name"),
@@ -52,13 +39,36 @@ def analyze_formulary(
         county_code=geo_data.get("county_code"),
 
 
-        user_id=current_user.id
+        user_id=user_id
     )
 
+
+def _log_analysis(db: Session, result: dict, user_id: int):
+    db_analysis = build_log_entry(result, user_id)
     db.add(db_analysis)
     db.commit()
     db.refresh(db_analysis)
 
+
+@router.post("/formulary-analyser", response_model=schemas.FormularyDetailOut, tags=["Analysis"])
+async def analyze_formulary(
+        request: FormularyAnalyserIn,
+        db: Session = Depends(get_db),
+        current_user: models.User = Depends(verify_token)
+):
+
+    model = ml_models.get("formulary_analyzer")
+    if not model:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The Formulary Analyser model is not available."
+        )
+
+    rxcui = request.rxcui.strip()
+    result = await cached_model_call("formulary-analyser", "formulary_analyzer", "predict", rxcui, rxcui)
+
+    await run_in_threadpool(_log_analysis, db, result, current_user.id)
+
     if result.get("status") != "covered":
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -69,3 +79,57 @@ def analyze_formulary(
 
     return result
 
+
+@router.get("/cheapest-plans/{county_code}/{rxcui}", response_model=schemas.CheapestPlansOut, tags=["Analysis"])
+def find_cheapest_plans(
+        county_code: str,
+        rxcui: str,
+        top_k: int = Query(10, ge=1, le=200),
+        current_user: models.User = Depends(verify_token)
+):
+    """
+    Plans in a county that cover the drug: copay plans by preferred 30-day
+    amount, then coinsurance plans by rate, each then by lowest tier and
+    fewest restrictions. Served from the analyzer's precomputed plan index.
+    """
+    with lease("formulary_analyzer", timed=True) as model:
+        if not model:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The Formulary Analyser model is not available."
+            )
+
+        result = model.cheapest_plans(rxcui.strip(), county_code.strip(), top_k)
+    if result.get("status") != "covered":
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=result.get("message", "No covering plan found.")
+        )
+    return result
+
+
+@router.post("/basket-coverage", response_model=schemas.BasketCoverageOut, tags=["Analysis"])
+def find_basket_coverage(
+        request: schemas.BasketCoverageRequest,
+        current_user: models.User = Depends(verify_token)
+):
+    """
+    Plans whose formulary covers every drug in the basket, optionally limited
+    to a state or county, fewest restrictions first.
+    """
+    with lease("formulary_analyzer", timed=True) as model:
+        if not model:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The Formulary Analyser model is not available."
+            )
+
+        result = model.plans_covering_basket(request.rxcuis, request.state, request.county_code, request.limit)
+    if result.get("status") == "not_covered":
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail={"message": result["message"], "not_covered_rxcuis": result["not_covered_rxcuis"]}
+        )
+    if result.get("status") == "error":
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=result["message"])
+    return result
@@ -0,0 +1,140 @@
+import os
+import shutil
+import uuid
+
+from fastapi import APIRouter, HTTPException, Depends, status, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+
+from app import database as models, schemas
+from app.deps import get_db
+from app.security import verify_token
+from app.services.jobs import job_manager, JobLimitExceeded, JOB_DIR
+from app.services.tracing import TracedRoute
+
+router = APIRouter(route_class=TracedRoute)
+
+
+def _get_job(db: Session, job_id: str, current_user: models.User) -> models.AnalysisJob:
+    job = db.get(models.AnalysisJob, job_id)
+    if job is None or (job.user_id != current_user.id and not current_user.is_superuser):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+    return job
+
+
+async def _submit(current_user: models.User, job_type: str, params: dict, job_id: str = None):
+    try:
+        return await run_in_threadpool(job_manager.submit, current_user.id, job_type, params, job_id)
+    except JobLimitExceeded as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+
+@router.post("/jobs/claims-scoring", response_model=schemas.JobOut, status_code=202, tags=["Jobs"])
+async def submit_claims_scoring(
+    file: UploadFile = File(..., description="CSV or .parquet claims file"),
+    rxcui_column: str = "RXCUI",
+    cost_column: str = "cost",
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(verify_token)
+):
+    """Queues bulk therapeutic-equivalence scoring of a claims file; the result is a Parquet file."""
+    job_id = str(uuid.uuid4())
+    directory = os.path.join(JOB_DIR, job_id)
+    suffix = ".parquet" if (file.filename or "").lower().endswith(".parquet") else ".csv"
+    input_path = os.path.join(directory, f"input{suffix}")
+
+    def save_upload():
+        os.makedirs(directory, exist_ok=True)
+        with open(input_path, "wb") as out:
+            shutil.copyfileobj(file.file, out, 1024 * 1024)
+
+    await run_in_threadpool(save_upload)
+    params = {"input_path": input_path, "rxcui_column": rxcui_column, "cost_column": cost_column}
+    try:
+        await _submit(current_user, "claims_scoring", params, job_id)
+    except HTTPException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    return _get_job(db, job_id, current_user)
+
+
+@router.post("/jobs/regional-scan", response_model=schemas.JobOut, status_code=202, tags=["Jobs"])
+async def submit_regional_scan(
+    request: schemas.RegionalScanJobRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(verify_token)
+):
+    """Queues a regional disparity scan of the given RXCUIs, or of the whole catalog if none are given."""
+    job_id = await _submit(current_user, "regional_scan", {"rxcuis": request.rxcuis})
+    return _get_job(db, job_id, current_user)
+
+
+@router.post("/jobs/cpmp-portfolio", response_model=schemas.JobOut, status_code=202, tags=["Jobs"])
+async def submit_cpmp_portfolio(
+    request: schemas.CPMPPortfolioJobRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(verify_token)
+):
+    """Queues a CPMP savings analysis for every drug in a portfolio."""
+    items = [item.model_dump() for item in request.items]
+    job_id = await _submit(current_user, "cpmp_portfolio", {"items": items})
+    return _get_job(db, job_id, current_user)
+
+
+@router.get("/jobs", response_model=list[schemas.JobOut], tags=["Jobs"])
+def list_jobs(
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(verify_token)
+):
+    return (
+        db.query(models.AnalysisJob)
+        .filter(models.AnalysisJob.user_id == current_user.id)
+        .order_by(models.AnalysisJob.created_at.desc())
+        .limit(min(limit, 500))
+        .all()
+    )
+
+
+@router.get("/jobs/{job_id}", response_model=schemas.JobOut, tags=["Jobs"])
+def get_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(verify_token)
+):
+    return _get_job(db, job_id, current_user)
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=schemas.JobOut, tags=["Jobs"])
+def cancel_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(verify_token)
+):
+    """Requests cancellation. A running job stops at its next progress update."""
+    _get_job(db, job_id, current_user)
+    return job_manager.cancel(job_id)
+
+
+@router.get("/jobs/{job_id}/result", tags=["Jobs"])
+def download_job_result(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(verify_token)
+):
+    job = _get_job(db, job_id, current_user)
+    if job.status != "succeeded":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Job is {job.status}; results are available once it has succeeded."
+        )
+    if not job.result_path or not os.path.exists(job.result_path):
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="The result file is no longer available.")
+    return FileResponse(
+        job.result_path,
+        media_type="application/vnd.apache.parquet",
+        filename=f"{job.job_type}_{job.id}.parquet",
+    )
@@ -1,17 +1,59 @@
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from contextlib import contextmanager
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from app import schemas, database as models
 from app.deps import get_db
 from app.security import verify_token
 
 
-from app.ml_models.registry import ml_models
+from app.ml_models.registry import lease, ml_models, artifact_versions
+from app.ml_models.result_cache import cached_model_call
+from app.services.metrics import timed_model_call
+from app.services.tracing import TracedRoute
+
+router = APIRouter(route_class=TracedRoute)
+
+def build_log_entry(input_rxcui: str, analysis_result: dict, user_id: int):
+    return models.RegionalDisparityAnalysis(
+        input_rxcui=input_rxcui,
+        rxcui=analysis_result.get("rxcui"),
+        status=analysis_result.get("status"),
+        total_plans_covering_drug=analysis_result.get("total_plans_covering_drug"),
+        states_with_coverage=analysis_result.get("states_with_coverage"),
+        coverage_gap_percentage=analysis_result.get("coverage_gap_percentage"),
+        drug_tier=analysis_result.get("drug_tier"),
+        prior_auth_required=analysis_result.get("prior_auth_required"),
+        step_therapy_required=analysis_result.get("step_therapy_required"),
+        missing_states=", ".join(analysis_result.get("missing_states", [])),
+        disparity_message=analysis_result.get("disparity_message"),
+        user_id=user_id
+    )
+
+
+def _log_analysis(db: Session, input_rxcui: str, analysis_result: dict, user_id: int):
+    db_analysis = build_log_entry(input_rxcui, analysis_result, user_id)
+    db.add(db_analysis)
+    db.commit()
+    db.refresh(db_analysis)
+
+
+@contextmanager
+def _current_catalog():
+    """The precomputed catalog, if one was built from the regional model artifact loaded right now."""
+    with lease("regional_catalog") as catalog:
+        if catalog is not None and catalog.source_version == artifact_versions.get("regional_disparity"):
+            with timed_model_call("regional_catalog"):
+                yield catalog
+        else:
+            yield None
 
-router = APIRouter()
 
 @router.post("/analyze", response_model=schemas.Regional_out)
-def analyze_drug(
+async def analyze_drug(
         request: schemas.Regional_in,
         db: Session = Depends(get_db),
         current_user: models.User = Depends(verify_token)
@@ -27,7 +69,11 @@ def analyze_drug(
         )
 
 
-    analysis_result = model.predict(request.rxcui)
+    rxcui = request.rxcui.strip()
+    with _current_catalog() as catalog:
+        analysis_result = catalog.predict(rxcui) if catalog is not None else None
+    if analysis_result is None:
+        analysis_result = await cached_model_call("analyze", "regional_disparity", "predict", rxcui, rxcui)
 
     if analysis_result.get("status") == "error":
         raise HTTPException(
@@ -35,23 +81,73 @@ def analyze_drug(
             detail=analysis_result.get("message")
         )
 
-    db_analysis = models.RegionalDisparityAnalysis(
-        input_rxcui=request.rxcui,
-        rxcui=analysis_result.get("rxcui"),
-        status=analysis_result.get("status"),
-        total_plans_covering_drug=analysis_result.get("total_plans_covering_drug"),
-        states_with_coverage=analysis_result.get("states_with_coverage"),
-        coverage_gap_percentage=analysis_result.get("coverage_gap_percentage"),
-        drug_tier=analysis_result.get("drug_tier"),
-        prior_auth_required=analysis_result.get("prior_auth_required"),
-        step_therapy_required=analysis_result.get("step_therapy_required"),
-        missing_states=", ".join(analysis_result.get("missing_states", [])),
-        disparity_message=analysis_result.get("disparity_message"),
-        user_id=current_user.id
-    )
+    await run_in_threadpool(_log_analysis, db, request.rxcui, analysis_result, current_user.id)
+
+    return analysis_result
 
-    db.add(db_analysis)
-    db.commit()
-    db.refresh(db_analysis)
 
-    return analysis_result
\ No newline at end of file
+@contextmanager
+def _regional_model():
+    with lease("regional_disparity", timed=True) as model:
+        if not model:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The Regional Disparity model is not available. Check server logs."
+            )
+        yield model
+
+
+@router.get("/regional/coverage-difference", response_model=schemas.CoverageDifferenceOut)
+def coverage_difference(
+        state_a: str,
+        state_b: str,
+        limit: int = Query(500, ge=1, le=100_000),
+        current_user: models.User = Depends(verify_token)
+):
+    """Drugs covered in `state_a` but not in `state_b`."""
+    with _regional_model() as model:
+        result = model.coverage_difference(state_a.strip(), state_b.strip(), limit)
+    if result["status"] == "unknown_state":
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=result["message"])
+    if result["status"] == "error":
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=result["message"])
+    return result
+
+
+@router.get("/regional/coverage-gaps", response_model=schemas.CoverageGapsOut)
+def coverage_gaps(
+        top_n: int = Query(20, ge=1, le=1000),
+        min_states_covered: int = Query(1, ge=0),
+        current_user: models.User = Depends(verify_token)
+):
+    """Drugs with the widest regional gaps: covered in the fewest states, at least `min_states_covered`."""
+    with _regional_model() as model:
+        result = model.widest_gaps(top_n, min_states_covered)
+    if result["status"] == "error":
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=result["message"])
+    return result
+
+
+@router.get("/regional/catalog", response_model=schemas.RegionalCatalogOut)
+def regional_catalog(
+        tier: Optional[str] = None,
+        prior_auth: Optional[bool] = None,
+        step_therapy: Optional[bool] = None,
+        min_gap: Optional[float] = Query(None, ge=0, le=100),
+        max_gap: Optional[float] = Query(None, ge=0, le=100),
+        analysis_status: Optional[str] = Query(None, alias="status"),
+        limit: int = Query(100, ge=1, le=1000),
+        offset: int = Query(0, ge=0),
+        current_user: models.User = Depends(verify_token)
+):
+    """
+    Filters the precomputed full-catalog disparity report by tier, PA/ST and
+    coverage gap percentage, widest gaps first.
+    """
+    with _current_catalog() as catalog:
+        if catalog is None:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="No regional catalog matches the loaded model. Build it with app.ml_models.regional_catalog_helper."
+            )
+        return catalog.query(tier, prior_auth, step_therapy, min_gap, max_gap, analysis_status, limit, offset)
@@ -1,15 +1,54 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+import io
+import os
+import time
+
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Depends, status, UploadFile, File, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from app import database as models, schemas
 from app.deps import get_db
 from app.security import verify_token
-from app.ml_models.registry import ml_models
-from app.ml_models.therapeutic_eq_helper import PBMRecommender
+from app.ml_models.registry import lease, ml_models
+from app.ml_models.therapeutic_eq_helper import PBMRecommender, iter_claim_chunks
+from app.ml_models.result_cache import cached_model_call
+from app.services.tracing import TracedRoute
+
+router = APIRouter(route_class=TracedRoute)
+
+BULK_CHUNK_ROWS = int(os.getenv("BULK_CHUNK_ROWS", 100_000))
+
+def build_log_entry(result: dict, user_id: int):
+    db_log = models.TherapeuticEquivalentLog(
+        input_rxcui=result["input_rxcui"],
+        input_cost=result["input_cost"],
+        input_ingredient=result["ingredient"],
+        user_id=user_id
+    )
+
+    for alt in result["alternatives"]:
+        db_alternative = models.TherapeuticEquivalentAlternative(
+            ingredient=alt["Ingredient"],
+            alternative_rxcui=alt["Alternative_RXCUI"],
+            alternative_cost=alt["Alternative_cost"],
+            cost_difference=alt["Cost_difference"],
+            percentage_reduction=alt["Percentage_reduction"]
+        )
+        db_log.alternatives.append(db_alternative)
+    return db_log
+
+
+def _log_alternatives(db: Session, result: dict, user_id: int):
+    db_log = build_log_entry(result, user_id)
+    db.add(db_log)
+    db.commit()
+    db.refresh(db_log)
 
-router = APIRouter()
 
 @router.post("/therapeutic-equivalence", response_model=schemas.TherapeuticEquivalentResponse, tags=["Therapeutic Equivalence"])
-def get_therapeutic_equivalence(
+async def get_therapeutic_equivalence(
     request: schemas.TherapeuticEquivalentRequest,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(verify_token)
@@ -22,7 +61,10 @@ def get_therapeutic_equivalence(
             detail="The Therapeutic Equivalence model is not available."
         )
 
-    result = model.recommend_by_rxcui(rxcui=request.rxcui, cost=request.cost)
+    result = await cached_model_call(
+        "therapeutic-equivalence", "therapeutic_equivalence", "recommend_by_rxcui",
+        (request.rxcui, float(request.cost)), rxcui=request.rxcui, cost=request.cost
+    )
 
     if result.get("message"):
         raise HTTPException(
@@ -31,26 +73,90 @@ def get_therapeutic_equivalence(
         )
 
     if result.get("alternatives"):
-        db_log = models.TherapeuticEquivalentLog(
-            input_rxcui=result["input_rxcui"],
-            input_cost=result["input_cost"],
-            input_ingredient=result["ingredient"],
-            user_id=current_user.id
-        )
+        await run_in_threadpool(_log_alternatives, db, result, current_user.id)
+
+    return result
 
-        for alt in result["alternatives"]:
-            db_alternative = models.TherapeuticEquivalentAlternative(
-                ingredient=alt["Ingredient"],
-                alternative_rxcui=alt["Alternative_RXCUI"],
-                alternative_cost=alt["Alternative_cost"],
-                cost_difference=alt["Cost_difference"],
-                percentage_reduction=alt["Percentage_reduction"]
+
+@router.get("/therapeutic-equivalence/savings-leaderboard", response_model=schemas.SavingsLeaderboardOut,
+            tags=["Therapeutic Equivalence"])
+def savings_leaderboard(
+    top_n: int = Query(50, ge=1, le=1000),
+    ingredient: Optional[str] = None,
+    tier: Optional[float] = None,
+    current_user: models.User = Depends(verify_token)
+):
+    """
+    The largest per-unit savings across the whole formulary: every RXCUI
+    against the cheapest same-ingredient alternative at the same or a lower
+    tier. Served from the leaderboard the recommender builds at load.
+    """
+    with lease("therapeutic_equivalence", timed=True) as model:
+        model: PBMRecommender
+        if not model:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The Therapeutic Equivalence model is not available."
             )
-            db_log.alternatives.append(db_alternative)
+        return model.savings_leaderboard(top_n, ingredient, tier)
 
-        db.add(db_log)
-        db.commit()
-        db.refresh(db_log)
 
-    return result
+@router.post("/therapeutic-equivalence/bulk", tags=["Therapeutic Equivalence"])
+def score_claims_file(
+    file: UploadFile = File(..., description="CSV or .parquet claims file"),
+    rxcui_column: str = "RXCUI",
+    cost_column: str = "cost",
+    current_user: models.User = Depends(verify_token)
+):
+    """
+    Scores every (RXCUI, cost) row of an uploaded claims file for its best
+    cheaper therapeutic alternative and streams the scored rows back as CSV.
+    The file is read and scored chunk by chunk, so memory stays bounded by
+    BULK_CHUNK_ROWS whatever the file size. The last line is a `#` comment
+    with the row count and throughput.
+    """
+    if not ml_models.get("therapeutic_equivalence"):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The Therapeutic Equivalence model is not available."
+        )
+
+    # FastAPI closes uploads as soon as the handler returns, before a streamed body is sent,
+    # so take the spooled file over and close it ourselves when scoring is done.
+    source, file.file = file.file, io.BytesIO()
+    chunks = iter_claim_chunks(source, file.filename, rxcui_column, cost_column, BULK_CHUNK_ROWS)
+    try:
+        first_chunk = next(chunks, None)
+    except Exception as e:
+        source.close()
+        raise HTTPException(status_code=400, detail=f"Could not read claims file: {e}")
+
+    def scored_csv():
+        started = time.perf_counter()
+        rows = 0
+        with_alternative = 0
+        header = True
+        chunk = first_chunk
+        try:
+            # Pinned for the whole stream, which outlives the handler.
+            with lease("therapeutic_equivalence") as model:
+                model: PBMRecommender
+                while chunk is not None:
+                    scored = model.score_claims(chunk, rxcui_col=rxcui_column, cost_col=cost_column)
+                    rows += len(scored)
+                    with_alternative += int(scored["alternative_rxcui"].notna().sum())
+                    yield scored.to_csv(index=False, header=header)
+                    header = False
+                    chunk = next(chunks, None)
+        finally:
+            source.close()
+        elapsed = time.perf_counter() - started
+        rate = rows / elapsed if elapsed > 0 else 0.0
+        print(f"Bulk scoring: {rows} rows ({with_alternative} with alternatives) in {elapsed:.2f}s, {rate:.0f} rows/s")
+        yield f"# rows={rows} with_alternative={with_alternative} seconds={elapsed:.3f} rows_per_second={rate:.0f}\n"
 
+    return StreamingResponse(
+        scored_csv(),
+        media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="scored_claims.csv"'},
+    )
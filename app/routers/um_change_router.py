@@ -9,10 +9,11 @@ from app import database as models
 from app.security import verify_token
 
 # Import the model registry and the helper class directly
-from app.ml_models.registry import ml_models
+from app.ml_models.registry import lease
 from app.ml_models.um_change_analyzer_helper import UMFormularyChangesAnalyzer
+from app.services.tracing import TracedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 # This mapping connects the URL path to the key used in main.py's startup event
 COMPARISON_MAP = {
@@ -49,9 +50,11 @@ def get_um_analysis(
     if comparison_period not in COMPARISON_MAP:
         raise HTTPException(status_code=404, detail=f"Comparison period '{comparison_period}' not found.")
 
-    comparison_key = COMPARISON_MAP[comparison_period]
-    analyzer: UMFormularyChangesAnalyzer = ml_models.get(comparison_key)
+    with lease(COMPARISON_MAP[comparison_period], timed=True) as analyzer:
+        return _run_analysis(analyzer, comparison_period, analysis_type)
 
+
+def _run_analysis(analyzer: UMFormularyChangesAnalyzer, comparison_period: str, analysis_type: AnalysisType):
     if not analyzer:
         raise HTTPException(status_code=503,
                             detail=f"Analyzer for '{comparison_period}' is not available. Ensure the training script has been run.")
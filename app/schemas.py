@@ -1,4 +1,5 @@
-from typing import Optional, List, Dict, Literal
+from typing import Optional, List, Dict, Literal, Any
+from datetime import datetime
 
 from pydantic import BaseModel, Field,EmailStr
 
@@ -48,6 +49,29 @@ class Regional_in(BaseModel):
     rxcui: str
 
 
+class RegionalCatalogOut(BaseModel):
+    total: int
+    built_at: Optional[str] = None
+    build_seconds: Optional[float] = None
+    drugs: List[Regional_out]
+
+class CoverageDifferenceOut(BaseModel):
+    state_a: str
+    state_b: str
+    total: int
+    rxcuis: List[str]
+
+class CoverageGapDrug(BaseModel):
+    rxcui: str
+    states_covered: int
+    coverage_gap_percentage: float
+    missing_states: List[str]
+
+class CoverageGapsOut(BaseModel):
+    total_states: int
+    drugs: List[CoverageGapDrug]
+
+
 class FormularyDetailOut(BaseModel):
     drug_rxcui: str
     status: str
@@ -61,6 +85,55 @@ class FormularyDetailOut(BaseModel):
     class Config:
         orm_mode = True
 
+class CountyPlanOut(BaseModel):
+    plan_name: Optional[str] = None
+    contract_id: Optional[str] = None
+    plan_id: Optional[str] = None
+    segment_id: Optional[str] = None
+    formulary_id: Optional[str] = None
+    tier: Optional[int] = None
+    preferred_cost: Optional[float] = None
+    non_preferred_cost: Optional[float] = None
+    cost_type: str
+    prior_auth: str
+    step_therapy: str
+    quantity_limit: str
+
+class CheapestPlansOut(BaseModel):
+    drug_rxcui: str
+    county_code: str
+    status: str
+    plans_in_county: int
+    covering_plans: int
+    plans: List[CountyPlanOut]
+
+class BasketCoverageRequest(BaseModel):
+    rxcuis: List[str] = Field(..., min_length=1, max_length=50)
+    state: Optional[str] = None
+    county_code: Optional[str] = None
+    limit: int = Field(50, ge=1, le=500)
+
+class BasketPlanOut(BaseModel):
+    plan_name: Optional[str] = None
+    contract_id: Optional[str] = None
+    plan_id: Optional[str] = None
+    segment_id: Optional[str] = None
+    formulary_id: Optional[str] = None
+    counties: int
+    max_tier: Optional[int] = None
+    prior_auth_count: int
+    step_therapy_count: int
+    quantity_limit_count: int
+
+class BasketCoverageOut(BaseModel):
+    basket: List[str]
+    state: Optional[str] = None
+    county_code: Optional[str] = None
+    status: str
+    matching_formularies: int
+    matching_plans: int
+    plans: List[BasketPlanOut]
+
 class ResendOTPRequest(BaseModel):
     email: str
     context: Literal["register", "forgot_password"]
@@ -128,6 +201,53 @@ class CPMPSavingsResponse(BaseModel):
     potential_savings: CPMPSavingsPotential
     message: Optional[str] = None
 
+class CPMPProjectionItem(BaseModel):
+    rxcui: int
+    drug_name: str
+    utilization_rate: float
+    current_cost: Optional[float] = None
+
+class CPMPProjectionRequest(BaseModel):
+    items: List[CPMPProjectionItem] = Field(..., min_length=1)
+    years: int = Field(5, ge=1, le=20)
+    basis: Literal["Total_Claims", "Total_Beneficiaries"] = "Total_Claims"
+    member_count: int = Field(10000, ge=1)
+
+class CPMPProjectionDrug(BaseModel):
+    rxcui: int
+    drug_name: str
+    current_cost: Optional[float] = None
+    best_alternative_rxcui: Optional[int] = None
+    alternative_cost: Optional[float] = None
+    forecast_used: bool
+    utilization_rates: List[float]
+    original_cpmp: List[float]
+    alternative_cpmp: List[float]
+    annual_savings: List[float]
+
+class CPMPProjectionTotals(BaseModel):
+    original_cpmp: List[float]
+    alternative_cpmp: List[float]
+    annual_savings: List[float]
+    cumulative_savings: List[float]
+
+class CPMPProjectionResponse(BaseModel):
+    years: List[int]
+    basis: str
+    member_count: int
+    drugs: List[CPMPProjectionDrug]
+    portfolio: CPMPProjectionTotals
+
+class DrugProfileResponse(BaseModel):
+    rxcui: str
+    cost_analyzed: Optional[float] = None
+    utilization_rate_analyzed: float
+    regional: Regional_out
+    formulary: Dict[str, Any]
+    therapeutic: Dict[str, Any]
+    cpmp: Optional[CPMPSavingsResponse] = None
+    timings_ms: Dict[str, float]
+
 class ChatRequest(BaseModel):
     session_id: str
     role: str
@@ -135,4 +255,69 @@ class ChatRequest(BaseModel):
 
 
 class ChatResponse(BaseModel):
-    reply: str
\ No newline at end of file
+    reply: str
+
+
+class RegionalScanJobRequest(BaseModel):
+    rxcuis: Optional[List[str]] = None
+
+class CPMPPortfolioJobRequest(BaseModel):
+    items: List[CPMPSavingsRequest]
+
+class JobOut(BaseModel):
+    id: str
+    job_type: str
+    status: str
+    progress: float
+    message: Optional[str] = None
+    result_rows: Optional[int] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class CoverageTimelineMonth(BaseModel):
+    month: str
+    covering_plans: int
+    covering_formularies: int
+    states_covered: int
+    tier_min: Optional[float] = None
+    tier_max: Optional[float] = None
+    pa_share: Optional[float] = None
+    st_share: Optional[float] = None
+    ql_share: Optional[float] = None
+    missing_states: List[str]
+
+class CoverageTimelineResponse(BaseModel):
+    rxcui: str
+    status: str
+    total_states: int
+    months: List[CoverageTimelineMonth]
+
+class AutocompleteSuggestion(BaseModel):
+    text: str
+    kind: str
+    value: str
+    match: str
+    score: float
+
+class AutocompleteOut(BaseModel):
+    query: str
+    suggestions: List[AutocompleteSuggestion]
+
+class SavingsOpportunity(BaseModel):
+    rxcui: int
+    ingredient: str
+    tier: float
+    cost: float
+    alternative_rxcui: int
+    alternative_tier: float
+    alternative_cost: float
+    savings_per_unit: float
+    percentage_reduction: float
+
+class SavingsLeaderboardOut(BaseModel):
+    total_opportunities: int
+    opportunities: List[SavingsOpportunity]
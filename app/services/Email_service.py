@@ -1,6 +1,14 @@
 import os
+import json
+import queue
+import random
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+from string import Template
+
 import sib_api_v3_sdk
-from sib_api_v3_sdk.rest import ApiException
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,234 +16,354 @@ load_dotenv()
 # Get your API key from the environment variable
 API_KEY = os.environ.get("BREVO_API_KEY")
 
-configuration = sib_api_v3_sdk.Configuration()
-configuration.api_key['api-key'] = API_KEY
-
-api_instance = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
+# "brevo" in production; "smtp" (e.g. a local `python -m aiosmtpd -n` sink) or "file" for tests.
+EMAIL_TRANSPORT = os.environ.get("EMAIL_TRANSPORT", "brevo")
+EMAIL_SMTP_HOST = os.environ.get("EMAIL_SMTP_HOST", "127.0.0.1")
+EMAIL_SMTP_PORT = int(os.environ.get("EMAIL_SMTP_PORT", 8025))
+EMAIL_FILE_SINK_DIR = os.environ.get("EMAIL_FILE_SINK_DIR", "email_outbox")
+EMAIL_WORKERS = int(os.environ.get("EMAIL_WORKERS", 2))
+EMAIL_MAX_RETRIES = int(os.environ.get("EMAIL_MAX_RETRIES", 4))
+EMAIL_RETRY_BACKOFF_SECONDS = float(os.environ.get("EMAIL_RETRY_BACKOFF_SECONDS", 1.0))
+EMAIL_QUEUE_MAXSIZE = int(os.environ.get("EMAIL_QUEUE_MAXSIZE", 10000))
 
+SENDER = {"email": "support@formulogic.systems", "name": "Formulogic Systems"}
 
-def send_login_otp_email(user_email: str, otp: str):
-    sender = {"email": "support@formulogic.systems", "name": "Formulogic Systems"}
-    to = [{"email": user_email}]
-    subject = f"Your FormuLogic Login Verification Code"
-
-    # --- DARK THEME HTML (same style as above, only wording changed) ---
-    html_content = f"""
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Login Verification</title>
-        <style>
-            @import url('https://fonts.googleapis.com/css2?family=Lato:wght@400;700&display=swap');
-            body {{
-                margin: 0;
-                padding: 0;
-                background-color: #f8f9fa;
-                font-family: 'Lato', Arial, sans-serif;
-            }}
-            .container {{
-                max-width: 600px;
-                margin: 40px auto;
-                background-color: #2C3E50;
-                border-radius: 8px;
-                overflow: hidden;
-                box-shadow: 0 4px 15px rgba(0,0,0,0.1);
-            }}
-            .header {{
-                padding: 40px;
-                text-align: center;
-            }}
-            .header h1 {{
-                color: #ffffff;
-                font-size: 28px;
-                font-weight: 700;
-                margin: 0;
-                letter-spacing: 1px;
-            }}
-            .header span {{
-                color: #27AE60;
-            }}
-            .content {{
-                padding: 20px 40px 40px;
-                color: #EAECEE;
-                font-size: 16px;
-                line-height: 1.6;
-            }}
-            .otp-code {{
-                background-color: #34495E;
-                border-radius: 8px;
-                padding: 25px;
-                margin: 30px 0;
-                text-align: center;
-            }}
-            .otp-code p {{
-                margin: 0 0 10px;
-                font-size: 16px;
-                color: #BDC3C7;
-            }}
-            .otp-code h2 {{
-                font-size: 42px;
-                font-weight: 700;
-                color: #27AE60;
-                margin: 0;
-                letter-spacing: 5px;
-            }}
-            .footer {{
-                text-align: center;
-                font-size: 12px;
-                color: #7F8C8D;
-                padding: 20px 40px;
-            }}
-            .footer a {{
-                color: #27AE60;
-                text-decoration: none;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>Formu<span>Logic</span></h1>
-            </div>
-            <div class="content">
-                <p>Hello,</p>
-                <p>We noticed a login attempt to your account. Please use the following code to verify and complete your login. This code is valid for the next 10 minutes.</p>
-                <div class="otp-code">
-                    <p>Your Login Verification Code</p>
-                    <h2>{otp}</h2>
-                </div>
-                <p>If you did not attempt to log in, please secure your account immediately by resetting your password.</p>
-                <p>Thank you,<br>The FormuLogic Team</p>
-            </div>
-            <div class="footer">
-                <p>&copy; 2024 FormuLogic. All Rights Reserved.</p>
+# --- DARK THEME HTML, compiled once and shared by every OTP email ---
+_OTP_TEMPLATE = Template("""
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>$title</title>
+    <style>
+        @import url('https://fonts.googleapis.com/css2?family=Lato:wght@400;700&display=swap');
+        body {
+            margin: 0;
+            padding: 0;
+            background-color: #f8f9fa;
+            font-family: 'Lato', Arial, sans-serif;
+        }
+        .container {
+            max-width: 600px;
+            margin: 40px auto;
+            background-color: #2C3E50;
+            border-radius: 8px;
+            overflow: hidden;
+            box-shadow: 0 4px 15px rgba(0,0,0,0.1);
+        }
+        .header {
+            padding: 40px;
+            text-align: center;
+        }
+        .header h1 {
+            color: #ffffff;
+            font-size: 28px;
+            font-weight: 700;
+            margin: 0;
+            letter-spacing: 1px;
+        }
+        .header span {
+            color: #27AE60;
+        }
+        .content {
+            padding: 20px 40px 40px;
+            color: #EAECEE;
+            font-size: 16px;
+            line-height: 1.6;
+        }
+        .otp-code {
+            background-color: #34495E;
+            border-radius: 8px;
+            padding: 25px;
+            margin: 30px 0;
+            text-align: center;
+        }
+        .otp-code p {
+            margin: 0 0 10px;
+            font-size: 16px;
+            color: #BDC3C7;
+        }
+        .otp-code h2 {
+            font-size: 42px;
+            font-weight: 700;
+            color: #27AE60;
+            margin: 0;
+            letter-spacing: 5px;
+        }
+        .footer {
+            text-align: center;
+            font-size: 12px;
+            color: #7F8C8D;
+            padding: 20px 40px;
+        }
+        .footer a {
+            color: #27AE60;
+            text-decoration: none;
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>Formu<span>Logic</span></h1>
+        </div>
+        <div class="content">
+            <p>Hello,</p>
+            <p>$intro</p>
+            <div class="otp-code">
+                <p>$code_label</p>
+                <h2>$otp</h2>
             </div>
+            <p>$outro</p>
+            <p>Thank you,<br>The FormuLogic Team</p>
         </div>
-    </body>
-    </html>
-    """
+        <div class="footer">
+            <p>&copy; 2024 FormuLogic. All Rights Reserved.</p>
+        </div>
+    </div>
+</body>
+</html>""")
 
-    send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(to=to, sender=sender, subject=subject, html_content=html_content)
+_OTP_EMAILS = {
+    "login": {
+        "subject": "Your FormuLogic Login Verification Code",
+        "title": "Login Verification",
+        "intro": "We noticed a login attempt to your account. Please use the following code to verify and complete your login. This code is valid for the next 10 minutes.",
+        "code_label": "Your Login Verification Code",
+        "outro": "If you did not attempt to log in, please secure your account immediately by resetting your password.",
+    },
+    "password_reset": {
+        "subject": "Your FormuLogic Password Reset Code",
+        "title": "Password Reset",
+        "intro": "We received a request to reset the password for your account. Please use the code below to complete the process. This code is valid for the next 10 minutes.",
+        "code_label": "Your Password Reset Code",
+        "outro": "If you did not request a password reset, you can safely ignore this email. Only a person with access to your email can reset your password.",
+    },
+}
 
-    try:
-        api_instance.send_transac_email(send_smtp_email)
-        print(f"Login OTP email sent to {user_email}")
-        return {"success": True}
-    except ApiException as e:
-        print(f"Error sending login OTP email via Brevo: {e}")
-        return {"success": False, "error": str(e)}
 
-def send_password_reset_email(user_email: str, otp: str):
-    sender = {"email": "support@formulogic.systems", "name": "Formulogic Systems"}
-    to = [{"email": user_email}]
-    subject = f"Your FormuLogic Password Reset Code"
-
-    # --- REVERTED DARK THEME HTML ---
-    html_content = f"""
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Password Reset</title>
-        <style>
-            @import url('https://fonts.googleapis.com/css2?family=Lato:wght@400;700&display=swap');
-            body {{
-                margin: 0;
-                padding: 0;
-                background-color: #f8f9fa;
-                font-family: 'Lato', Arial, sans-serif;
-            }}
-            .container {{
-                max-width: 600px;
-                margin: 40px auto;
-                background-color: #2C3E50;
-                border-radius: 8px;
-                overflow: hidden;
-                box-shadow: 0 4px 15px rgba(0,0,0,0.1);
-            }}
-            .header {{
-                padding: 40px;
-                text-align: center;
-            }}
-            .header h1 {{
-                color: #ffffff;
-                font-size: 28px;
-                font-weight: 700;
-                margin: 0;
-                letter-spacing: 1px;
-            }}
-            .header span {{
-                color: #27AE60;
-            }}
-            .content {{
-                padding: 20px 40px 40px;
-                color: #EAECEE;
-                font-size: 16px;
-                line-height: 1.6;
-            }}
-            .otp-code {{
-                background-color: #34495E;
-                border-radius: 8px;
-                padding: 25px;
-                margin: 30px 0;
-                text-align: center;
-            }}
-            .otp-code p {{
-                margin: 0 0 10px;
-                font-size: 16px;
-                color: #BDC3C7;
-            }}
-            .otp-code h2 {{
-                font-size: 42px;
-                font-weight: 700;
-                color: #27AE60;
-                margin: 0;
-                letter-spacing: 5px;
-            }}
-            .footer {{
-                text-align: center;
-                font-size: 12px;
-                color: #7F8C8D;
-                padding: 20px 40px;
-            }}
-            .footer a {{
-                color: #27AE60;
-                text-decoration: none;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>Formu<span>Logic</span></h1>
-            </div>
-            <div class="content">
-                <p>Hello,</p>
-                <p>We received a request to reset the password for your account. Please use the code below to complete the process. This code is valid for the next 10 minutes.</p>
-                <div class="otp-code">
-                    <p>Your Password Reset Code</p>
-                    <h2>{otp}</h2>
-                </div>
-                <p>If you did not request a password reset, you can safely ignore this email. Only a person with access to your email can reset your password.</p>
-                <p>Thank you,<br>The FormuLogic Team</p>
-            </div>
-            <div class="footer">
-                <p>&copy; 2024 FormuLogic. All Rights Reserved.</p>
-            </div>
-        </div>
-    </body>
-    </html>
+def render_otp_email(kind: str, otp: str):
+    """Returns (subject, html_content) for an OTP email of the given kind."""
+    spec = _OTP_EMAILS[kind]
+    html_content = _OTP_TEMPLATE.substitute(
+        title=spec["title"], intro=spec["intro"], code_label=spec["code_label"],
+        outro=spec["outro"], otp=otp,
+    )
+    return spec["subject"], html_content
+
+
+# --- Transports: each send() raises on failure so the dispatcher can retry ---
+
+class BrevoTransport:
+
+    def __init__(self, api_key: str = API_KEY):
+        configuration = sib_api_v3_sdk.Configuration()
+        configuration.api_key['api-key'] = api_key
+        self.api_instance = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
+
+    def send(self, to_email: str, subject: str, html_content: str):
+        send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(
+            to=[{"email": to_email}], sender=SENDER, subject=subject, html_content=html_content
+        )
+        self.api_instance.send_transac_email(send_smtp_email)
+
+
+class SMTPTransport:
+
+    def __init__(self, host: str = EMAIL_SMTP_HOST, port: int = EMAIL_SMTP_PORT):
+        self.host = host
+        self.port = port
+
+    def send(self, to_email: str, subject: str, html_content: str):
+        message = EmailMessage()
+        message["From"] = f"{SENDER['name']} <{SENDER['email']}>"
+        message["To"] = to_email
+        message["Subject"] = subject
+        message.set_content(html_content, subtype="html")
+        with smtplib.SMTP(self.host, self.port, timeout=10) as server:
+            server.send_message(message)
+
+
+class FileTransport:
+    """Writes each email as a JSON file, for tests and local development."""
+
+    def __init__(self, directory: str = EMAIL_FILE_SINK_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def send(self, to_email: str, subject: str, html_content: str):
+        path = os.path.join(self.directory, f"{time.time_ns()}_{to_email}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"to": to_email, "sender": SENDER, "subject": subject, "html_content": html_content}, f)
+
+
+TRANSPORTS = {
+    "brevo": BrevoTransport,
+    "smtp": SMTPTransport,
+    "file": FileTransport,
+}
+
+
+def build_transport(name: str = EMAIL_TRANSPORT):
+    if name not in TRANSPORTS:
+        raise ValueError(f"Unknown EMAIL_TRANSPORT '{name}'. Expected one of {list(TRANSPORTS)}.")
+    return TRANSPORTS[name]()
+
+
+# --- In-process dispatch queue ---
+
+class EmailDispatcher:
     """
+    Background worker threads that render and deliver queued OTP emails.
+    Failed sends are retried with exponential backoff and jitter; a retry
+    waits on a timer, so it never blocks a worker. `stop()` hands retries
+    still waiting on their timer to the workers for one last attempt.
+    """
+
+    def __init__(self, transport=None, workers: int = EMAIL_WORKERS, max_retries: int = EMAIL_MAX_RETRIES,
+                 backoff_seconds: float = EMAIL_RETRY_BACKOFF_SECONDS, maxsize: int = EMAIL_QUEUE_MAXSIZE):
+        self.transport = transport
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads = []
+        self._lock = threading.Lock()
+        # id(job) -> (timer, job) for every retry waiting on its backoff timer.
+        self._pending_retries = {}
+        self._stopping = False
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return any(t.is_alive() for t in self._threads)
+
+    def start(self):
+        if self.running:
+            return
+        if self.transport is None:
+            self.transport = build_transport()
+        self._stopping = False
+        self._threads = [
+            threading.Thread(target=self._work, name=f"email-worker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for t in self._threads:
+            t.start()
+        print(f"Email dispatcher started with {self.workers} worker(s) using {type(self.transport).__name__}")
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Lets the workers drain what is already queued, including retries
+        whose backoff has not elapsed yet, then stops them. Sends that fail
+        while stopping are not retried again.
+        """
+        with self._lock:
+            self._stopping = True
+            pending = list(self._pending_retries.values())
+            self._pending_retries.clear()
+        for timer, job in pending:
+            timer.cancel()
+            self._put_retry(job)
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def enqueue(self, kind: str, to_email: str, otp: str) -> bool:
+        if not self.running:
+            return False
+        try:
+            self._queue.put_nowait((kind, to_email, otp, 0))
+            return True
+        except queue.Full:
+            print("CRITICAL: Email queue is full, dropping message.")
+            return False
+
+    def _schedule_retry(self, job, delay: float):
+        timer = threading.Timer(delay, self._retry_due, args=(job,))
+        timer.daemon = True
+        with self._lock:
+            self._pending_retries[id(job)] = (timer, job)
+        timer.start()
+
+    def _retry_due(self, job):
+        with self._lock:
+            if self._pending_retries.pop(id(job), None) is None:
+                return  # stop() already handed it to the workers
+        self._put_retry(job)
+
+    def _put_retry(self, job):
+        kind, to_email, _, attempt = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self.failed += 1
+            print(f"CRITICAL: Email queue is full, dropping retry {attempt} of {kind} OTP email to {to_email}.")
 
-    send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(to=to, sender=sender, subject=subject, html_content=html_content)
+    def stats(self):
+        with self._lock:
+            return {"queued": self._queue.qsize(), "retry_pending": len(self._pending_retries),
+                    "sent": self.sent, "retried": self.retried, "failed": self.failed}
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            kind, to_email, otp, attempt = job
+            try:
+                subject, html_content = render_otp_email(kind, otp)
+                self.transport.send(to_email, subject, html_content)
+                with self._lock:
+                    self.sent += 1
+                print(f"{kind} OTP email sent to {to_email}")
+            except Exception as e:
+                if attempt < self.max_retries and not self._stopping:
+                    delay = self.backoff_seconds * (2 ** attempt) * (1 + random.random())
+                    with self._lock:
+                        self.retried += 1
+                    print(f"Error sending {kind} OTP email to {to_email}, retrying in {delay:.1f}s: {e}")
+                    self._schedule_retry((kind, to_email, otp, attempt + 1), delay)
+                else:
+                    with self._lock:
+                        self.failed += 1
+                    print(f"CRITICAL: Giving up on {kind} OTP email to {to_email} after {attempt + 1} attempts: {e}")
+
+
+dispatcher = EmailDispatcher()
+
+
+def queue_login_otp_email(user_email: str, otp: str) -> bool:
+    return dispatcher.enqueue("login", user_email, otp)
+
+
+def queue_password_reset_email(user_email: str, otp: str) -> bool:
+    return dispatcher.enqueue("password_reset", user_email, otp)
+
+
+def _send_now(kind: str, user_email: str, otp: str):
+    transport = dispatcher.transport or build_transport()
+    subject, html_content = render_otp_email(kind, otp)
     try:
-        api_instance.send_transac_email(send_smtp_email)
-        print(f"Password reset OTP email sent to {user_email}")
+        transport.send(user_email, subject, html_content)
+        print(f"{kind} OTP email sent to {user_email}")
         return {"success": True}
-    except ApiException as e:
-        print(f"Error sending password reset email via Brevo: {e}")
+    except Exception as e:
+        print(f"Error sending {kind} OTP email: {e}")
         return {"success": False, "error": str(e)}
 
+
+def send_login_otp_email(user_email: str, otp: str):
+    """Sends synchronously, bypassing the queue."""
+    return _send_now("login", user_email, otp)
+
+
+def send_password_reset_email(user_email: str, otp: str):
+    """Sends synchronously, bypassing the queue."""
+    return _send_now("password_reset", user_email, otp)
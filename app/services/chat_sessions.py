@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+
+class _SessionEntry:
+    __slots__ = ("chat", "lock", "last_used")
+
+    def __init__(self, chat):
+        self.chat = chat
+        # Serializes turns within one session; a chat history is not safe to mutate concurrently.
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+class ChatSessionStore:
+    """
+    LRU store of chat sessions bounded by entry count and idle TTL.
+    The least recently used session is evicted once `max_sessions` is
+    reached, and sessions idle for longer than `ttl_seconds` are dropped
+    on access.
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: float = 1800):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expire(self, now: float):
+        # Entries are kept in recency order, so expired ones are at the front.
+        while self._sessions:
+            session_id, entry = next(iter(self._sessions.items()))
+            if now - entry.last_used <= self.ttl_seconds:
+                break
+            del self._sessions[session_id]
+            self.expirations += 1
+
+    def get_or_create(self, session_id: str, factory) -> _SessionEntry:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = _SessionEntry(factory())
+                self._sessions[session_id] = entry
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._sessions.move_to_end(session_id)
+            entry.last_used = now
+            return entry
+
+    def discard(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl_seconds,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+
+class ChatStreamMetrics:
+    """Running totals for streamed replies: time-to-first-token and total duration, in seconds."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.streams = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.errors = 0
+        self.ttft_total = 0.0
+        self.ttft_max = 0.0
+        self.ttft_count = 0
+        self.duration_total = 0.0
+        self.duration_max = 0.0
+
+    def record(self, outcome: str, ttft, duration: float):
+        with self._lock:
+            self.streams += 1
+            if outcome == "completed":
+                self.completed += 1
+            elif outcome == "cancelled":
+                self.cancelled += 1
+            else:
+                self.errors += 1
+            if ttft is not None:
+                self.ttft_count += 1
+                self.ttft_total += ttft
+                self.ttft_max = max(self.ttft_max, ttft)
+            self.duration_total += duration
+            self.duration_max = max(self.duration_max, duration)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "streams": self.streams,
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "errors": self.errors,
+                "avg_ttft_ms": round(self.ttft_total / self.ttft_count * 1000, 2) if self.ttft_count else None,
+                "max_ttft_ms": round(self.ttft_max * 1000, 2),
+                "avg_duration_ms": round(self.duration_total / self.streams * 1000, 2) if self.streams else None,
+                "max_duration_ms": round(self.duration_max * 1000, 2),
+            }
@@ -0,0 +1,172 @@
+import os
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from sqlalchemy import select, Integer, Float, Boolean, DateTime, Date
+
+from app.database import (
+    engine,
+    RegionalDisparityAnalysis,
+    FormularyDetailAnalysis,
+    TherapeuticEquivalentLog,
+    TherapeuticEquivalentAlternative,
+)
+
+load_dotenv()
+
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", 10_000))
+
+FORMATS = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _arrow_type(sql_type):
+    if isinstance(sql_type, Boolean):
+        return pa.bool_()
+    if isinstance(sql_type, Integer):
+        return pa.int64()
+    if isinstance(sql_type, Float):
+        return pa.float64()
+    if isinstance(sql_type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(sql_type, Date):
+        return pa.date32()
+    return pa.string()
+
+
+def _log_select(model):
+    return select(model.__table__), model
+
+
+def _therapeutic_select():
+    # One row per alternative; logs without alternatives keep a single row of nulls.
+    log, alt = TherapeuticEquivalentLog.__table__, TherapeuticEquivalentAlternative.__table__
+    stmt = select(
+        log,
+        alt.c.ingredient.label("alternative_ingredient"),
+        alt.c.alternative_rxcui,
+        alt.c.alternative_cost,
+        alt.c.cost_difference,
+        alt.c.percentage_reduction,
+    ).select_from(log.outerjoin(alt, alt.c.log_id == log.c.id))
+    return stmt, TherapeuticEquivalentLog
+
+
+# dataset name in the URL -> statement builder returning (select, model owning id/timestamp/user_id)
+EXPORT_DATASETS = {
+    "regional-disparity": lambda: _log_select(RegionalDisparityAnalysis),
+    "formulary-detail": lambda: _log_select(FormularyDetailAnalysis),
+    "therapeutic-equivalence": _therapeutic_select,
+}
+
+
+def build_export_query(dataset: str, since: datetime = None, until: datetime = None, user_id: int = None):
+    stmt, model = EXPORT_DATASETS[dataset]()
+    if since is not None:
+        stmt = stmt.where(model.timestamp >= since)
+    if until is not None:
+        stmt = stmt.where(model.timestamp < until)
+    if user_id is not None:
+        stmt = stmt.where(model.user_id == user_id)
+    return stmt.order_by(model.id)
+
+
+def schema_for(stmt) -> pa.Schema:
+    return pa.schema([pa.field(c.name, _arrow_type(c.type)) for c in stmt.selected_columns])
+
+
+def iter_query_batches(stmt, batch_rows: int = EXPORT_BATCH_ROWS):
+    """
+    Yields the rows of `stmt` as Arrow record batches. The query runs on a
+    server-side cursor, so only one batch of rows is held in Python at a time.
+    """
+    schema = schema_for(stmt)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_rows).execute(stmt)
+        for rows in result.partitions():
+            columns = list(zip(*rows))
+            yield pa.RecordBatch.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+                schema=schema,
+            )
+
+
+class _ChunkSink:
+    """Write-only file object that hands whatever was written back to the caller in pieces."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def stream_batches(batches, schema: pa.Schema, fmt: str):
+    """
+    Serializes record batches as an Arrow IPC stream or a Parquet file,
+    yielding bytes as each batch is written. A Parquet row group is written
+    per batch; the footer comes last.
+    """
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    try:
+        for batch in batches:
+            writer.write_batch(batch)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+UM_CHANGE_SCHEMA = pa.schema([
+    ("rxcui", pa.string()),
+    ("formulary_id", pa.string()),
+    ("change_type", pa.string()),
+    ("previous_value", pa.string()),
+    ("new_value", pa.string()),
+    ("impact", pa.string()),
+    ("tier_previous", pa.string()),
+    ("tier_current", pa.string()),
+])
+
+
+def um_change_batches(analyzer, batch_rows: int = EXPORT_BATCH_ROWS):
+    """
+    Flattens every change of a UM comparison into the same columns as the
+    analyzer's detailed change tables, without their display limit.
+    """
+    analysis = analyzer.monthly_analyses[next(iter(analyzer.monthly_analyses))]
+    changes = analysis.get("changes", [])
+    for start in range(0, len(changes), batch_rows):
+        rows = analyzer._generate_detailed_changes_table(changes[start:start + batch_rows])
+        for row in rows:
+            for key in ("rxcui", "formulary_id", "tier_previous", "tier_current"):
+                row[key] = None if row[key] is None else str(row[key])
+        yield pa.RecordBatch.from_pylist(rows, schema=UM_CHANGE_SCHEMA)
@@ -0,0 +1,440 @@
+import json
+import os
+import shutil
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from sqlalchemy import func, insert, literal, select
+
+from app.database import SessionLocal, AnalysisJob, User
+from app.ml_models.registry import lease
+from app.ml_models.cpmp_helper import CPMPCalculator
+from app.ml_models.therapeutic_eq_helper import iter_claim_chunks
+
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_MAX_PER_USER = int(os.getenv("JOB_MAX_PER_USER", 2))
+JOB_DIR = os.getenv("JOB_DIR", "jobs")
+JOB_CHUNK_ROWS = int(os.getenv("JOB_CHUNK_ROWS", 100_000))
+# Finished jobs' directories (input and result files) are deleted after this many days.
+JOB_RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", 7))
+JOB_PRUNE_INTERVAL_SECONDS = 3600
+
+ACTIVE_STATUSES = ("queued", "running")
+FINAL_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobLimitExceeded(Exception):
+    pass
+
+
+class JobContext:
+    """What a running job sees: its parameters, where to write, and how to report progress."""
+
+    def __init__(self, job_id: str, params: dict):
+        self.job_id = job_id
+        self.params = params
+        self.directory = os.path.join(JOB_DIR, job_id)
+        self.result_path = os.path.join(self.directory, "result.parquet")
+        self._last_update = 0.0
+
+    def progress(self, fraction: float, message: str = None, force: bool = False):
+        """
+        Records progress and raises JobCancelled if a cancel was requested.
+        Updates are throttled to one DB write per second unless forced.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_update < 1.0:
+            return
+        self._last_update = now
+        db = SessionLocal()
+        try:
+            job = db.get(AnalysisJob, self.job_id)
+            if job.cancel_requested:
+                raise JobCancelled()
+            job.progress = round(min(max(fraction, 0.0), 1.0), 4)
+            if message:
+                job.message = message[:500]
+            db.commit()
+        finally:
+            db.close()
+
+
+class ParquetSink:
+    """
+    Appends DataFrame chunks to one Parquet file. With an explicit schema,
+    every chunk is aligned to its columns, so a column missing from a chunk
+    is written as nulls. Without one, the first chunk fixes the schema.
+    """
+
+    def __init__(self, path: str, schema: pa.Schema = None):
+        self.path = path
+        self.rows = 0
+        self._writer = None
+        self._schema = schema
+
+    def write(self, df: pd.DataFrame):
+        if self._schema is not None:
+            df = df.reindex(columns=self._schema.names)
+        table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        if self._writer is None:
+            self._schema = table.schema
+            self._writer = pq.ParquetWriter(self.path, self._schema, compression="zstd")
+        self._writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is None:
+            pq.write_table((self._schema or pa.schema([])).empty_table(), self.path)
+        else:
+            self._writer.close()
+
+
+# --- Job implementations: fn(ctx, sink) -> summary message ---
+
+@contextmanager
+def _leased_model(key: str):
+    """The current version of a model, pinned until the job is done with it."""
+    with lease(key) as model:
+        if model is None:
+            raise RuntimeError(f"Model '{key}' is not available.")
+        yield model
+
+
+def run_claims_scoring(ctx: JobContext, sink: ParquetSink):
+    with _leased_model("therapeutic_equivalence") as model:
+        p = ctx.params
+        path = p["input_path"]
+        size = os.path.getsize(path) or 1
+        with open(path, "rb") as source:
+            total_rows = pq.ParquetFile(source).metadata.num_rows if path.endswith(".parquet") else None
+            for chunk in iter_claim_chunks(source, path, p["rxcui_column"], p["cost_column"], JOB_CHUNK_ROWS):
+                sink.write(model.score_claims(chunk, rxcui_col=p["rxcui_column"], cost_col=p["cost_column"]))
+                done = sink.rows / total_rows if total_rows else source.tell() / size
+                ctx.progress(done, f"Scored {sink.rows} rows")
+        return f"Scored {sink.rows} claims"
+
+
+# The fields of schemas.Regional_out, all nullable.
+REGIONAL_SCAN_SCHEMA = pa.schema([
+    ("rxcui", pa.string()),
+    ("status", pa.string()),
+    ("message", pa.string()),
+    ("total_plans_covering_drug", pa.int64()),
+    ("states_with_coverage", pa.string()),
+    ("coverage_gap_percentage", pa.string()),
+    ("drug_tier", pa.string()),
+    ("prior_auth_required", pa.string()),
+    ("step_therapy_required", pa.string()),
+    ("missing_states", pa.list_(pa.string())),
+    ("disparity_message", pa.string()),
+])
+
+
+def _regional_scan_rows(report: pd.DataFrame, rxcuis: list, all_states: list) -> pd.DataFrame:
+    """
+    Turns `catalog_report` rows into what `predict` returns per drug, adding
+    a not-covered row for each requested RXCUI the report doesn't list.
+    """
+    if rxcuis:
+        requested = pd.Index(pd.unique(pd.Series([str(r) for r in rxcuis])))
+        report = report[report["rxcui"].isin(requested)]
+        absent = requested.difference(report["rxcui"], sort=False)
+    else:
+        absent = pd.Index([])
+
+    success = report["status"].to_numpy() == "success"
+    gaps = report["missing_states"].map(len).to_numpy()
+    rows = pd.DataFrame({
+        "rxcui": report["rxcui"].to_numpy(),
+        "status": report["status"].to_numpy(),
+        "message": np.where(success, None, "Drug in formularies but no active plans"),
+        "total_plans_covering_drug": np.where(success, report["total_plans_covering_drug"].to_numpy(), None),
+        "states_with_coverage": np.where(
+            success, report["states_covered"].astype(str) + "/" + report["total_states"].astype(str), None
+        ),
+        "coverage_gap_percentage": np.where(success, report["coverage_gap_percentage"].astype(str) + "%", None),
+        "drug_tier": np.where(success, report["drug_tier"].map(lambda t: None if t is None else str(t)), None),
+        "prior_auth_required": np.where(success, report["prior_auth_required"].to_numpy(), None),
+        "step_therapy_required": np.where(success, report["step_therapy_required"].to_numpy(), None),
+        "missing_states": report["missing_states"].to_numpy(),
+        "disparity_message": np.where(
+            ~success, None,
+            np.where(gaps > 0,
+                     [f"Regional disparities detected - not covered in {n} states/territories" for n in gaps],
+                     "No regional disparities - covered in all states/territories"),
+        ),
+    })
+    not_covered = pd.DataFrame({
+        "rxcui": absent.to_numpy(),
+        "status": "not_covered",
+        "message": "Drug not covered in any formulary",
+        "missing_states": [list(all_states)] * len(absent),
+    })
+    return pd.concat([rows, not_covered], ignore_index=True) if len(absent) else rows
+
+
+def run_regional_scan(ctx: JobContext, sink: ParquetSink):
+    with _leased_model("regional_disparity") as model:
+        ctx.progress(0.0, "Building the regional report", force=True)
+        all_states = list(model.all_states) if model.all_states is not None else []
+        rows = _regional_scan_rows(model.catalog_report(), ctx.params.get("rxcuis"), all_states)
+    for start in range(0, len(rows), JOB_CHUNK_ROWS):
+        sink.write(rows.iloc[start:start + JOB_CHUNK_ROWS])
+        ctx.progress(sink.rows / len(rows), f"Wrote {sink.rows}/{len(rows)} drugs")
+    return f"Scanned {len(rows)} drugs"
+
+
+def run_cpmp_portfolio(ctx: JobContext, sink: ParquetSink):
+    with _leased_model("therapeutic_equivalence") as recommender:
+        calculator = CPMPCalculator(recommender=recommender)
+        items = ctx.params["items"]
+        rows = []
+        for i, item in enumerate(items, 1):
+            result = calculator.analyze_savings_from_single_rxcui(
+                rxcui=int(item["rxcui"]),
+                current_cost=float(item["current_cost"]),
+                utilization_rate=float(item["utilization_rate"]),
+            )
+            rows.append({
+                **result["analysis_summary"],
+                "original_cpmp": result["original_cpmp"],
+                "potential_cpmp_with_alternative": result["potential_cpmp_with_alternative"],
+                **result["potential_savings"],
+                "message": result.get("message"),
+            })
+            ctx.progress(i / len(items), f"Analyzed {i}/{len(items)} drugs")
+        if rows:
+            sink.write(pd.DataFrame(rows))
+        return f"Analyzed {len(items)} drugs"
+
+
+JOB_TYPES = {
+    "claims_scoring": run_claims_scoring,
+    "regional_scan": run_regional_scan,
+    "cpmp_portfolio": run_cpmp_portfolio,
+}
+
+# Result schemas fixed up front; other job types take theirs from the first chunk.
+JOB_SCHEMAS = {
+    "regional_scan": REGIONAL_SCAN_SCHEMA,
+}
+
+
+class JobManager:
+    """
+    Runs analysis jobs on a local thread pool and keeps their state in the
+    analysis_jobs table, so any API worker can report status. Cancellation
+    is a DB flag that the job checks at every progress update. The
+    per-user limit is enforced in the DB, so it holds across API workers.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_per_user: int = JOB_MAX_PER_USER,
+                 retention_days: float = JOB_RETENTION_DAYS):
+        self.workers = workers
+        self.max_per_user = max_per_user
+        self.retention_days = retention_days
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._pool = None
+        self._last_prune = 0.0
+
+    def start(self):
+        if self._pool is not None:
+            return
+        # Re-evaluated after fork, so each API worker owns the jobs it accepted.
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job-worker")
+        self._fail_orphaned_jobs()
+        self._maybe_prune()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _fail_orphaned_jobs(self):
+        """Marks active jobs whose owning process on this host no longer exists as failed."""
+        host = socket.gethostname()
+        db = SessionLocal()
+        try:
+            for job in db.query(AnalysisJob).filter(AnalysisJob.status.in_(ACTIVE_STATUSES)).all():
+                owner_host, _, pid = (job.owner or "").partition(":")
+                if owner_host != host or (pid.isdigit() and _pid_alive(int(pid))):
+                    continue
+                job.status = "failed"
+                job.message = "Interrupted by a server restart."
+                job.finished_at = datetime.utcnow()
+            db.commit()
+        finally:
+            db.close()
+
+    def prune(self):
+        """
+        Deletes the directories of jobs that finished more than
+        `retention_days` ago, and of jobs the DB no longer knows (such as an
+        upload whose submit was refused) once they are as old. The job rows
+        stay, so their status still answers and the download reports 410.
+        """
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+        db = SessionLocal()
+        try:
+            expired = db.query(AnalysisJob).filter(
+                AnalysisJob.status.in_(FINAL_STATUSES), AnalysisJob.finished_at < cutoff
+            ).all()
+            expired_ids = {job.id for job in expired}
+            removed = 0
+            for job_id in expired_ids:
+                directory = os.path.join(JOB_DIR, job_id)
+                if os.path.isdir(directory):
+                    shutil.rmtree(directory, ignore_errors=True)
+                    removed += 1
+            for job in expired:
+                job.result_path = None
+            db.commit()
+
+            try:
+                names = os.listdir(JOB_DIR)
+            except FileNotFoundError:
+                names = []
+            stray = [name for name in names if name not in expired_ids
+                     and os.path.getmtime(os.path.join(JOB_DIR, name)) < cutoff.timestamp()
+                     and db.get(AnalysisJob, name) is None]
+            for name in stray:
+                shutil.rmtree(os.path.join(JOB_DIR, name), ignore_errors=True)
+            removed += len(stray)
+        finally:
+            db.close()
+        if removed:
+            print(f"Removed {removed} job director{'y' if removed == 1 else 'ies'} older than {self.retention_days} days")
+        return removed
+
+    def _maybe_prune(self):
+        if self.retention_days <= 0 or time.monotonic() - self._last_prune < JOB_PRUNE_INTERVAL_SECONDS:
+            return
+        self._last_prune = time.monotonic()
+        try:
+            self.prune()
+        except Exception as e:
+            print(f"CRITICAL: Could not prune job directories. {e}")
+
+    def submit(self, user_id: int, job_type: str, params: dict, job_id: str = None) -> str:
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Unknown job type '{job_type}'.")
+        if self._pool is None:
+            raise RuntimeError("The job runner is not started.")
+        job_id = job_id or str(uuid.uuid4())
+        db = SessionLocal()
+        try:
+            # Concurrent submits of one user, from any API worker, queue on the user's row
+            # (SQLite has no row locks, but runs one write at a time). The insert itself only
+            # happens while the user is under the limit.
+            db.execute(select(User.id).where(User.id == user_id).with_for_update())
+            active = (
+                select(func.count()).select_from(AnalysisJob)
+                .where(AnalysisJob.user_id == user_id, AnalysisJob.status.in_(ACTIVE_STATUSES))
+                .scalar_subquery()
+            )
+            values = {
+                "id": job_id, "job_type": job_type, "status": "queued", "progress": 0.0,
+                "params": json.dumps(params), "cancel_requested": False, "owner": self.owner,
+                "created_at": datetime.utcnow(), "user_id": user_id,
+            }
+            inserted = db.execute(
+                insert(AnalysisJob).from_select(
+                    list(values), select(*(literal(v) for v in values.values())).where(active < self.max_per_user)
+                )
+            ).rowcount
+            if not inserted:
+                db.rollback()
+                raise JobLimitExceeded(f"You already have the maximum of {self.max_per_user} active job(s).")
+            db.commit()
+        finally:
+            db.close()
+        self._pool.submit(self._run, job_id)
+        return job_id
+
+    def cancel(self, job_id: str):
+        db = SessionLocal()
+        try:
+            job = db.get(AnalysisJob, job_id)
+            if job is None or job.status in FINAL_STATUSES:
+                return job
+            job.cancel_requested = True
+            if job.status == "queued":
+                job.status = "cancelled"
+                job.finished_at = datetime.utcnow()
+            db.commit()
+            db.refresh(job)
+            return job
+        finally:
+            db.close()
+
+    def _set(self, job_id: str, **fields):
+        db = SessionLocal()
+        try:
+            job = db.get(AnalysisJob, job_id)
+            for key, value in fields.items():
+                setattr(job, key, value)
+            db.commit()
+        finally:
+            db.close()
+
+    def _run(self, job_id: str):
+        db = SessionLocal()
+        try:
+            job = db.get(AnalysisJob, job_id)
+            if job is None or job.status != "queued":
+                return  # cancelled while waiting
+            job_type, params = job.job_type, json.loads(job.params or "{}")
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+            db.commit()
+        finally:
+            db.close()
+
+        ctx = JobContext(job_id, params)
+        os.makedirs(ctx.directory, exist_ok=True)
+        sink = ParquetSink(ctx.result_path, JOB_SCHEMAS.get(job_type))
+        started = time.perf_counter()
+        try:
+            message = JOB_TYPES[job_type](ctx, sink)
+            sink.close()
+            self._set(
+                job_id, status="succeeded", progress=1.0, result_path=ctx.result_path, result_rows=sink.rows,
+                message=f"{message} in {time.perf_counter() - started:.1f}s", finished_at=datetime.utcnow(),
+            )
+        except JobCancelled:
+            sink.close()
+            self._set(job_id, status="cancelled", message="Cancelled by request.", finished_at=datetime.utcnow())
+        except Exception as e:
+            print(f"CRITICAL: Job {job_id} ({job_type}) failed. {e}")
+            self._set(job_id, status="failed", message=str(e)[:500], finished_at=datetime.utcnow())
+        finally:
+            self._maybe_prune()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+job_manager = JobManager()
@@ -0,0 +1,423 @@
+import argparse
+import os
+from datetime import datetime, timedelta, date
+
+import pandas as pd
+from dotenv import load_dotenv
+from sqlalchemy import select, delete, text, func, inspect
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.database import (
+    SessionLocal,
+    engine,
+    AnalysisDailyRollup,
+    RegionalDisparityAnalysis,
+    FormularyDetailAnalysis,
+    TherapeuticEquivalentLog,
+    TherapeuticEquivalentAlternative,
+)
+
+load_dotenv()
+
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", 90))
+LOG_RETENTION_BATCH_SIZE = int(os.getenv("LOG_RETENTION_BATCH_SIZE", 5000))
+LOG_ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", "archive/analysis_logs")
+# Rollup rows per upsert statement, well under every driver's bind parameter limit.
+ROLLUP_UPSERT_CHUNK = 1000
+# Dialects `_rollup_upsert` can write to.
+ROLLUP_DIALECTS = ("postgresql", "mysql", "sqlite")
+
+# analysis_type -> (log model, rxcui column, statuses counted as "covered").
+# A status set of None means every row counts: therapeutic logs are only
+# written when alternatives were found.
+RETENTION_SPECS = {
+    "regional_disparity": (RegionalDisparityAnalysis, "rxcui", {"success"}),
+    "formulary_detail": (FormularyDetailAnalysis, "drug_rxcui", {"covered"}),
+    "therapeutic_equivalence": (TherapeuticEquivalentLog, "input_rxcui", None),
+}
+
+
+def _fetch_batch(db, model, cutoff: datetime, batch_size: int) -> pd.DataFrame:
+    stmt = (
+        select(model.__table__)
+        .where(model.timestamp < cutoff)
+        .order_by(model.id)
+        .limit(batch_size)
+    )
+    return pd.read_sql(stmt, db.connection())
+
+
+def _archive_frame(df: pd.DataFrame, archive_dir: str, analysis_type: str, name: str) -> list:
+    """
+    Writes one batch of raw rows as zstd-compressed Parquet, one file per
+    month of `timestamp` in that month's directory. Returns the file paths.
+    """
+    if "timestamp" in df:
+        months = pd.to_datetime(df["timestamp"]).dt.strftime("%Y-%m").fillna("undated")
+    else:
+        months = pd.Series("detached", index=df.index)
+    paths = []
+    for month, rows in df.groupby(months, sort=True):
+        out_dir = os.path.join(archive_dir, analysis_type, month)
+        os.makedirs(out_dir, exist_ok=True)
+        path = os.path.join(out_dir, f"{name}.parquet")
+        # Named by id range, so a re-run after a failed commit overwrites instead of duplicating.
+        rows.to_parquet(path, compression="zstd", index=False)
+        paths.append(path)
+    return paths
+
+
+def _rollup_batch(db, analysis_type: str, df: pd.DataFrame, rxcui_col: str, covered_statuses):
+    frame = pd.DataFrame({
+        "day": pd.to_datetime(df["timestamp"]).dt.date,
+        "rxcui": df[rxcui_col].astype(str),
+        "user_id": df["user_id"],
+        "covered": df["status"].isin(covered_statuses) if covered_statuses is not None else True,
+    })
+    grouped = frame.groupby(["day", "rxcui", "user_id"], dropna=False).agg(
+        request_count=("covered", "size"),
+        covered_count=("covered", "sum"),
+    ).reset_index()
+
+    rows = [
+        {
+            "analysis_type": analysis_type,
+            "day": row.day,
+            "rxcui": row.rxcui,
+            "user_id": None if pd.isna(row.user_id) else int(row.user_id),
+            "request_count": int(row.request_count),
+            "covered_count": int(row.covered_count),
+        }
+        for row in grouped.itertuples(index=False)
+    ]
+    for start in range(0, len(rows), ROLLUP_UPSERT_CHUNK):
+        db.execute(_rollup_upsert(db.get_bind().dialect.name, rows[start:start + ROLLUP_UPSERT_CHUNK]))
+    return len(grouped)
+
+
+def _rollup_upsert(dialect: str, rows):
+    """
+    One INSERT that adds the counts of `rows` onto existing rollups.
+    Groups without a user never conflict, since unique constraints treat
+    NULLs as distinct; they get a row per batch, which sums the same.
+    """
+    table = AnalysisDailyRollup.__table__
+    if dialect == "mysql":
+        stmt = mysql_insert(table).values(rows)
+        return stmt.on_duplicate_key_update(
+            request_count=table.c.request_count + stmt.inserted.request_count,
+            covered_count=table.c.covered_count + stmt.inserted.covered_count,
+        )
+    if dialect not in ROLLUP_DIALECTS:
+        raise ValueError(f"No rollup upsert for '{dialect}'.")
+    stmt = (postgresql_insert if dialect == "postgresql" else sqlite_insert)(table).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=["analysis_type", "day", "rxcui", "user_id"],
+        set_={
+            "request_count": table.c.request_count + stmt.excluded.request_count,
+            "covered_count": table.c.covered_count + stmt.excluded.covered_count,
+        },
+    )
+
+
+def prune_analysis_logs(
+    retention_days: int = LOG_RETENTION_DAYS,
+    batch_size: int = LOG_RETENTION_BATCH_SIZE,
+    archive_dir: str = LOG_ARCHIVE_DIR,
+):
+    """
+    Rolls raw analysis log rows older than `retention_days` up into
+    `analysis_daily_rollups`, archives them to Parquet and deletes them.
+    Each batch is committed on its own so locks stay short. Raises
+    ValueError up front, before anything is archived, if the database has
+    no rollup upsert.
+    """
+    if engine.dialect.name not in ROLLUP_DIALECTS:
+        raise ValueError(
+            f"Log retention supports {', '.join(ROLLUP_DIALECTS)}, not '{engine.dialect.name}'."
+        )
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    summary = {"cutoff": cutoff.isoformat(), "tables": {}}
+
+    for analysis_type, (model, rxcui_col, covered_statuses) in RETENTION_SPECS.items():
+        stats = {"archived_rows": 0, "rollup_groups": 0, "batches": 0, "files": []}
+        db = SessionLocal()
+        try:
+            while True:
+                df = _fetch_batch(db, model, cutoff, batch_size)
+                if df.empty:
+                    break
+
+                ids = df["id"].tolist()
+                name = f"{analysis_type}_{ids[0]}_{ids[-1]}"
+                stats["files"].extend(_archive_frame(df, archive_dir, analysis_type, name))
+
+                if model is TherapeuticEquivalentLog:
+                    alt_table = TherapeuticEquivalentAlternative.__table__
+                    alternatives = pd.read_sql(
+                        select(alt_table).where(alt_table.c.log_id.in_(ids)), db.connection()
+                    )
+                    if not alternatives.empty:
+                        alternatives["timestamp"] = alternatives["log_id"].map(df.set_index("id")["timestamp"])
+                        stats["files"].extend(
+                            _archive_frame(alternatives, archive_dir, analysis_type, f"{name}_alternatives")
+                        )
+                    db.execute(delete(alt_table).where(alt_table.c.log_id.in_(ids)))
+
+                stats["rollup_groups"] += _rollup_batch(db, analysis_type, df, rxcui_col, covered_statuses)
+                db.execute(delete(model.__table__).where(model.__table__.c.id.in_(ids)))
+                db.commit()
+
+                stats["archived_rows"] += len(ids)
+                stats["batches"] += 1
+                print(f"Pruned {len(ids)} rows from {model.__tablename__} (ids {ids[0]}-{ids[-1]})")
+        except Exception as e:
+            db.rollback()
+            print(f"CRITICAL: Log retention failed for {model.__tablename__}. {e}")
+            stats["error"] = str(e)
+        finally:
+            db.close()
+        summary["tables"][analysis_type] = stats
+
+    summary["dropped_partitions"] = drop_expired_partitions(cutoff)
+    return summary
+
+
+# --- Time-based partitioning (PostgreSQL only) ---
+
+def _month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _next_month(d: date) -> date:
+    return date(d.year + (d.month == 12), d.month % 12 + 1, 1)
+
+
+def _add_months(d: date, months: int) -> date:
+    d = _month_start(d)
+    for _ in range(months):
+        d = _next_month(d)
+    return d
+
+
+def _partition_name(table_name: str, month: date) -> str:
+    return f"{table_name}_y{month.year}m{month.month:02d}"
+
+
+def _is_partitioned(conn, table_name: str) -> bool:
+    return conn.execute(
+        text("SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :t"),
+        {"t": table_name},
+    ).first() is not None
+
+
+def _table_exists(conn, table_name: str) -> bool:
+    return conn.execute(text("SELECT to_regclass(:t)"), {"t": table_name}).scalar() is not None
+
+
+def _months(first: date, last: date):
+    month = _month_start(first)
+    while month <= last:
+        yield month
+        month = _next_month(month)
+
+
+def _create_index_ddl(model):
+    return [str(CreateIndex(index).compile(dialect=postgresql.dialect())) for index in model.__table__.indexes]
+
+
+def _alternatives_fk_ddl(table_name: str, legacy: str):
+    """
+    Statements that re-point the alternatives' log FK at the partitioned
+    table. A FK into a partitioned table has to include the partition key,
+    so alternatives get a `log_timestamp` column, backfilled here and filled
+    on insert by a trigger, and the FK covers (log_id, log_timestamp).
+    It is deferred, so rows can move between partitions inside a
+    transaction (see ensure_monthly_partitions).
+    """
+    alt = TherapeuticEquivalentAlternative.__tablename__
+    return [
+        f"ALTER TABLE {alt} DROP CONSTRAINT IF EXISTS {alt}_log_id_fkey",
+        f"ALTER TABLE {alt} ADD COLUMN IF NOT EXISTS log_timestamp TIMESTAMP WITHOUT TIME ZONE",
+        f"UPDATE {alt} a SET log_timestamp = l.timestamp FROM {legacy} l WHERE l.id = a.log_id",
+        f"CREATE OR REPLACE FUNCTION {alt}_set_log_timestamp() RETURNS trigger AS $$\n"
+        f"BEGIN\n"
+        f'    SELECT "timestamp" INTO NEW.log_timestamp FROM {table_name} WHERE id = NEW.log_id;\n'
+        f"    RETURN NEW;\n"
+        f"END\n"
+        f"$$ LANGUAGE plpgsql",
+        f"CREATE TRIGGER {alt}_log_timestamp BEFORE INSERT OR UPDATE OF log_id ON {alt} "
+        f"FOR EACH ROW EXECUTE FUNCTION {alt}_set_log_timestamp()",
+        f"ALTER TABLE {alt} ADD CONSTRAINT {alt}_log_fkey FOREIGN KEY (log_id, log_timestamp) "
+        f"REFERENCES {table_name} (id, timestamp) DEFERRABLE INITIALLY DEFERRED",
+    ]
+
+
+def partition_ddl(model, first_month: date, last_month: date):
+    """
+    One-time statements that convert an existing log table into a table
+    range-partitioned by month on `timestamp`. PostgreSQL requires the
+    partition key in the primary key, hence the composite (id, timestamp).
+
+    Monthly partitions from `first_month` (the oldest row) to `last_month`
+    are created before the rows are copied, so every row lands in its own
+    month and is dropped with it. The DEFAULT partition only catches rows
+    outside the pre-created range.
+    """
+    table_name = model.__tablename__
+    legacy = f"{table_name}_legacy"
+    statements = [
+        f"ALTER TABLE {table_name} RENAME TO {legacy}",
+        f"CREATE TABLE {table_name} (LIKE {legacy} INCLUDING DEFAULTS, "
+        f"PRIMARY KEY (id, timestamp), FOREIGN KEY (user_id) REFERENCES users (id)) "
+        f"PARTITION BY RANGE (timestamp)",
+    ]
+    statements += [
+        f"CREATE TABLE {_partition_name(table_name, month)} PARTITION OF {table_name} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')"
+        for month in _months(first_month, last_month)
+    ]
+    statements += [
+        f"CREATE TABLE {table_name}_default PARTITION OF {table_name} DEFAULT",
+        f"INSERT INTO {table_name} SELECT * FROM {legacy}",
+        # The id sequence is owned by the legacy column and would be dropped with it.
+        f"ALTER SEQUENCE {table_name}_id_seq OWNED BY {table_name}.id",
+    ]
+    if model is TherapeuticEquivalentLog:
+        statements += _alternatives_fk_ddl(table_name, legacy)
+    statements.append(f"DROP TABLE {legacy}")
+    # The legacy indexes went with the table; recreate them under the same names.
+    return statements + _create_index_ddl(model)
+
+
+def partition_range(model, months_ahead: int = 3):
+    """First and last month to pre-create when converting `model`'s table: its oldest row to `months_ahead` out."""
+    with engine.connect() as conn:
+        oldest = conn.execute(select(func.min(model.timestamp))).scalar()
+    this_month = _month_start(datetime.utcnow().date())
+    first = _month_start(oldest.date()) if oldest is not None else this_month
+    return first, _add_months(this_month, months_ahead)
+
+
+def ensure_log_indexes():
+    """Creates the log indexes that `create_all` does not add to tables that already exist."""
+    created = []
+    for model, _, _ in RETENTION_SPECS.values():
+        existing = {index["name"] for index in inspect(engine).get_indexes(model.__tablename__)}
+        for index in model.__table__.indexes:
+            if index.name not in existing:
+                index.create(engine)
+                created.append(index.name)
+    return created
+
+
+def ensure_monthly_partitions(months_ahead: int = 3):
+    """Creates the current and upcoming monthly partitions for every partitioned log table."""
+    if engine.dialect.name != "postgresql":
+        print(f"INFO: Partitioning is not supported on '{engine.dialect.name}', skipping.")
+        return []
+
+    this_month = _month_start(datetime.utcnow().date())
+    created = []
+    with engine.begin() as conn:
+        for model, _, _ in RETENTION_SPECS.values():
+            table_name = model.__tablename__
+            if not _is_partitioned(conn, table_name):
+                continue
+            default = f"{table_name}_default"
+            for month in _months(this_month, _add_months(this_month, months_ahead)):
+                name = _partition_name(table_name, month)
+                if _table_exists(conn, name):
+                    continue
+                lo, hi = month.isoformat(), _next_month(month).isoformat()
+                bounds = f"FOR VALUES FROM ('{lo}') TO ('{hi}')"
+                in_range = f"\"timestamp\" >= '{lo}' AND \"timestamp\" < '{hi}'"
+                if _table_exists(conn, default) and conn.execute(
+                    text(f"SELECT 1 FROM {default} WHERE {in_range} LIMIT 1")
+                ).first() is not None:
+                    # PostgreSQL refuses a partition whose range the default partition
+                    # already holds rows for, so move those rows into it before attaching.
+                    conn.execute(text(
+                        f"CREATE TABLE {name} (LIKE {table_name} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+                    ))
+                    conn.execute(text(f"INSERT INTO {name} SELECT * FROM {default} WHERE {in_range}"))
+                    conn.execute(text(f"DELETE FROM {default} WHERE {in_range}"))
+                    conn.execute(text(f"ALTER TABLE {table_name} ATTACH PARTITION {name} {bounds}"))
+                else:
+                    conn.execute(text(f"CREATE TABLE {name} PARTITION OF {table_name} {bounds}"))
+                created.append(name)
+    return created
+
+
+def drop_expired_partitions(cutoff: datetime):
+    """Drops monthly partitions that end before `cutoff` and have already been pruned empty."""
+    if engine.dialect.name != "postgresql":
+        return []
+
+    dropped = []
+    with engine.begin() as conn:
+        for model, _, _ in RETENTION_SPECS.values():
+            table_name = model.__tablename__
+            if not _is_partitioned(conn, table_name):
+                continue
+            partitions = conn.execute(text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :t"
+            ), {"t": table_name}).scalars().all()
+            for name in partitions:
+                suffix = name[len(table_name):]
+                if not suffix.startswith("_y"):
+                    continue
+                month = date(int(suffix[2:6]), int(suffix[7:9]), 1)
+                if _next_month(month) > cutoff.date():
+                    continue
+                if conn.execute(text(f"SELECT 1 FROM {name} LIMIT 1")).first() is not None:
+                    continue
+                conn.execute(text(f"ALTER TABLE {table_name} DETACH PARTITION {name}"))
+                conn.execute(text(f"DROP TABLE {name}"))
+                dropped.append(name)
+    return dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Roll up, archive and prune analysis log tables.")
+    parser.add_argument("--days", type=int, default=LOG_RETENTION_DAYS, help="Keep raw rows for this many days.")
+    parser.add_argument("--batch-size", type=int, default=LOG_RETENTION_BATCH_SIZE)
+    parser.add_argument("--archive-dir", default=LOG_ARCHIVE_DIR)
+    parser.add_argument("--partitions-ahead", type=int, default=3,
+                        help="Monthly partitions to pre-create on partitioned tables (PostgreSQL).")
+    parser.add_argument("--print-partition-ddl", action="store_true",
+                        help="Print the one-time conversion DDL for partitioning and exit.")
+    args = parser.parse_args()
+
+    if not args.print_partition_ddl and engine.dialect.name not in ROLLUP_DIALECTS:
+        parser.error(f"log retention supports {', '.join(ROLLUP_DIALECTS)}; this database is '{engine.dialect.name}'.")
+
+    if args.print_partition_ddl:
+        for model, _, _ in RETENTION_SPECS.values():
+            for statement in partition_ddl(model, *partition_range(model, args.partitions_ahead)):
+                print(f"{statement};")
+        return
+
+    indexed = ensure_log_indexes()
+    if indexed:
+        print(f"Created missing indexes: {indexed}")
+    created = ensure_monthly_partitions(args.partitions_ahead)
+    if created:
+        print(f"Ensured partitions: {created}")
+
+    summary = prune_analysis_logs(args.days, args.batch_size, args.archive_dir)
+    for analysis_type, stats in summary["tables"].items():
+        print(f"✅ {analysis_type}: archived {stats['archived_rows']} rows in {stats['batches']} batches, "
+              f"{stats['rollup_groups']} rollup groups updated")
+    if summary["dropped_partitions"]:
+        print(f"Dropped expired partitions: {summary['dropped_partitions']}")
+
+
+if __name__ == "__main__":
+    main()
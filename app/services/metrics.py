@@ -0,0 +1,372 @@
+"""
+Prometheus metrics without a client library: a handful of counters,
+gauges and fixed-bucket histograms, rendered in the text exposition format
+on `/metrics`. Each thread records into its own dict, so recording takes no
+lock; a scrape merges the threads' dicts.
+
+Under serve.py every forked worker keeps its own values. Each worker writes
+a snapshot to METRICS_DIR every METRICS_FLUSH_INTERVAL seconds, and the
+worker that answers a scrape merges the other workers' snapshots with its
+own live values. Counters and histograms are summed across workers,
+including workers that have exited, so totals never go backwards when one
+is restarted. Gauges are reported per live worker.
+"""
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 5))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Taken when a thread records into a metric for the first time, and by scrapes; never per update.
+_lock = threading.Lock()
+
+
+class _Metric:
+    """
+    Values are sharded per thread: a thread only ever writes its own dict, so
+    an update is a plain dict operation. `collect` merges the shards, and
+    folds those of exited threads into `_retired` so their counts persist.
+    """
+
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self._local = threading.local()
+        self._shards = []  # (thread, values) for every live thread that recorded a value
+        self._retired = {}
+
+    def _shard(self) -> dict:
+        values = getattr(self._local, "values", None)
+        if values is None:
+            values = self._local.values = {}
+            with _lock:
+                self._shards.append((threading.current_thread(), values))
+        return values
+
+    def _merge(self, into: dict, values: dict):
+        for key, value in values.items():
+            into[key] = into.get(key, 0.0) + value
+
+    def collect(self) -> dict:
+        """This process's values, merged across threads, as a new dict."""
+        with _lock:
+            live = []
+            for thread, values in self._shards:
+                if thread.is_alive():
+                    live.append((thread, values))
+                else:
+                    self._merge(self._retired, values)  # no one writes to it any more
+            self._shards = live
+            merged = {}
+            self._merge(merged, self._retired)
+            for _, values in live:
+                # dict() copies in one step under the GIL, while the owning thread may be writing.
+                self._merge(merged, dict(values))
+        return merged
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, label_values=(), amount: float = 1.0):
+        values = self._shard()
+        values[label_values] = values.get(label_values, 0.0) + amount
+
+
+class Gauge(Counter):
+    """`inc`/`dec` add up across threads; `set` replaces the value for all of them."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels=()):
+        super().__init__(name, help_text, labels)
+        self._set_values = {}
+
+    def dec(self, label_values=(), amount: float = 1.0):
+        self.inc(label_values, -amount)
+
+    def set(self, label_values=(), value: float = 0.0):
+        self._set_values[label_values] = value  # a single assignment, atomic under the GIL
+
+    def collect(self) -> dict:
+        merged = super().collect()
+        self._merge(merged, dict(self._set_values))
+        return merged
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        # Per shard: label values -> [count per bucket (non-cumulative, +Inf last), sum]
+
+    def observe(self, label_values, value: float):
+        i = bisect_left(self.buckets, value)
+        values = self._shard()
+        entry = values.get(label_values)
+        if entry is None:
+            entry = values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][i] += 1
+        entry[1] += value
+
+    def _merge(self, into: dict, values: dict):
+        for key, (counts, total) in values.items():
+            entry = into.get(key)
+            if entry is None:
+                into[key] = [list(counts), total]
+            else:
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency by route.",
+                            ("method", "route", "status"))
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being served.")
+MODEL_CALL_SECONDS = Histogram("model_call_duration_seconds",
+                               "Model call run time, on the model executor or directly in a handler.", ("model",))
+MODEL_QUEUE_SECONDS = Histogram("model_call_queue_seconds", "Time a model call waited for a free worker.",
+                                ("model",))
+DB_COMMIT_SECONDS = Histogram("db_commit_duration_seconds", "SQLAlchemy session commit time.")
+
+METRICS = [REQUEST_SECONDS, REQUESTS_IN_FLIGHT, MODEL_CALL_SECONDS, MODEL_QUEUE_SECONDS, DB_COMMIT_SECONDS]
+
+
+@contextmanager
+def timed_model_call(model: str):
+    """Records the block's run time in MODEL_CALL_SECONDS, for model calls that bypass the model executor."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        MODEL_CALL_SECONDS.observe((model,), time.perf_counter() - started)
+
+
+def _collect_process_gauges():
+    """Point-in-time values that are cheaper to read at scrape time than to track."""
+    from app.ml_models.executor import model_executor
+    from app.ml_models.result_cache import result_cache
+
+    gauges = {}
+    try:
+        with open("/proc/self/statm") as f:
+            gauges["process_resident_memory_bytes"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        gauges["process_resident_memory_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    executor = model_executor.stats()
+    gauges["model_executor_in_flight"] = executor["in_flight"]
+    gauges["model_executor_queue_depth"] = executor["queue_depth"]
+
+    cache = result_cache.stats()
+    gauges["result_cache_memory_bytes"] = cache["memory_bytes"]
+    cache_counts = {endpoint: {k: m[k] for k in ("memory_hits", "disk_hits", "misses")}
+                    for endpoint, m in cache["endpoints"].items()}
+    return gauges, cache_counts
+
+
+def snapshot():
+    """This process's values in a JSON-serializable form."""
+    gauges, cache_counts = _collect_process_gauges()
+    metrics = {m.name: [[list(k), v] for k, v in m.collect().items()] for m in METRICS}
+    return {"pid": os.getpid(), "written": time.time(), "metrics": metrics,
+            "gauges": gauges, "cache": cache_counts}
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _snapshots():
+    own = snapshot()
+    snapshots = [own]
+    if METRICS_DIR:
+        for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+            try:
+                with open(path) as f:
+                    other = json.load(f)
+            except (OSError, ValueError):
+                continue  # being replaced right now
+            if other["pid"] != own["pid"]:
+                other["alive"] = _alive(other["pid"])
+                snapshots.append(other)
+    own["alive"] = True
+    return snapshots
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def render() -> str:
+    snapshots = _snapshots()
+    lines = []
+
+    for metric in METRICS:
+        merged = {}
+        for snap in snapshots:
+            if metric.kind == "gauge" and not snap["alive"]:
+                continue
+            for key, value in snap["metrics"].get(metric.name, []):
+                key = tuple(key)
+                if metric.kind == "histogram":
+                    entry = merged.setdefault(key, [[0] * (len(metric.buckets) + 1), 0.0])
+                    entry[0] = [a + b for a, b in zip(entry[0], value[0])]
+                    entry[1] += value[1]
+                else:
+                    merged[key] = merged.get(key, 0.0) + value
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for key, value in sorted(merged.items()):
+            if metric.kind != "histogram":
+                lines.append(f"{metric.name}{_labels(metric.labels, key)} {value:g}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(metric.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = bound if bound == "+Inf" else f"{bound:g}"
+                lines.append(f"{metric.name}_bucket{_labels(metric.labels, key, {'le': le})} {cumulative}")
+            lines.append(f"{metric.name}_sum{_labels(metric.labels, key)} {total:.6f}")
+            lines.append(f"{metric.name}_count{_labels(metric.labels, key)} {cumulative}")
+
+    cache = {}
+    for snap in snapshots:
+        for endpoint, counts in snap.get("cache", {}).items():
+            merged = cache.setdefault(endpoint, {"memory_hits": 0, "disk_hits": 0, "misses": 0})
+            for outcome, count in counts.items():
+                merged[outcome] += count
+    lines.append("# HELP result_cache_requests_total Result cache lookups by endpoint and outcome.")
+    lines.append("# TYPE result_cache_requests_total counter")
+    for endpoint, counts in sorted(cache.items()):
+        for outcome, count in counts.items():
+            lines.append(f"result_cache_requests_total{_labels(('endpoint', 'outcome'), (endpoint, outcome))} {count}")
+    lines.append("# HELP result_cache_hit_ratio Share of result cache lookups served from either tier.")
+    lines.append("# TYPE result_cache_hit_ratio gauge")
+    for endpoint, counts in sorted(cache.items()):
+        total = sum(counts.values())
+        ratio = (counts["memory_hits"] + counts["disk_hits"]) / total if total else 0.0
+        lines.append(f"result_cache_hit_ratio{_labels(('endpoint',), (endpoint,))} {ratio:.4f}")
+
+    for name in snapshots[0]["gauges"]:
+        lines.append(f"# TYPE {name} gauge")
+        for snap in snapshots:
+            if snap["alive"] and name in snap["gauges"]:
+                lines.append(f"{name}{_labels(('worker',), (snap['pid'],))} {snap['gauges'][name]}")
+
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware timing every HTTP request. Requests are labelled
+    with the matched route template, never the raw path, so label
+    cardinality stays bounded by the number of routes.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(
+                (scope["method"], getattr(route, "path", "unmatched"), str(status_code)),
+                time.perf_counter() - started,
+            )
+
+
+def instrument_sessions(session_class):
+    """Times every commit of `session_class` (a sessionmaker or Session subclass)."""
+    from sqlalchemy import event
+
+    @event.listens_for(session_class, "before_commit")
+    def _before_commit(session):
+        session.info["commit_started"] = time.perf_counter()
+
+    @event.listens_for(session_class, "after_commit")
+    def _after_commit(session):
+        started = session.info.pop("commit_started", None)
+        if started is not None:
+            DB_COMMIT_SECONDS.observe((), time.perf_counter() - started)
+
+    @event.listens_for(session_class, "after_rollback")
+    def _after_rollback(session):
+        session.info.pop("commit_started", None)
+
+
+class MetricsFlusher:
+    """Writes this worker's snapshot to METRICS_DIR periodically, so other workers can include it."""
+
+    def __init__(self, directory: str = METRICS_DIR, interval: float = METRICS_FLUSH_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def flush(self):
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def start(self):
+        if not self.directory or self.interval <= 0 or self._thread is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="metrics-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            try:
+                self.flush()  # keep this worker's final counts in the totals
+            except OSError as e:
+                print(f"Could not write final metrics snapshot: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Could not write metrics snapshot: {e}")
+
+
+metrics_flusher = MetricsFlusher()
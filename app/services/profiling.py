@@ -0,0 +1,221 @@
+"""
+Opt-in profiling of single requests. A superuser sends `X-Profile: 1` on any
+/api/* request, and the worker samples the Python stacks of all its threads
+every PROFILE_INTERVAL_MS while that request runs. The result is written to
+PROFILE_DIR in the folded-stack format, one `frame;frame;frame count` line
+per distinct stack. flamegraph.pl, speedscope and inferno read it directly.
+The response carries the profile id in `X-Profile-Id`. The profile can be
+fetched from /admin/profiles/{id} by any worker.
+
+The sampler sees every thread of the worker, so concurrent requests show up
+in the same profile. Threads parked in a wait or select are skipped. With a
+model worker pool, model calls run in other processes and show up only as
+the awaiting frame. Set MODEL_WORKERS=0 on the profiled worker to see them.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from fastapi.concurrency import run_in_threadpool
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+# Sampling stops after this long even if the request is still running.
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+# Oldest profiles are deleted beyond this many.
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 200))
+
+PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+# Top frames of a thread that is parked rather than working.
+_IDLE_FRAMES = {
+    ("threading.py", "wait"), ("queue.py", "get"), ("selectors.py", "select"),
+    ("threading.py", "_wait_for_tstate_lock"), ("socket.py", "accept"),
+}
+
+
+class SamplingProfiler:
+    """Counts the stacks of all other threads of this process at a fixed interval."""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000, max_seconds: float = PROFILE_MAX_SECONDS):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    @staticmethod
+    def _frame_name(code):
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample(self, own_ident: int):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            if (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in _IDLE_FRAMES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_name(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            self._sample(own_ident)
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _superuser_for(authorization: str):
+    """The superuser behind a bearer token, or None. Runs on the threadpool; one DB lookup."""
+    from jose import JWTError, jwt
+    from app.database import SessionLocal, User
+    from app.security import SECRET_KEY, ALGORITHM
+
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        username = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        return None
+    if username is None:
+        return None
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == username).first()
+        return user.username if user is not None and user.is_superuser else None
+    finally:
+        db.close()
+
+
+def _save_profile(profile_id: str, profiler: SamplingProfiler, meta: dict):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, profile_id)
+    for suffix, content in ((".folded", profiler.folded()), (".json", json.dumps(meta))):
+        tmp_path = f"{base}{suffix}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, base + suffix)
+
+    profiles = sorted(
+        (os.path.join(PROFILE_DIR, name) for name in os.listdir(PROFILE_DIR) if name.endswith(".json")),
+        key=os.path.getmtime,
+    )
+    for path in (profiles[:-PROFILE_KEEP] if PROFILE_KEEP > 0 else []):
+        for suffix in (".json", ".folded"):
+            try:
+                os.remove(path[:-len(".json")] + suffix)
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        if name.endswith(".json"):
+            try:
+                with open(os.path.join(PROFILE_DIR, name)) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return sorted(profiles, key=lambda p: p["created_at"], reverse=True)
+
+
+def profile_path(profile_id: str):
+    """Path of a stored folded profile, or None for unknown or malformed ids."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.folded")
+    return path if os.path.exists(path) else None
+
+
+class ProfilingMiddleware:
+    """
+    Profiles /api/* requests that carry the X-Profile header and a superuser
+    token. One request per worker is profiled at a time. Other requests
+    asking for a profile while one runs are served normally, with
+    `X-Profile-Status: busy`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._busy = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/"):
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        if headers.get(PROFILE_HEADER, b"").lower() not in (b"1", b"true", b"yes"):
+            return await self.app(scope, receive, send)
+
+        username = await run_in_threadpool(_superuser_for, headers.get(b"authorization", b"").decode("latin-1"))
+        if username is None:
+            return await self.app(scope, receive, send)
+
+        if not self._busy.acquire(blocking=False):
+            async def send_busy(message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = [*message.get("headers", []), (b"x-profile-status", b"busy")]
+                await send(message)
+            return await self.app(scope, receive, send_busy)
+
+        profile_id = uuid.uuid4().hex
+        status_code = 500
+
+        async def send_with_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        profiler = SamplingProfiler()
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.stop()
+            self._busy.release()
+            meta = {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "status": status_code,
+                "user": username,
+                "pid": os.getpid(),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                "samples": profiler.samples,
+                "interval_ms": PROFILE_INTERVAL_MS,
+                "created_at": time.time(),
+            }
+            try:
+                await run_in_threadpool(_save_profile, profile_id, profiler, meta)
+            except OSError as e:
+                print(f"Could not store profile {profile_id}: {e}")
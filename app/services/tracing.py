@@ -0,0 +1,238 @@
+"""
+Lightweight request tracing: a sampled request carries a Trace in a
+context variable, and `span(name)` records how long each phase took. The
+phases are token verification, the endpoint body, model calls, DB commits
+and response validation.
+
+Unsampled requests pay for one random() call. Every `span()` they reach
+is a no-op. Finished traces go to the exporters named in TRACE_EXPORT:
+- "file" appends one JSON line per trace to TRACE_FILE from a background
+  thread.
+- "memory" keeps the last TRACE_BUFFER traces of this worker for
+  /admin/traces.
+"""
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from fastapi.routing import APIRoute
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0))
+TRACE_EXPORT = {name.strip() for name in os.getenv("TRACE_EXPORT", "file,memory").split(",") if name.strip()}
+TRACE_FILE = os.getenv("TRACE_FILE", "traces/spans.jsonl")
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", 1000))
+
+_current_trace = ContextVar("current_trace", default=None)
+_current_span = ContextVar("current_span", default=None)
+
+
+class Trace:
+    def __init__(self, name: str):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.started_at = time.time()
+        self.t0 = time.perf_counter()
+        self.spans = []
+        self.attributes = {}
+        # Sync dependencies and endpoints add spans from threadpool threads.
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start: float, end: float, parent=None, **attributes):
+        with self._lock:
+            span_id = len(self.spans)
+            self.spans.append({
+                "id": span_id,
+                "parent": parent,
+                "name": name,
+                "start_ms": round((start - self.t0) * 1000, 3),
+                "duration_ms": round((end - start) * 1000, 3),
+                **({"attributes": attributes} if attributes else {}),
+            })
+        return span_id
+
+    def to_dict(self, duration: float):
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(duration * 1000, 3),
+            "pid": os.getpid(),
+            **self.attributes,
+            "spans": self.spans,
+        }
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Times the enclosed block as a child of the current span, if the request is being traced."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    # Reserve the id first, so children started inside the block can point at it.
+    span_id = trace.add_span(name, time.perf_counter(), time.perf_counter(), _current_span.get(), **attributes)
+    token = _current_span.set(span_id)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _current_span.reset(token)
+        entry = trace.spans[span_id]
+        entry["start_ms"] = round((start - trace.t0) * 1000, 3)
+        entry["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+
+
+def instrument_sessions(session_class):
+    """Records every commit of `session_class` as a "db.commit" span of the current trace."""
+    from sqlalchemy import event
+
+    @event.listens_for(session_class, "before_commit")
+    def _before_commit(session):
+        if _current_trace.get() is not None:
+            session.info["trace_commit_started"] = time.perf_counter()
+
+    @event.listens_for(session_class, "after_commit")
+    def _after_commit(session):
+        started = session.info.pop("trace_commit_started", None)
+        trace = _current_trace.get()
+        if started is not None and trace is not None:
+            trace.add_span("db.commit", started, time.perf_counter(), _current_span.get())
+
+    @event.listens_for(session_class, "after_rollback")
+    def _after_rollback(session):
+        session.info.pop("trace_commit_started", None)
+
+
+# --- exporters ---
+
+recent_traces = deque(maxlen=TRACE_BUFFER)
+_file_queue = queue.SimpleQueue()
+_writer_lock = threading.Lock()
+_writer = None
+
+
+def _write_traces():
+    os.makedirs(os.path.dirname(TRACE_FILE) or ".", exist_ok=True)
+    # O_APPEND with one write per line keeps lines from several workers intact.
+    fd = os.open(TRACE_FILE, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    while True:
+        record = _file_queue.get()
+        try:
+            os.write(fd, (json.dumps(record, default=str) + "\n").encode("utf-8"))
+        except OSError as e:
+            print(f"Could not write trace: {e}")
+
+
+def export(record: dict):
+    global _writer
+    if "memory" in TRACE_EXPORT:
+        recent_traces.append(record)
+    if "file" in TRACE_EXPORT:
+        if _writer is None or _writer[0] != os.getpid():
+            with _writer_lock:
+                if _writer is None or _writer[0] != os.getpid():
+                    thread = threading.Thread(target=_write_traces, name="trace-writer", daemon=True)
+                    thread.start()
+                    _writer = (os.getpid(), thread)
+        _file_queue.put(record)
+
+
+def summarize(traces) -> dict:
+    """Per span name: count and latency percentiles, over the given traces."""
+    durations = {}
+    for trace in traces:
+        durations.setdefault("request", []).append(trace["duration_ms"])
+        for s in trace["spans"]:
+            durations.setdefault(s["name"], []).append(s["duration_ms"])
+
+    def percentile(values, q):
+        return values[round(q * (len(values) - 1))]
+
+    summary = {}
+    for name, values in durations.items():
+        values.sort()
+        summary[name] = {
+            "count": len(values),
+            "p50_ms": percentile(values, 0.50),
+            "p95_ms": percentile(values, 0.95),
+            "p99_ms": percentile(values, 0.99),
+            "max_ms": values[-1],
+        }
+    return summary
+
+
+# --- request and endpoint hooks ---
+
+class TracingMiddleware:
+    """
+    Samples TRACE_SAMPLE_RATE of HTTP requests. The time between the
+    endpoint returning and the response starting is recorded as the
+    "response_validation" span, which covers response_model validation and
+    serialization.
+    """
+
+    def __init__(self, app, sample_rate: float = TRACE_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return await self.app(scope, receive, send)
+
+        trace = Trace(f"{scope['method']} {scope['path']}")
+        token = _current_trace.set(trace)
+        status_code = 500
+
+        async def send_traced(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                handler = next((s for s in reversed(trace.spans) if s["name"] == "endpoint"), None)
+                if handler is not None:
+                    handler_end = trace.t0 + (handler["start_ms"] + handler["duration_ms"]) / 1000
+                    trace.add_span("response_validation", handler_end, time.perf_counter())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            _current_trace.reset(token)
+            route = scope.get("route")
+            if route is not None:
+                trace.name = f"{scope['method']} {route.path}"
+            trace.attributes.update({"path": scope["path"], "status": status_code})
+            export(trace.to_dict(time.perf_counter() - trace.t0))
+
+
+def _traced_endpoint(endpoint):
+    # include_router copies routes with the already wrapped endpoint; wrap only once.
+    if getattr(endpoint, "__traced__", False):
+        return endpoint
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def traced(*args, **kwargs):
+            with span("endpoint"):
+                return await endpoint(*args, **kwargs)
+    else:
+        @functools.wraps(endpoint)
+        def traced(*args, **kwargs):
+            with span("endpoint"):
+                return endpoint(*args, **kwargs)
+    traced.__traced__ = True
+    return traced
+
+
+class TracedRoute(APIRoute):
+    """Route class that times the endpoint body, apart from dependencies and response validation."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _traced_endpoint(endpoint), **kwargs)
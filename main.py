@@ -1,23 +1,25 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from fastapi import Header, HTTPException
+import anyio.to_thread
 import sys
 import os
-import pickle
 from app.routers import chatbot
 
 # This path fix ensures the server can always find your modules.
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__))))
 
-# Import all model helper classes
-from app.ml_models.regional_disparity_helper import RegionalDisparityModel
-from app.ml_models.formulary_detail_helper import FormularyAnalyzer
-
-from app.ml_models.um_change_analyzer_helper import UMFormularyChangesAnalyzer
-from app.ml_models.therapeutic_eq_helper import PBMRecommender
-from app.ml_models.drug_utilization_helper import DrugUtilizationForecaster
+# Artifact table: file, loader and validator for every model
+from app.ml_models.loaders import MODEL_ARTIFACTS, artifact_path, load_artifact
+from app.ml_models.hot_reload import artifact_watcher
 
 # Import the central model registry
-from app.ml_models.registry import ml_models
+from app.ml_models.registry import ml_models, register_model
+from app.ml_models.executor import model_executor
+from app.ml_models.single_flight import single_flight
+from app.ml_models.result_cache import result_cache
+from app.ml_models.autocomplete import get_autocomplete_index
 
 # Import all routers
 from app.routers import (
@@ -27,10 +29,19 @@ from app.routers import (
     therapeutic_equivalence,
     um_change_router,
     drug_utilization_router,
-    cpmp_analysis
+    cpmp_analysis,
+    drug_profile,
+    admin,
+    jobs,
+    export,
+    coverage_timeline,
+    autocomplete
 )
 
 from app import database
+from app.services.Email_service import dispatcher as email_dispatcher
+from app.services.jobs import job_manager
+from app.services import metrics, tracing, profiling
 
 # Create DB tables if they don't exist
 database.Base.metadata.create_all(bind=database.engine)
@@ -38,63 +49,67 @@ database.Base.metadata.create_all(bind=database.engine)
 app = FastAPI(title="CTS Project API")
 
 
+def load_models():
+    """Loads every model artifact into the registry. serve.py calls this once in the master before forking."""
+    print("Loading ML models...")
+
+    for key, (filename, _, _, name) in MODEL_ARTIFACTS.items():
+        try:
+            register_model(key, load_artifact(key), artifact_path(key))
+        except FileNotFoundError:
+            print(f"INFO: '{filename}' not found, skipping the {name}. Please run the training script.")
+        except Exception as e:
+            print(f"CRITICAL: Failed to load the {name}. {e}")
+
+    print(f"Successfully loaded models: {list(ml_models.keys())}")
+    # Built here too, so serve.py's workers inherit the index instead of each building it.
+    print(f"Autocomplete index built with {len(get_autocomplete_index())} entries")
+
+
 @app.on_event("startup")
 def startup_event():
-    print("Application is starting up, loading ML models...")
-
-    # --- Load Regional Disparity Model ---
+    # Under serve.py the models were preloaded in the master and are inherited copy-on-write.
+    if ml_models:
+        print(f"Application is starting up with preloaded models: {list(ml_models.keys())}")
+    else:
+        print("Application is starting up, loading ML models...")
+        load_models()
+
+    pruned = result_cache.prune_stale_versions()
+    if pruned:
+        print(f"Pruned {pruned} cached results from replaced model artifacts.")
+
+    thread_limit = os.getenv("ANYIO_THREAD_LIMIT")
+    if thread_limit:
+        anyio.to_thread.current_default_thread_limiter().total_tokens = int(thread_limit)
+
+    # Fork the model workers before any other background threads exist.
     try:
-        regional_model = RegionalDisparityModel.load_model("app/ml_models/models/regional_disparity_model_.pkl")
-        ml_models["regional_disparity"] = regional_model
+        model_executor.start()
     except Exception as e:
-        print(f"CRITICAL: Failed to load the Regional Disparity model. {e}")
+        print(f"CRITICAL: Failed to start the model worker pool, falling back to threads. {e}")
 
-    # --- Load Formulary Analyzer Model ---
     try:
-        formulary_model = FormularyAnalyzer.load_model_state("app/ml_models/models/formulary_analyzer_model.pkl")
-        ml_models["formulary_analyzer"] = formulary_model
+        email_dispatcher.start()
     except Exception as e:
-        print(f"CRITICAL: Failed to load the Formulary Analyzer model. {e}")
+        print(f"CRITICAL: Failed to start the email dispatcher. {e}")
 
     try:
-        with open("app/ml_models/models/th_eq.pkl", "rb") as f:
-            model_data = pickle.load(f)
-        th_eq_model = PBMRecommender(df=model_data)
-        ml_models["therapeutic_equivalence"] = th_eq_model
-    except FileNotFoundError:
-        print("INFO: 'th_eq.pkl' data file not found. Please run the training script.")
+        job_manager.start()
     except Exception as e:
-        print(f"CRITICAL: Failed to load the Therapeutic Equivalence model. Error: {e}")
+        print(f"CRITICAL: Failed to start the job runner. {e}")
 
-    # --- Load Drug Utilization Model (Robust Method) ---
-    try:
-        with open("app/ml_models/models/drug_utilization_models.pkl", "rb") as f:
-            bundle = pickle.load(f)
-        utilization_model = DrugUtilizationForecaster(models_dict=bundle['models'], dataframe=bundle['dataframe'])
-        ml_models["drug_utilization"] = utilization_model
-        print("✅ Drug Utilization Forecast model loaded successfully.")
-    except FileNotFoundError:
-        print("INFO: 'drug_utilization_models.pkl' not found. Please run the training script.")
-    except Exception as e:
-        print(f"CRITICAL: Failed to load the Drug Utilization model. Error: {e}")
+    artifact_watcher.start()
+    metrics.metrics_flusher.start()
 
-    # --- Load all UM Change Analyzer models ---
-    um_comparisons = {
-        "um_change_jun_to_jul": "um_analyzer_junetojuly.pkl",
-        "um_change_jul_to_aug": "um_analyzer_julytoaugust.pkl",
-        "um_change_jun_to_aug": "um_analyzer_junetoaugust.pkl",
-    }
-    for key, filename in um_comparisons.items():
-        try:
-            path = f"app/ml_models/models/{filename}"
-            with open(path, "rb") as f:
-                 ml_models[key] = pickle.load(f)
-        except FileNotFoundError:
-            print(f"INFO: UM Analyzer file not found, skipping: {filename}")
-        except Exception as e:
-            print(f"CRITICAL: Failed to load UM Analyzer '{filename}'. {e}")
 
-    print(f"Successfully loaded models: {list(ml_models.keys())}")
+@app.on_event("shutdown")
+def shutdown_event():
+    metrics.metrics_flusher.stop()
+    artifact_watcher.stop()
+    email_dispatcher.stop()
+    job_manager.shutdown()
+    model_executor.shutdown()
 
 
 # --- Middleware ---
@@ -106,6 +121,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(profiling.ProfilingMiddleware)
+app.add_middleware(tracing.TracingMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_sessions(database.SessionLocal)
+tracing.instrument_sessions(database.SessionLocal)
 
 # --- Routers ---
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
@@ -118,7 +138,32 @@ app.include_router(drug_utilization_router.router, prefix="/api", tags=["Drug Ut
 app.include_router(chatbot.router, prefix="/api", tags=["chat"])
 
 app.include_router(cpmp_analysis.router, prefix="/api", tags=["CPMP Analysis"])
+app.include_router(drug_profile.router, prefix="/api", tags=["Drug Profile"])
+app.include_router(coverage_timeline.router, prefix="/api", tags=["Formulary_Impact"])
+app.include_router(autocomplete.router, prefix="/api", tags=["Autocomplete"])
+app.include_router(jobs.router, prefix="/api", tags=["Jobs"])
+app.include_router(export.router, prefix="/api", tags=["Export"])
+app.include_router(admin.router, prefix="/admin", tags=["Admin"])
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the CTS Project API"}
 
+
+@app.get("/executor/stats", tags=["Operations"])
+def executor_stats():
+    return {
+        **model_executor.stats(),
+        "coalescing": single_flight.stats(),
+        "result_cache": result_cache.stats(),
+    }
+
+
+# Optional shared secret for scrapers; without it /metrics is open like /executor/stats.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+
+@app.get("/metrics", tags=["Operations"], response_class=PlainTextResponse)
+def prometheus_metrics(authorization: str = Header(None)):
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token.")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -1,4 +1,5 @@
 import subprocess
+import sys
 import time
 import psutil
 import os
@@ -8,13 +9,18 @@ def main():
     """
     Starts the FastAPI server as a separate process and measures its memory usage
     after the models have loaded. It correctly measures the parent process and all
-    child worker processes.
+    child worker processes, splitting each one into memory it owns (USS) and
+    copy-on-write pages it shares with the others.
+
+    Pass --uvicorn to measure a bare `uvicorn main:app` instead of serve.py.
     """
     print("--- Starting FastAPI Server for Memory Check ---")
 
-    # Command to start your Uvicorn server
-    # This assumes your main application instance is named 'app' in 'main.py'
-    command = ["uvicorn", "main:app", "--host", "127.0.0.1", "--port", "8000"]
+    if "--uvicorn" in sys.argv:
+        command = ["uvicorn", "main:app", "--host", "127.0.0.1", "--port", "8000"]
+    else:
+        # Preload-and-fork launcher: models load once in the master and are shared by the workers.
+        command = [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", "8000"]
 
     # Start the server as a background process
     try:
@@ -33,16 +39,25 @@ def main():
             children = parent_process.children(recursive=True)
             all_processes = [parent_process] + children
 
-            total_memory_bytes = 0
-            for proc in all_processes:
-                total_memory_bytes += proc.memory_info().rss
-
-            # Get memory usage in bytes and convert to megabytes
-            memory_mb = total_memory_bytes / (1024 * 1024)
+            mb = 1024 * 1024
+            total_rss = total_uss = total_pss = 0
 
             print("\n--- Memory Usage Report ---")
             print(f"Found {len(all_processes)} process(es) (1 parent, {len(children)} child/worker).")
-            print(f"✅ Backend is using approximately: {memory_mb:.2f} MB")
+            print(f"{'PID':>8} {'ROLE':>7} {'RSS MB':>10} {'UNIQUE MB':>10} {'SHARED MB':>10} {'PSS MB':>10}")
+            for proc in all_processes:
+                # uss: pages only this process maps; pss: its fair share of pages mapped by several processes.
+                mem = proc.memory_full_info()
+                role = "master" if proc.pid == parent_process.pid else "worker"
+                print(f"{proc.pid:>8} {role:>7} {mem.rss / mb:>10.2f} {mem.uss / mb:>10.2f} "
+                      f"{(mem.rss - mem.uss) / mb:>10.2f} {mem.pss / mb:>10.2f}")
+                total_rss += mem.rss
+                total_uss += mem.uss
+                total_pss += mem.pss
+
+            print(f"Sum of RSS (double-counts shared pages): {total_rss / mb:.2f} MB")
+            print(f"Sum of unique memory: {total_uss / mb:.2f} MB")
+            print(f"✅ Backend is using approximately: {total_pss / mb:.2f} MB (sum of PSS)")
             print("---------------------------\n")
 
         except psutil.NoSuchProcess:
@@ -0,0 +1,172 @@
+import argparse
+import gc
+import math
+import os
+import glob
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+
+def available_cores() -> int:
+    """CPUs this process may actually use: the affinity mask, capped by a cgroup v2 CPU quota."""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cores = min(cores, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+def plan_sizing(cores: int, workers: int = None):
+    """
+    Splits the available cores between web workers, their model process
+    pools and BLAS/OpenMP threads so that the total stays at about one
+    runnable thread of CPU-bound work per core.
+    """
+    workers = workers or cores
+    per_worker = max(1, cores // workers)
+    # A worker with spare cores hands pandas work to its own model processes;
+    # with one core each, the web workers themselves already fill the machine.
+    model_workers = per_worker - 1 if per_worker > 1 else 0
+    blas_threads = max(1, cores // (workers * max(1, model_workers + 1)))
+    # The AnyIO pool mostly waits on the DB and JWT lookups, so it can be wider than the core count.
+    anyio_threads = max(8, 4 * per_worker)
+    return {
+        "cores": cores,
+        "workers": workers,
+        "model_workers": model_workers,
+        "blas_threads": blas_threads,
+        "anyio_threads": anyio_threads,
+    }
+
+
+def _apply_sizing_env(sizing: dict):
+    # Must happen before numpy/pandas are imported; explicit settings in the environment win.
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS"):
+        os.environ.setdefault(var, str(sizing["blas_threads"]))
+    os.environ.setdefault("MODEL_WORKERS", str(sizing["model_workers"]))
+    os.environ.setdefault("ANYIO_THREAD_LIMIT", str(sizing["anyio_threads"]))
+    # Each worker reloads models on its own; the watcher is how a new artifact reaches all of them.
+    os.environ.setdefault("MODEL_WATCH_INTERVAL", "10")
+    # Workers share metrics through per-process snapshots in this directory.
+    os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), f"cts-metrics-{os.getpid()}"))
+
+
+def _clear_metrics_snapshots():
+    for path in glob.glob(os.path.join(os.environ["METRICS_DIR"], "*.json")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock: socket.socket, log_level: str):
+    import uvicorn
+    from app import database
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Pooled DB connections from the master must not be shared across processes.
+    database.engine.dispose(close=False)
+
+    config = uvicorn.Config(app, log_level=log_level, lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the models once, then fork API workers that share them.")
+    parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", 0)) or None,
+                        help="Number of forked API workers (default: one per available core).")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    sizing = plan_sizing(available_cores(), args.workers)
+    _apply_sizing_env(sizing)
+    print(f"Serving plan: {sizing}")
+
+    from threadpoolctl import threadpool_limits
+    import main as api
+
+    threadpool_limits(limits=int(os.environ["OMP_NUM_THREADS"]))
+
+    api.load_models()
+    # Move everything loaded so far out of the collector's reach, so GC passes in the
+    # workers don't touch (and thereby copy) the shared model pages.
+    gc.collect()
+    gc.freeze()
+
+    # Counts from a previous run must not leak into this one's totals.
+    _clear_metrics_snapshots()
+    sock = _bind_socket(args.host, args.port)
+    children = {}
+    shutting_down = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(api.app, sock, args.log_level)
+            finally:
+                os._exit(0)
+        children[pid] = time.monotonic()
+        print(f"Started worker process {pid}")
+
+    def stop(signum, frame):
+        nonlocal shutting_down
+        shutting_down = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for _ in range(sizing["workers"]):
+        spawn()
+    print(f"Master {os.getpid()} serving on http://{args.host}:{args.port} with {sizing['workers']} worker(s)")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = children.pop(pid, None)
+        if started is None or shutting_down:
+            continue
+        print(f"CRITICAL: Worker {pid} exited with status {status}, restarting it.")
+        if time.monotonic() - started < 1:
+            time.sleep(1)  # avoid a tight crash loop
+        spawn()
+
+    sock.close()
+    _clear_metrics_snapshots()
+    print("All workers stopped.")
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+    main()